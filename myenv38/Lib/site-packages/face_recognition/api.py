@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import threading
+import time
+
 import PIL.Image
 import dlib
 import numpy as np
@@ -14,19 +17,94 @@ except Exception:
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
-face_detector = dlib.get_frontal_face_detector()
-
 predictor_68_point_model = face_recognition_models.pose_predictor_model_location()
-pose_predictor_68_point = dlib.shape_predictor(predictor_68_point_model)
-
 predictor_5_point_model = face_recognition_models.pose_predictor_five_point_model_location()
-pose_predictor_5_point = dlib.shape_predictor(predictor_5_point_model)
-
 cnn_face_detection_model = face_recognition_models.cnn_face_detector_model_location()
-cnn_face_detector = dlib.cnn_face_detection_model_v1(cnn_face_detection_model)
-
 face_recognition_model = face_recognition_models.face_recognition_model_location()
-face_encoder = dlib.face_recognition_model_v1(face_recognition_model)
+
+# Models are loaded on first use (or with load_models), so importing this module is cheap and
+# programs only pay for the models they actually use. They are still reachable as module
+# attributes (face_recognition.api.face_encoder etc.) through __getattr__ below.
+_model_loaders = {
+    "face_detector": lambda: dlib.get_frontal_face_detector(),
+    "pose_predictor_68_point": lambda: dlib.shape_predictor(predictor_68_point_model),
+    "pose_predictor_5_point": lambda: dlib.shape_predictor(predictor_5_point_model),
+    "cnn_face_detector": lambda: dlib.cnn_face_detection_model_v1(cnn_face_detection_model),
+    "face_encoder": lambda: dlib.face_recognition_model_v1(face_recognition_model),
+}
+_models = {}
+_models_lock = threading.Lock()
+
+# Optional stage timing: a callback(stage, seconds) called after each dlib call ("model_load",
+# "face_detector", "landmarks", "face_encoder"). Costs one global lookup per call when unset.
+_stage_timer = None
+
+
+def set_stage_timer(callback):
+    """
+    Register a function to be called with (stage, seconds) after each dlib stage.
+
+    :param callback: A callable, or None to stop timing
+    """
+    global _stage_timer
+    _stage_timer = callback
+
+
+class _timed(object):
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter() if _stage_timer is not None else None
+
+    def __exit__(self, *exc_info):
+        if self.start is not None and _stage_timer is not None:
+            _stage_timer(self.stage, time.perf_counter() - self.start)
+
+
+def _model(name):
+    """
+    Return a dlib model, loading it the first time it is needed.
+
+    :param name: One of the keys of _model_loaders
+    :return: the loaded dlib model object
+    """
+    model = _models.get(name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(name)
+            if model is None:
+                with _timed("model_load"):
+                    model = _models[name] = _model_loaders[name]()
+    return model
+
+
+def load_models(names=None):
+    """
+    Load dlib models now instead of on first use (e.g. during a server warm-up phase).
+
+    :param names: Optional - which models to load: any of "face_detector", "pose_predictor_68_point",
+                  "pose_predictor_5_point", "cnn_face_detector" and "face_encoder". The default is all of them.
+    :return: A list with the names of every model loaded so far
+    """
+    for name in (names if names is not None else _model_loaders):
+        _model(name)
+    return loaded_models()
+
+
+def loaded_models():
+    """
+    :return: A list with the names of the models that are already loaded
+    """
+    return sorted(_models)
+
+
+def __getattr__(name):
+    if name in _model_loaders:
+        return _model(name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 def _rect_to_css(rect):
@@ -99,10 +177,9 @@ def _raw_face_locations(img, number_of_times_to_upsample=1, model="hog"):
                   deep-learning model which is GPU/CUDA accelerated (if available). The default is "hog".
     :return: A list of dlib 'rect' objects of found face locations
     """
-    if model == "cnn":
-        return cnn_face_detector(img, number_of_times_to_upsample)
-    else:
-        return face_detector(img, number_of_times_to_upsample)
+    detector = _model("cnn_face_detector" if model == "cnn" else "face_detector")
+    with _timed("face_detector"):
+        return detector(img, number_of_times_to_upsample)
 
 
 def face_locations(img, number_of_times_to_upsample=1, model="hog"):
@@ -129,7 +206,9 @@ def _raw_face_locations_batched(images, number_of_times_to_upsample=1, batch_siz
     :param number_of_times_to_upsample: How many times to upsample the image looking for faces. Higher numbers find smaller faces.
     :return: A list of dlib 'rect' objects of found face locations
     """
-    return cnn_face_detector(images, number_of_times_to_upsample, batch_size=batch_size)
+    detector = _model("cnn_face_detector")
+    with _timed("face_detector"):
+        return detector(images, number_of_times_to_upsample, batch_size=batch_size)
 
 
 def batch_face_locations(images, number_of_times_to_upsample=1, batch_size=128):
@@ -157,12 +236,13 @@ def _raw_face_landmarks(face_image, face_locations=None, model="large"):
     else:
         face_locations = [_css_to_rect(face_location) for face_location in face_locations]
 
-    pose_predictor = pose_predictor_68_point
-
     if model == "small":
-        pose_predictor = pose_predictor_5_point
+        pose_predictor = _model("pose_predictor_5_point")
+    else:
+        pose_predictor = _model("pose_predictor_68_point")
 
-    return [pose_predictor(face_image, face_location) for face_location in face_locations]
+    with _timed("landmarks"):
+        return [pose_predictor(face_image, face_location) for face_location in face_locations]
 
 
 def face_landmarks(face_image, face_locations=None, model="large"):
@@ -211,7 +291,77 @@ def face_encodings(face_image, known_face_locations=None, num_jitters=1, model="
     :return: A list of 128-dimensional face encodings (one for each face in the image)
     """
     raw_landmarks = _raw_face_landmarks(face_image, known_face_locations, model)
-    return [np.array(face_encoder.compute_face_descriptor(face_image, raw_landmark_set, num_jitters)) for raw_landmark_set in raw_landmarks]
+    face_encoder = _model("face_encoder")
+    with _timed("face_encoder"):
+        return [np.array(face_encoder.compute_face_descriptor(face_image, raw_landmark_set, num_jitters)) for raw_landmark_set in raw_landmarks]
+
+
+def _face_descriptors_into(out, descriptors):
+    """
+    Copy a list of dlib descriptor vectors into consecutive rows of a preallocated array.
+    """
+    for i, descriptor in enumerate(descriptors):
+        out[i] = descriptor
+
+
+def face_encodings_batch(face_image, known_face_locations=None, num_jitters=1, model="small"):
+    """
+    Given an image, return the 128-dimension face encoding for each face in the image as a single array.
+
+    Unlike face_encodings, all faces are passed to the dlib face descriptor in one call.
+
+    :param face_image: The image that contains one or more faces
+    :param known_face_locations: Optional - the bounding boxes of each face if you already know them.
+    :param num_jitters: How many times to re-sample the face when calculating encoding. Higher is more accurate, but slower (i.e. 100 is 100x slower)
+    :param model: Optional - which model to use. "large" or "small" (default) which only returns 5 points but is faster.
+    :return: A (number of faces, 128) float32 numpy array with one face encoding per row
+    """
+    shapes = dlib.full_object_detections()
+    for raw_landmark_set in _raw_face_landmarks(face_image, known_face_locations, model):
+        shapes.append(raw_landmark_set)
+
+    encodings = np.empty((len(shapes), 128), dtype=np.float32)
+    if len(shapes):
+        face_encoder = _model("face_encoder")
+        with _timed("face_encoder"):
+            _face_descriptors_into(encodings, face_encoder.compute_face_descriptor(face_image, shapes, num_jitters))
+    return encodings
+
+
+def batch_face_encodings(face_images, known_face_locations=None, num_jitters=1, model="small"):
+    """
+    Given a list of images, return the 128-dimension face encodings of the faces in each image.
+
+    All faces of all images are passed to the dlib face descriptor in one call and written to one
+    preallocated float32 array.
+
+    :param face_images: A list of images (each as a numpy array)
+    :param known_face_locations: Optional - a list with the bounding boxes of the faces of each image.
+    :param num_jitters: How many times to re-sample the face when calculating encoding. Higher is more accurate, but slower (i.e. 100 is 100x slower)
+    :param model: Optional - which model to use. "large" or "small" (default) which only returns 5 points but is faster.
+    :return: A list with one (number of faces, 128) float32 array per image. The arrays are views into a
+             single (total number of faces, 128) array.
+    """
+    if len(face_images) == 0:
+        return []
+    if known_face_locations is None:
+        known_face_locations = [None] * len(face_images)
+
+    batch_shapes = []
+    for face_image, face_locations in zip(face_images, known_face_locations):
+        shapes = dlib.full_object_detections()
+        for raw_landmark_set in _raw_face_landmarks(face_image, face_locations, model):
+            shapes.append(raw_landmark_set)
+        batch_shapes.append(shapes)
+
+    counts = [len(shapes) for shapes in batch_shapes]
+    encodings = np.empty((sum(counts), 128), dtype=np.float32)
+    if len(encodings):
+        face_encoder = _model("face_encoder")
+        with _timed("face_encoder"):
+            descriptors = face_encoder.compute_face_descriptor(list(face_images), batch_shapes, num_jitters)
+            _face_descriptors_into(encodings, (d for image_descriptors in descriptors for d in image_descriptors))
+    return np.split(encodings, np.cumsum(counts)[:-1])
 
 
 def compare_faces(known_face_encodings, face_encoding_to_check, tolerance=0.6):
@@ -18,7 +18,7 @@ def scan_known_people(known_people_folder):
     for file in image_files_in_folder(known_people_folder):
         basename = os.path.splitext(os.path.basename(file))[0]
         img = face_recognition.load_image_file(file)
-        encodings = face_recognition.face_encodings(img)
+        encodings = face_recognition.face_encodings_batch(img)
 
         if len(encodings) > 1:
             click.echo("WARNING: More than one face found in {}. Only considering the first face.".format(file))
@@ -48,7 +48,7 @@ def test_image(image_to_check, known_names, known_face_encodings, tolerance=0.6,
         pil_img.thumbnail((1600, 1600), PIL.Image.LANCZOS)
         unknown_image = np.array(pil_img)
 
-    unknown_encodings = face_recognition.face_encodings(unknown_image)
+    unknown_encodings = face_recognition.face_encodings_batch(unknown_image)
 
     for unknown_encoding in unknown_encodings:
         distances = face_recognition.face_distance(known_face_encodings, unknown_encoding)
@@ -59,7 +59,7 @@ def test_image(image_to_check, known_names, known_face_encodings, tolerance=0.6,
         else:
             print_result(image_to_check, "unknown_person", None, show_distance)
 
-    if not unknown_encodings:
+    if len(unknown_encodings) == 0:
         # print out fact that no faces were found in image
         print_result(image_to_check, "no_persons_found", None, show_distance)
 
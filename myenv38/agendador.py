@@ -0,0 +1,104 @@
+# ==================== MICRO-LOTES DE BUSCA NA GALERIA ====================
+# Na troca de turno dezenas de quiosques mandam /checkin no mesmo segundo e
+# cada requisição faria sua própria passada sobre a galeria. Aqui os encodings
+# que chegam juntos são agrupados: uma thread espera até 'janela_ms' (ou até
+# juntar 'max_lote' encodings), faz uma única conta (lote x galeria) com
+# matcher.buscar_lote e devolve a cada requisição o seu resultado.
+#
+# O custo para uma requisição sozinha é no máximo a janela (alguns ms); com
+# carga, a galeria é lida uma vez por lote em vez de uma vez por requisição.
+
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class AgendadorLote:
+    """Agrupa buscas concorrentes na galeria em lotes"""
+
+    def __init__(self, matcher, janela_ms=2.0, max_lote=32, amostras=1000):
+        self.matcher = matcher
+        self.janela = janela_ms / 1000
+        self.max_lote = max_lote
+        self.amostras = amostras
+        self._iniciar()
+        if hasattr(os, 'register_at_fork'):
+            # Depois de um fork (servidor.py) o filho precisa da sua própria thread
+            os.register_at_fork(after_in_child=self._iniciar)
+
+    def _iniciar(self):
+        self._fila = queue.Queue()
+        self._lock = threading.Lock()
+        self._tamanhos = Counter()                   # tamanho do lote -> quantos lotes
+        self._esperas = deque(maxlen=self.amostras)  # segundos entre chegar na fila e entrar em um lote
+        self._thread = threading.Thread(target=self._executar, name="agendador-lotes", daemon=True)
+        self._thread.start()
+
+    def buscar(self, snapshot, encodings):
+        """Busca um ou mais encodings (k x 128) e espera: lista de ResultadoBusca"""
+        futuros = []
+        for encoding in np.asarray(encodings, dtype=np.float32).reshape(-1, 128):
+            futuro = Future()
+            self._fila.put((snapshot, encoding, futuro, time.perf_counter()))
+            futuros.append(futuro)
+        return [f.result() for f in futuros]
+
+    def _coletar_lote(self):
+        """Bloqueia até o primeiro item e junta os que chegarem dentro da janela"""
+        lote = [self._fila.get()]
+        limite = time.perf_counter() + self.janela
+        while len(lote) < self.max_lote:
+            restante = limite - time.perf_counter()
+            try:
+                lote.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _executar(self):
+        while True:
+            lote = self._coletar_lote()
+            agora = time.perf_counter()
+            with self._lock:
+                self._tamanhos[len(lote)] += 1
+                self._esperas.extend(agora - chegada for _, _, _, chegada in lote)
+
+            # Requisições de um mesmo lote podem ter visto versões diferentes da galeria
+            por_snapshot = {}
+            for item in lote:
+                por_snapshot.setdefault(id(item[0]), []).append(item)
+            for itens in por_snapshot.values():
+                snapshot = itens[0][0]
+                try:
+                    resultados = self.matcher.buscar_lote(snapshot, np.stack([e for _, e, _, _ in itens]))
+                except Exception as e:
+                    for _, _, futuro, _ in itens:
+                        futuro.set_exception(e)
+                    continue
+                for (_, _, futuro, _), resultado in zip(itens, resultados):
+                    futuro.set_result(resultado)
+
+    def estatisticas(self):
+        """Distribuição do tamanho dos lotes e atraso de fila (ms)"""
+        with self._lock:
+            tamanhos = dict(sorted(self._tamanhos.items()))
+            esperas = sorted(self._esperas)
+
+        def percentil(p):
+            if not esperas:
+                return 0.0
+            return round(1000 * esperas[min(len(esperas) - 1, int(p * len(esperas)))], 3)
+
+        return {
+            "janela_ms": self.janela * 1000,
+            "max_lote": self.max_lote,
+            "lotes": sum(tamanhos.values()),
+            "tamanho_lotes": tamanhos,
+            "espera_ms": {"p50": percentil(0.5), "p99": percentil(0.99),
+                          "max": round(1000 * esperas[-1], 3) if esperas else 0.0},
+        }
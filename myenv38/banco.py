@@ -0,0 +1,348 @@
+# ==================== BANCO DE ROSTOS (SQLITE) ====================
+# Persistência dos usuários no faces.db, no lugar de um .pkl por usuário.
+#
+# - Modo WAL: leitores não bloqueiam o escritor (nem o contrário).
+# - Encodings gravados como BLOB float32 cru (128 * 4 = 512 bytes).
+# - A galeria inteira é carregada com um único SELECT direto para um buffer NumPy.
+# - Cadastro e remoção são transações curtas (BEGIN IMMEDIATE ... COMMIT).
+# - Toda mudança também entra no 'journal' (append-only, com número de sequência
+#   crescente), para que outros processos apliquem só o que mudou.
+
+import os
+import pickle
+import sqlite3
+import threading
+
+import numpy as np
+
+from galeria import DIMENSAO
+
+# Versão do schema guardada em PRAGMA user_version
+# 0 -> tabela 'usuarios' original
+# 1 -> coluna 'arquivo' (ID público usado pela API) + migração dos .pkl
+# 2 -> tabela 'configuracao' (chave/valor), ex.: precisão da galeria em memória
+# 3 -> tabela 'journal' com as mudanças da galeria
+# 4 -> índice de listagem (nome, id, data_cadastro, arquivo): lista usuários sem ler os encodings
+VERSAO_SCHEMA = 4
+
+# Máximo de '?' por consulta (o SQLite antigo limita a 999 parâmetros)
+LOTE_PARAMETROS = 500
+
+
+class BancoRostos:
+    """Motor de armazenamento dos rostos sobre SQLite"""
+
+    def __init__(self, db_path="faces.db", encodings_dir=None):
+        self.db_path = db_path
+        self._local = threading.local()  # uma conexão por thread
+        self._herdadas = []
+        self._atualizar_schema(encodings_dir)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._apos_fork)
+
+    def _apos_fork(self):
+        # Conexões SQLite não podem atravessar um fork: o filho abre as suas.
+        # As herdadas ficam referenciadas (nunca usadas nem fechadas aqui) para
+        # que fechá-las no filho não mexa nas travas e no WAL do processo pai.
+        self._herdadas.append(self._local)
+        self._local = threading.local()
+
+    # ---------- conexão ----------
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: nós controlamos as transações explicitamente
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # seguro em WAL, bem mais rápido que FULL
+            self._local.conn = conn
+        return conn
+
+    def _transacao(self):
+        return _Transacao(self._conexao())
+
+    def lock_escrita(self):
+        """
+        Transação de escrita usada como mutex entre processos (ex.: para publicar
+        o snapshot da galeria). Leituras feitas dentro dela, na mesma thread,
+        enxergam um estado consistente do banco.
+        """
+        return self._transacao()
+
+    # ---------- schema ----------
+
+    def _atualizar_schema(self, encodings_dir):
+        with self._transacao() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usuarios (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome TEXT NOT NULL,
+                    encoding BLOB NOT NULL,
+                    foto_path TEXT,
+                    data_cadastro TEXT
+                )
+            """)
+            versao = conn.execute("PRAGMA user_version").fetchone()[0]
+            if versao < 1:
+                colunas = [c[1] for c in conn.execute("PRAGMA table_info(usuarios)")]
+                if 'arquivo' not in colunas:
+                    conn.execute("ALTER TABLE usuarios ADD COLUMN arquivo TEXT")
+                conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_usuarios_arquivo ON usuarios(arquivo)")
+                if encodings_dir:
+                    migrados = self._migrar_pickles(conn, encodings_dir)
+                    print(f"✓ Migração: {migrados} encodings .pkl importados para {self.db_path}")
+            if versao < 2:
+                conn.execute("CREATE TABLE IF NOT EXISTS configuracao (chave TEXT PRIMARY KEY, valor TEXT)")
+            if versao < 3:
+                # 'journal_base' = maior seq já compactada; quem viu menos que isso recarrega tudo
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS journal (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        operacao TEXT NOT NULL,
+                        arquivo TEXT NOT NULL,
+                        nome TEXT,
+                        data_cadastro TEXT,
+                        encoding BLOB
+                    )
+                """)
+            if versao < 4:
+                # Índice "de cobertura": o /users é respondido só com ele, sem tocar nos BLOBs
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_listagem "
+                             "ON usuarios(nome, id, data_cadastro, arquivo)")
+            conn.execute(f"PRAGMA user_version = {VERSAO_SCHEMA}")
+
+    def _migrar_pickles(self, conn, encodings_dir):
+        """Importa (uma única vez) os arquivos encodings/*.pkl do formato antigo"""
+        if not os.path.isdir(encodings_dir):
+            return 0
+
+        fotos_dir = os.path.join(os.path.dirname(encodings_dir), "fotos")
+        migrados = 0
+        for filename in sorted(os.listdir(encodings_dir)):
+            if not filename.endswith('.pkl'):
+                continue
+            filepath = os.path.join(encodings_dir, filename)
+            try:
+                with open(filepath, 'rb') as f:
+                    data = pickle.load(f)
+            except Exception as e:
+                print(f"⚠️  Erro ao migrar {filename}: {e}")
+                continue
+
+            foto_path = os.path.join(fotos_dir, filename.replace('.pkl', '.jpg'))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO usuarios (nome, encoding, foto_path, data_cadastro, arquivo) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (data['nome'], _para_blob(data['encoding']),
+                 foto_path if os.path.exists(foto_path) else None,
+                 data.get('data_cadastro', 'N/A'), filename)
+            )
+            migrados += cursor.rowcount
+        return migrados
+
+    # ---------- escrita ----------
+
+    def inserir(self, nome, encoding, foto_path, data_cadastro, arquivo):
+        """Grava um usuário (e a entrada no journal) e retorna o id gerado"""
+        blob = _para_blob(encoding)
+        with self._transacao() as conn:
+            cursor = conn.execute(
+                "INSERT INTO usuarios (nome, encoding, foto_path, data_cadastro, arquivo) VALUES (?, ?, ?, ?, ?)",
+                (nome, blob, foto_path, data_cadastro, arquivo)
+            )
+            conn.execute(
+                "INSERT INTO journal (operacao, arquivo, nome, data_cadastro, encoding) VALUES ('adicionar', ?, ?, ?, ?)",
+                (arquivo, nome, data_cadastro, blob)
+            )
+            return cursor.lastrowid
+
+    def remover(self, arquivo):
+        """
+        Apaga um usuário pelo ID público ('arquivo').
+        Retorna o foto_path do usuário apagado ('' se não tinha foto) ou None se não existia.
+        """
+        with self._transacao() as conn:
+            row = conn.execute("SELECT foto_path FROM usuarios WHERE arquivo = ?", (arquivo,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM usuarios WHERE arquivo = ?", (arquivo,))
+            conn.execute("INSERT INTO journal (operacao, arquivo) VALUES ('remover', ?)", (arquivo,))
+            return row[0] or ''
+
+    def compactar_journal(self, manter=10000):
+        """
+        Descarta as entradas antigas do journal (a tabela 'usuarios' já é a base
+        com tudo aplicado), mantendo as 'manter' mais recentes. Só faz algo
+        quando o journal passou de 2 * manter entradas. Retorna quantas apagou.
+        """
+        base = int(self.configuracao('journal_base', '0'))
+        ultimo = self.ultimo_seq()
+        if ultimo - base <= 2 * manter:
+            return 0
+        nova_base = ultimo - manter
+        with self._transacao() as conn:
+            apagadas = conn.execute("DELETE FROM journal WHERE seq <= ?", (nova_base,)).rowcount
+            conn.execute("INSERT OR REPLACE INTO configuracao (chave, valor) VALUES ('journal_base', ?)",
+                         (str(nova_base),))
+        print(f"✓ Journal compactado: {apagadas} entradas até seq {nova_base}")
+        return apagadas
+
+    # ---------- leitura ----------
+
+    def carregar_galeria(self, com_ids=False):
+        """
+        Carrega todos os usuários com um único SELECT.
+        Retorna (matriz N x 128 float32, tupla de metadados) e, se com_ids=True,
+        também o vetor int64 com o id de cada linha.
+        """
+        rows = self._conexao().execute(
+            "SELECT id, nome, data_cadastro, arquivo, encoding FROM usuarios ORDER BY id"
+        ).fetchall()
+
+        matriz = np.frombuffer(b''.join(r[4] for r in rows), dtype=np.float32).reshape(-1, DIMENSAO)
+        metadados = tuple(
+            {'nome': r[1], 'data_cadastro': r[2] or 'N/A', 'arquivo': r[3]} for r in rows
+        )
+        if com_ids:
+            return matriz, metadados, np.array([r[0] for r in rows], dtype=np.int64)
+        return matriz, metadados
+
+
+    def carregar_galeria_com_seq(self):
+        """
+        Como carregar_galeria(), mas dentro de uma transação de leitura, junto com
+        a última seq do journal: a galeria devolvida é exatamente o estado até ela.
+        Retorna (matriz, metadados, seq).
+        """
+        conn = self._conexao()
+        conn.execute("BEGIN")
+        try:
+            seq = self.ultimo_seq()
+            matriz, metadados = self.carregar_galeria()
+        finally:
+            conn.execute("COMMIT")
+        return matriz, metadados, seq
+
+    def ultimo_seq(self):
+        """Maior número de sequência do journal (0 se vazio)"""
+        row = self._conexao().execute("SELECT MAX(seq) FROM journal").fetchone()
+        return row[0] or 0
+
+    def mudancas_desde(self, seq):
+        """
+        Entradas do journal com seq maior que 'seq', em ordem:
+        lista de (seq, operacao, arquivo, nome, data_cadastro, encoding float32 ou None).
+        Retorna None se parte delas já foi compactada (é preciso recarregar tudo).
+        A base e as entradas são lidas na mesma transação de leitura: uma
+        compactação em outro processo não apaga nada entre as duas leituras.
+        """
+        conn = self._conexao()
+        conn.execute("BEGIN")
+        try:
+            if seq < int(self.configuracao('journal_base', '0')):
+                return None
+            rows = conn.execute(
+                "SELECT seq, operacao, arquivo, nome, data_cadastro, encoding FROM journal WHERE seq > ? ORDER BY seq",
+                (seq,)
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return [
+            (r[0], r[1], r[2], r[3], r[4], None if r[5] is None else np.frombuffer(r[5], dtype=np.float32))
+            for r in rows
+        ]
+
+    def listar_usuarios(self, limite=None, apos=None, prefixo=None):
+        """
+        Lista só os metadados, em ordem de (nome, id), pelo índice de listagem.
+        'apos' = (nome, id) do último item da página anterior (paginação por chave).
+        'prefixo' filtra pelo começo do nome.
+        Retorna (lista de dicts, (nome, id) do último item ou None se não há mais páginas).
+        """
+        condicoes, parametros = [], []
+        if prefixo:
+            # Faixa [prefixo, prefixo com o último caractere incrementado): usa o índice.
+            # U+10FFFF não tem sucessor: sai do fim e incrementa o caractere anterior
+            # (sem nenhum para incrementar, a faixa fica aberta em cima)
+            condicoes.append("nome >= ?")
+            parametros.append(prefixo)
+            base = prefixo.rstrip(chr(0x10FFFF))
+            if base:
+                condicoes.append("nome < ?")
+                parametros.append(base[:-1] + chr(ord(base[-1]) + 1))
+        if apos is not None:
+            condicoes.append("(nome > ? OR (nome = ? AND id > ?))")
+            parametros += [apos[0], apos[0], apos[1]]
+
+        sql = "SELECT nome, id, data_cadastro, arquivo FROM usuarios INDEXED BY idx_usuarios_listagem"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        sql += " ORDER BY nome, id"
+        if limite is not None:
+            sql += " LIMIT ?"
+            parametros.append(limite + 1)  # um a mais para saber se existe próxima página
+
+        rows = self._conexao().execute(sql, parametros).fetchall()
+        proximo = None
+        if limite is not None and len(rows) > limite:
+            rows = rows[:limite]
+            proximo = (rows[-1][0], rows[-1][1])
+        usuarios = [{'nome': r[0], 'data_cadastro': r[2] or 'N/A', 'arquivo': r[3]} for r in rows]
+        return usuarios, proximo
+
+    def carregar_encodings(self, arquivos):
+        """
+        Encodings float32 exatos dos usuários pedidos, na mesma ordem (N x 128).
+        Um usuário removido depois do snapshot de quem chamou (ex.: /users/delete
+        concorrente com um /checkin) volta como uma linha de +inf: a distância
+        até ele é infinita e ele nunca é escolhido.
+        """
+        arquivos = list(arquivos)
+        saida = np.full((len(arquivos), DIMENSAO), np.inf, dtype=np.float32)
+        rows = {}
+        for inicio in range(0, len(arquivos), LOTE_PARAMETROS):
+            parte = arquivos[inicio:inicio + LOTE_PARAMETROS]
+            marcadores = ",".join("?" * len(parte))
+            rows.update(self._conexao().execute(
+                f"SELECT arquivo, encoding FROM usuarios WHERE arquivo IN ({marcadores})", parte
+            ).fetchall())
+        for i, arquivo in enumerate(arquivos):
+            blob = rows.get(arquivo)
+            if blob is not None:
+                saida[i] = np.frombuffer(blob, dtype=np.float32)
+        return saida
+
+    def configuracao(self, chave, padrao=None):
+        """Lê um valor da tabela 'configuracao'"""
+        row = self._conexao().execute("SELECT valor FROM configuracao WHERE chave = ?", (chave,)).fetchone()
+        return row[0] if row else padrao
+
+    def definir_configuracao(self, chave, valor):
+        """Grava um valor na tabela 'configuracao'"""
+        with self._transacao() as conn:
+            conn.execute("INSERT OR REPLACE INTO configuracao (chave, valor) VALUES (?, ?)", (chave, valor))
+
+    def resumo(self):
+        """Retorna (quantidade de usuários, maior id) — barato, usado para detectar mudanças"""
+        total, maior_id = self._conexao().execute("SELECT COUNT(*), MAX(id) FROM usuarios").fetchone()
+        return total, maior_id or 0
+
+
+class _Transacao:
+    """Context manager de uma transação curta de escrita (BEGIN IMMEDIATE)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _para_blob(encoding):
+    return np.asarray(encoding, dtype=np.float32).tobytes()
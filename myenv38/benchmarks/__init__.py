@@ -0,0 +1,21 @@
+# ==================== BENCHMARKS DOS CAMINHOS QUENTES ====================
+# Mede o impacto de uma mudança no cadastro e no check-in, sem rede (galerias e
+# fotos geradas localmente; os endpoints usam as fotos de face-models/fotos):
+#   galeria    carga da galeria: pasta de .pkl (formato antigo), faces.db, .npy
+#              (+ metadados em .pkl) e snapshot mapeado, de 1 mil a 1 milhão de encodings
+#   busca      vazão e latência (p50/p95/p99) do matcher, uma consulta por vez e em lotes
+#   imagens    decodificação (completa x reduzida) e detecção em fotos geradas
+#   endpoints  /checkin, /register e /users pelo test client do Flask, com N threads
+#
+# Os resultados vão para um JSON; com --baseline, cada métrica é comparada com
+# uma execução anterior e as regressões acima da tolerância são apontadas.
+#
+# Uso (dentro de myenv38):
+#   python -m benchmarks --saida resultados.json
+#   python -m benchmarks galeria busca --tamanhos 1000 100000 1000000
+#   python -m benchmarks endpoints --concorrencia 1 4 16 --baseline base.json
+#
+# Convenção dos nomes: métricas terminadas em '_ms' (ou '_mb') são melhores
+# quando menores, as terminadas em '_por_s' quando maiores.
+
+SECOES = ('galeria', 'busca', 'imagens', 'endpoints')
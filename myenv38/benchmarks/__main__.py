@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks import SECOES, comparar, dados
+
+
+def _ambiente():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'data': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'commit': commit,
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'plataforma': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def _main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmarks do cadastro e do check-in (offline)")
+    parser.add_argument('secoes', nargs='*', choices=SECOES, help="seções a rodar (padrão: todas)")
+    parser.add_argument('--saida', default=None, help="arquivo JSON com os resultados")
+    parser.add_argument('--baseline', default=None, help="JSON de uma execução anterior para comparar")
+    parser.add_argument('--tolerancia', type=float, default=0.10, help="diferença relativa tolerada (0.10 = 10%%)")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help="tamanhos das galerias sintéticas")
+    parser.add_argument('--max-pickle', type=int, default=100000,
+                        help="maior galeria testada como pasta de .pkl (um arquivo por rosto)")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--consultas', type=int, default=300)
+    parser.add_argument('--lotes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--fotos', default=None, help="pasta com fotos locais (padrão: sintéticas em imagens, face-models/fotos em endpoints)")
+    parser.add_argument('--concorrencia', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requisicoes', type=int, default=200)
+    parser.add_argument('--galeria-endpoints', type=int, default=10000,
+                        help="rostos no faces.db sintético usado pelos endpoints")
+    args = parser.parse_args()
+
+    secoes = args.secoes or SECOES
+    fotos = dados.fotos_da_pasta(args.fotos) if args.fotos else None
+    resultados = {}
+    for secao in secoes:
+        print(f"== {secao} ==")
+        if secao == 'galeria':
+            from benchmarks import galeria
+            resultados[secao] = galeria.benchmark(args.tamanhos, args.repeticoes, args.max_pickle)
+        elif secao == 'busca':
+            from benchmarks import busca
+            resultados[secao] = busca.benchmark(args.tamanhos, args.consultas, args.lotes)
+        elif secao == 'imagens':
+            from benchmarks import imagens
+            resultados[secao] = imagens.benchmark(args.repeticoes, fotos=fotos)
+        elif secao == 'endpoints':
+            from benchmarks import endpoints
+            resultados[secao] = endpoints.benchmark(args.concorrencia, args.requisicoes,
+                                                    args.galeria_endpoints, fotos=fotos)
+
+    relatorio = {'ambiente': _ambiente(), 'parametros': vars(args), 'resultados': resultados}
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto + "\n")
+        print(f"✓ Resultados salvos em {args.saida}")
+    else:
+        print(texto)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            base = json.load(f)['resultados']
+        diferencas = comparar.comparar(resultados, base, args.tolerancia)
+        comparar.imprimir(diferencas, args.tolerancia)
+        if any(d['regressao'] for d in diferencas):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,42 @@
+# ==================== VAZÃO E LATÊNCIA DO MATCHER ====================
+# Para cada tamanho de galeria e precisão, mede o MatcherExato do /checkin:
+#   lote=1   uma consulta por vez (matcher.buscar), com p50/p95/p99 por consulta
+#   lote=k   k consultas por chamada (matcher.buscar_lote, como nos micro-lotes),
+#            com a latência de cada chamada
+# 'consultas_por_s' permite comparar os dois modos diretamente.
+
+from benchmarks import dados
+
+
+def benchmark(tamanhos, n_consultas=300, lotes=(1, 8, 32), precisoes=('float32', 'int8')):
+    from galeria import GaleriaMemoria
+    from matcher import MatcherExato
+
+    linhas = []
+    for n in tamanhos:
+        matriz, metadados = dados.galeria(n)
+        consultas = dados.consultas(matriz, n_consultas)
+        linha_de = {m['arquivo']: i for i, m in enumerate(metadados)}
+
+        def fonte_exata(arquivos):
+            return matriz[[linha_de[a] for a in arquivos]]
+
+        for precisao in precisoes:
+            memoria = GaleriaMemoria(precisao=precisao)
+            memoria.carregar_matriz(matriz, metadados)
+            snapshot = memoria.snapshot()
+            matcher = MatcherExato(k=5, fonte_exata=fonte_exata)
+            matcher.buscar(snapshot, consultas[0])  # aquecimento (caches, BLAS)
+
+            for lote in lotes:
+                grupos = [consultas[i:i + lote] for i in range(0, len(consultas), lote)]
+                if lote == 1:
+                    chamadas = [lambda g=g: matcher.buscar(snapshot, g[0]) for g in grupos]
+                else:
+                    chamadas = [lambda g=g: matcher.buscar_lote(snapshot, g) for g in grupos]
+                tempos = [dados.cronometrar(chamada)[1][0] for chamada in chamadas]
+                linhas.append(dict({'tamanho': n, 'precisao': precisao, 'lote': lote,
+                                    'consultas_por_s': round(len(consultas) / sum(tempos), 2)},
+                                   **dados.percentis(tempos)))
+        print(f"  busca {n}: ok")
+    return linhas
@@ -0,0 +1,60 @@
+# ==================== COMPARAÇÃO COM UMA EXECUÇÃO ANTERIOR ====================
+# As linhas de cada seção são casadas pelas colunas que as identificam (ex.:
+# tamanho + formato) e cada métrica vira uma razão novo/base.
+
+# Colunas que identificam uma linha em cada seção
+CHAVES = {
+    'galeria': ('tamanho', 'formato'),
+    'busca': ('tamanho', 'precisao', 'lote'),
+    'imagens': ('imagem',),
+    'endpoints': ('endpoint', 'concorrencia'),
+}
+
+
+def _menor_melhor(metrica):
+    if metrica.endswith(('_ms', '_mb')):
+        return True
+    if metrica.endswith('_por_s'):
+        return False
+    return None  # não é métrica de desempenho
+
+
+def comparar(resultados, base, tolerancia=0.10):
+    """
+    Lista de diferenças acima da tolerância (fração), com
+    {'secao', 'linha', 'metrica', 'base', 'novo', 'razao', 'regressao'}.
+    """
+    diferencas = []
+    for secao, linhas in resultados.items():
+        chaves = CHAVES.get(secao, ())
+        anteriores = {tuple(l.get(c) for c in chaves): l for l in base.get(secao, [])}
+        for linha in linhas:
+            identificacao = tuple(linha.get(c) for c in chaves)
+            anterior = anteriores.get(identificacao)
+            if anterior is None:
+                continue
+            for metrica, novo in linha.items():
+                menor_melhor = _menor_melhor(metrica)
+                antigo = anterior.get(metrica)
+                if menor_melhor is None or not isinstance(antigo, (int, float)) or not antigo:
+                    continue
+                razao = novo / antigo
+                piorou = razao > 1 + tolerancia if menor_melhor else razao < 1 - tolerancia
+                melhorou = razao < 1 - tolerancia if menor_melhor else razao > 1 + tolerancia
+                if piorou or melhorou:
+                    diferencas.append({'secao': secao, 'linha': dict(zip(chaves, identificacao)),
+                                       'metrica': metrica, 'base': antigo, 'novo': novo,
+                                       'razao': round(razao, 3), 'regressao': piorou})
+    return diferencas
+
+
+def imprimir(diferencas, tolerancia):
+    if not diferencas:
+        print(f"✓ Nenhuma diferença acima de {tolerancia:.0%} em relação à base")
+        return
+    for d in diferencas:
+        linha = ", ".join(f"{k}={v}" for k, v in d['linha'].items())
+        marca = "❌" if d['regressao'] else "✓"
+        print(f"{marca} {d['secao']} [{linha}] {d['metrica']}: {d['base']} -> {d['novo']} (x{d['razao']})")
+    regressoes = sum(d['regressao'] for d in diferencas)
+    print(f"{regressoes} regressão(ões), {len(diferencas) - regressoes} melhora(s) acima de {tolerancia:.0%}")
@@ -0,0 +1,110 @@
+# ==================== DADOS SINTÉTICOS DOS BENCHMARKS ====================
+# Galerias, consultas e fotos geradas com seed fixa: duas execuções na mesma
+# máquina medem exatamente o mesmo trabalho.
+
+import io
+import os
+import pickle
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from ivf import galeria_sintetica
+
+
+def galeria(n, seed=0):
+    """(matriz n x 128 float32, metadados) com ~2 cadastros por pessoa"""
+    matriz = galeria_sintetica(n, pessoas=max(1, n // 2), seed=seed)
+    metadados = tuple({'nome': f"pessoa_{i // 2}", 'data_cadastro': 'N/A', 'arquivo': f"bench_{i}.pkl"}
+                      for i in range(n))
+    return matriz, metadados
+
+
+def consultas(matriz, n, ruido=0.02, seed=1):
+    """Rostos da galeria com ruído (mesma pessoa, outra foto)"""
+    rng = np.random.default_rng(seed)
+    escolhidos = matriz[rng.integers(0, len(matriz), n)]
+    return escolhidos + rng.normal(0, ruido, escolhidos.shape).astype(np.float32)
+
+
+def escrever_pickles(pasta, matriz, metadados):
+    """Uma galeria no formato antigo: um .pkl por usuário (dict com nome/encoding/data)"""
+    os.makedirs(pasta, exist_ok=True)
+    for encoding, meta in zip(matriz, metadados):
+        with open(os.path.join(pasta, meta['arquivo']), 'wb') as f:
+            pickle.dump({'nome': meta['nome'], 'encoding': encoding.astype(np.float64),
+                         'data_cadastro': meta['data_cadastro']}, f)
+
+
+def popular_banco(banco, matriz, metadados):
+    """Insere a galeria no faces.db em uma única transação (sem journal)"""
+    with banco._transacao() as conn:
+        conn.executemany(
+            "INSERT INTO usuarios (nome, encoding, foto_path, data_cadastro, arquivo) VALUES (?, ?, NULL, ?, ?)",
+            ((m['nome'], e.astype(np.float32).tobytes(), m['data_cadastro'], m['arquivo'])
+             for e, m in zip(matriz, metadados))
+        )
+
+
+def foto(largura, altura, rostos=1, seed=0):
+    """
+    Foto RGB sintética: fundo com gradiente e ruído (para o JPEG não ficar
+    trivial) e 'rostos' desenhados como elipses com olhos e boca.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:altura, 0:largura]
+    fundo = np.stack([x * 255 // max(largura, 1), y * 255 // max(altura, 1),
+                      np.full_like(x, 128)], axis=-1)
+    fundo = np.clip(fundo + rng.normal(0, 12, fundo.shape), 0, 255).astype(np.uint8)
+    imagem = Image.fromarray(fundo)
+    desenho = ImageDraw.Draw(imagem)
+    lado = min(largura, altura) // max(2, rostos + 1)
+    for i in range(rostos):
+        cx = largura * (i + 1) // (rostos + 1)
+        cy = altura // 2
+        desenho.ellipse((cx - lado // 3, cy - lado // 2, cx + lado // 3, cy + lado // 2), fill=(224, 180, 150))
+        for dx in (-lado // 8, lado // 8):
+            desenho.ellipse((cx + dx - lado // 24, cy - lado // 8, cx + dx + lado // 24, cy - lado // 16), fill=(40, 30, 30))
+        desenho.rectangle((cx - lado // 8, cy + lado // 6, cx + lado // 8, cy + lado // 6 + lado // 30), fill=(150, 60, 60))
+    return np.asarray(imagem)
+
+
+def jpeg(imagem, qualidade=90):
+    """Bytes JPEG de um array RGB"""
+    buffer = io.BytesIO()
+    Image.fromarray(imagem).save(buffer, 'JPEG', quality=qualidade)
+    return buffer.getvalue()
+
+
+def fotos_da_pasta(pasta):
+    """Bytes das fotos .jpg/.jpeg/.png de uma pasta local (em vez das sintéticas)"""
+    nomes = sorted(n for n in os.listdir(pasta) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+    conteudos = []
+    for nome in nomes:
+        with open(os.path.join(pasta, nome), 'rb') as f:
+            conteudos.append(f.read())
+    return conteudos
+
+
+# ==================== MEDIÇÃO ====================
+
+def cronometrar(funcao, repeticoes=1):
+    """Executa funcao() 'repeticoes' vezes; retorna (último resultado, lista de segundos)"""
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return resultado, tempos
+
+
+def percentis(segundos):
+    """Média e percentis (ms) de uma lista de tempos em segundos"""
+    if not len(segundos):
+        return {'medio_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    ms = np.asarray(segundos, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'medio_ms': round(float(ms.mean()), 4), 'p50_ms': round(float(p50), 4),
+            'p95_ms': round(float(p95), 4), 'p99_ms': round(float(p99), 4), 'max_ms': round(float(ms.max()), 4)}
@@ -0,0 +1,116 @@
+# ==================== ENDPOINTS PELO TEST CLIENT DO FLASK ====================
+# Sobe o app (main.py) em uma pasta temporária, com um faces.db sintético de
+# 'tamanho_galeria' rostos, e dispara as requisições pelo test client com
+# N threads ao mesmo tempo: mede o caminho completo (decodificação, pool de
+# inferência, galeria, busca, JSON), sem servidor HTTP e sem rede.
+# O faces.db e as fotos do projeto não são tocados.
+#
+# Sem --fotos, as requisições usam as fotos reais de face-models/fotos (só
+# leitura). As fotos sintéticas de dados.foto() ficam só como último recurso:
+# o dlib não acha rosto nelas, então /checkin e /register medem o caminho
+# "nenhum rosto" (400); a coluna 'fotos' de cada linha diz qual foi usada.
+# Latências e 'requisicoes_por_s' contam só as respostas 2xx; as demais entram
+# em 'falhas' (e em 'status', por código).
+
+import io
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import dados
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ('/checkin', '/register', '/users')
+FOTOS_PROJETO = os.path.join(RAIZ, "face-models", "fotos")
+
+
+def _fotos_padrao():
+    """(fotos, origem): as fotos reais do projeto ou, se não houver, as sintéticas"""
+    if os.path.isdir(FOTOS_PROJETO):
+        fotos = dados.fotos_da_pasta(FOTOS_PROJETO)
+        if fotos:
+            return fotos, 'projeto'
+    print("  ⚠️ Nenhuma foto em face-models/fotos: usando fotos sintéticas, em que o dlib "
+          "não detecta rosto (/checkin e /register medem só o caminho sem rosto)")
+    return [dados.jpeg(dados.foto(1280, 720, seed=i)) for i in range(4)], 'sinteticas'
+
+
+def _subir_app(pasta, tamanho_galeria, timeout=300):
+    """Importa o main.py com o cwd em 'pasta' (onde ele cria faces.db e face-models)"""
+    from banco import BancoRostos
+
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    os.chdir(pasta)
+    dados.popular_banco(BancoRostos("faces.db"), *dados.galeria(tamanho_galeria))
+    import main
+
+    limite = time.monotonic() + timeout
+    while not main.pool.pronto:
+        if time.monotonic() > limite:
+            raise RuntimeError("Os modelos não carregaram a tempo")
+        time.sleep(0.05)
+    return main
+
+
+def _requisicao(endpoint, foto, nome):
+    if endpoint == '/users':
+        return 'get', {'query_string': {'limit': 50}}
+    campos = {'photo': (io.BytesIO(foto), 'foto.jpg')}
+    if endpoint == '/register':
+        campos['nome'] = nome
+    return 'post', {'data': campos, 'content_type': 'multipart/form-data'}
+
+
+def benchmark(concorrencias=(1, 4, 16), requisicoes=200, tamanho_galeria=10000, endpoints=ENDPOINTS, fotos=None):
+    if fotos:
+        origem = 'pasta'
+    else:
+        fotos, origem = _fotos_padrao()
+    cwd = os.getcwd()
+    linhas = []
+    with tempfile.TemporaryDirectory(prefix="bench_app_") as pasta:
+        try:
+            app = _subir_app(pasta, tamanho_galeria).app
+            local = threading.local()
+            contador = itertools.count()
+
+            def executar(endpoint, concorrencia, indice):
+                cliente = getattr(local, 'cliente', None)
+                if cliente is None:
+                    cliente = local.cliente = app.test_client()
+                # Nome único em toda a execução: cada /register cadastra uma pessoa nova
+                nome = f"bench_c{concorrencia}_{next(contador)}"
+                metodo, argumentos = _requisicao(endpoint, fotos[indice % len(fotos)], nome)
+                inicio = time.perf_counter()
+                resposta = getattr(cliente, metodo)(endpoint, **argumentos)
+                return time.perf_counter() - inicio, resposta.status_code
+
+            for endpoint in endpoints:
+                for concorrencia in concorrencias:
+                    inicio = time.perf_counter()
+                    with ThreadPoolExecutor(concorrencia) as executor:
+                        resultados = list(executor.map(lambda i: executar(endpoint, concorrencia, i),
+                                                       range(requisicoes)))
+                    total = time.perf_counter() - inicio
+                    # Latência e vazão só das respostas 2xx; as demais são contadas à parte
+                    sucessos = [t for t, s in resultados if 200 <= s < 300]
+                    falhas = len(resultados) - len(sucessos)
+                    linhas.append(dict({'endpoint': endpoint, 'concorrencia': concorrencia,
+                                        'requisicoes': requisicoes, 'fotos': origem,
+                                        'sucessos': len(sucessos), 'falhas': falhas,
+                                        'requisicoes_por_s': round(len(sucessos) / total, 2)},
+                                       **dados.percentis(sucessos),
+                                       status=dict(Counter(str(s) for _, s in resultados))))
+                    if falhas:
+                        print(f"  ⚠️ {endpoint} x{concorrencia}: {falhas} resposta(s) fora de 2xx (fora das latências)")
+                    else:
+                        print(f"  {endpoint} x{concorrencia}: ok")
+        finally:
+            os.chdir(cwd)
+    return linhas
@@ -0,0 +1,99 @@
+# ==================== CARGA DA GALERIA ====================
+# Quanto custa ter a galeria pronta para o primeiro /checkin em cada formato:
+#   pickle         pasta com um .pkl por usuário (como o app guardava antes)
+#   sqlite         faces.db (BancoRostos.carregar_galeria + GaleriaMemoria)
+#   npy            matriz em um .npy (np.load) + metadados em um .pkl
+#   snapshot_mmap  arquivo mapeado com np.memmap (snapshot_mmap.py)
+# 'carga_ms' é o tempo até a galeria estar em memória; 'primeira_busca_ms' é a
+# primeira busca logo depois (no snapshot mapeado é ela que lê as páginas).
+# As medidas são com o page cache quente (os arquivos acabaram de ser escritos).
+
+import os
+import pickle
+import statistics
+import tempfile
+
+import numpy as np
+
+from benchmarks import dados
+
+
+def _carregar_pickles(pasta):
+    usuarios = []
+    for nome in sorted(os.listdir(pasta)):
+        with open(os.path.join(pasta, nome), 'rb') as f:
+            usuario = pickle.load(f)
+        usuarios.append({'nome': usuario['nome'], 'encoding': usuario['encoding'],
+                         'data_cadastro': usuario.get('data_cadastro', 'N/A'), 'arquivo': nome})
+    return usuarios
+
+
+def _tamanho_mb(*caminhos):
+    total = 0
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            total += sum(os.path.getsize(os.path.join(caminho, n)) for n in os.listdir(caminho))
+        elif os.path.exists(caminho):
+            total += os.path.getsize(caminho)
+    return round(total / 2 ** 20, 2)
+
+
+def _medir(formato, n, carregar, disco_mb, repeticoes, consulta):
+    from matcher import MatcherExato
+
+    snapshot, tempos = dados.cronometrar(carregar, repeticoes)
+    _, busca = dados.cronometrar(lambda: MatcherExato(k=1).buscar(snapshot, consulta))
+    return {'tamanho': n, 'formato': formato, 'carga_ms': round(1000 * statistics.median(tempos), 3),
+            'primeira_busca_ms': round(1000 * busca[0], 3), 'disco_mb': disco_mb}
+
+
+def benchmark(tamanhos, repeticoes=3, max_pickle=100000):
+    """Uma linha por (tamanho, formato); galerias acima de max_pickle não testam a pasta de .pkl"""
+    from banco import BancoRostos
+    from galeria import GaleriaMemoria
+    from snapshot_mmap import abrir_snapshot, escrever_snapshot
+
+    linhas = []
+    for n in tamanhos:
+        matriz, metadados = dados.galeria(n)
+        consulta = dados.consultas(matriz, 1)[0]
+        with tempfile.TemporaryDirectory(prefix="bench_galeria_") as pasta:
+            if n <= max_pickle:
+                pasta_pkl = os.path.join(pasta, "encodings")
+                dados.escrever_pickles(pasta_pkl, matriz, metadados)
+
+                def carregar_pickle():
+                    memoria = GaleriaMemoria()
+                    memoria.carregar(_carregar_pickles(pasta_pkl))
+                    return memoria.snapshot()
+                linhas.append(_medir('pickle', n, carregar_pickle, _tamanho_mb(pasta_pkl), repeticoes, consulta))
+
+            db = os.path.join(pasta, "faces.db")
+            banco = BancoRostos(db)
+            dados.popular_banco(banco, matriz, metadados)
+
+            def carregar_sqlite():
+                memoria = GaleriaMemoria()
+                memoria.carregar_matriz(*banco.carregar_galeria())
+                return memoria.snapshot()
+            linhas.append(_medir('sqlite', n, carregar_sqlite, _tamanho_mb(db, db + "-wal"), repeticoes, consulta))
+
+            npy = os.path.join(pasta, "galeria.npy")
+            npy_meta = os.path.join(pasta, "galeria_meta.pkl")
+            np.save(npy, matriz)
+            with open(npy_meta, 'wb') as f:
+                pickle.dump(metadados, f)
+
+            def carregar_npy():
+                memoria = GaleriaMemoria()
+                with open(npy_meta, 'rb') as f:
+                    memoria.carregar_matriz(np.load(npy), pickle.load(f))
+                return memoria.snapshot()
+            linhas.append(_medir('npy', n, carregar_npy, _tamanho_mb(npy, npy_meta), repeticoes, consulta))
+
+            snap = os.path.join(pasta, "galeria-1.snap")
+            escrever_snapshot(snap, 1, matriz, np.arange(n), metadados)
+            linhas.append(_medir('snapshot_mmap', n, lambda: abrir_snapshot(snap)[0], _tamanho_mb(snap),
+                                 repeticoes, consulta))
+        print(f"  galeria {n}: ok")
+    return linhas
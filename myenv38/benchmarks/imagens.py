@@ -0,0 +1,52 @@
+# ==================== DECODIFICAÇÃO E DETECÇÃO ====================
+# Para cada resolução de foto (geradas localmente, ou as de --fotos):
+#   decodificacao  'completa' = Image.open().convert('RGB') + np.array (como era),
+#                  'reduzida' = imagem.carregar_imagem com o lado mínimo da detecção
+#   deteccao       deteccao.localizar_rostos_adaptativo sobre a foto já decodificada
+# A detecção precisa do dlib e dos modelos; sem eles só a decodificação é medida.
+
+import io
+
+import numpy as np
+from PIL import Image
+
+from benchmarks import dados
+
+RESOLUCOES = ((640, 480), (1280, 720), (1920, 1080), (4032, 3024))
+
+
+def _decodificar_completa(conteudo):
+    return np.array(Image.open(io.BytesIO(conteudo)).convert('RGB'))
+
+
+def benchmark(repeticoes=5, max_lado=1024, upsample=2, rosto_minimo=100, fotos=None):
+    from imagem import carregar_imagem
+
+    try:
+        from deteccao import localizar_rostos_adaptativo
+    except ImportError as e:
+        print(f"⚠️  Detecção não medida (face_recognition indisponível: {e})")
+        localizar_rostos_adaptativo = None
+
+    if fotos:
+        entradas = [(f"foto_{i}", conteudo) for i, conteudo in enumerate(fotos)]
+    else:
+        entradas = [(f"{w}x{h}", dados.jpeg(dados.foto(w, h, seed=i))) for i, (w, h) in enumerate(RESOLUCOES)]
+
+    linhas = []
+    for nome, conteudo in entradas:
+        _, completa = dados.cronometrar(lambda: _decodificar_completa(conteudo), repeticoes)
+        (imagem, original), reduzida = dados.cronometrar(
+            lambda: carregar_imagem(io.BytesIO(conteudo), max_lado), repeticoes)
+        linha = {'imagem': nome, 'original': list(original), 'decodificada': [imagem.shape[1], imagem.shape[0]],
+                 'jpeg_kb': round(len(conteudo) / 1024, 1),
+                 'decodificacao_completa_ms': round(1000 * float(np.median(completa)), 3),
+                 'decodificacao_reduzida_ms': round(1000 * float(np.median(reduzida)), 3)}
+        if localizar_rostos_adaptativo is not None:
+            (caixas, nivel), deteccao = dados.cronometrar(
+                lambda: localizar_rostos_adaptativo(imagem, max_lado, upsample, rosto_minimo), repeticoes)
+            linha.update({'rostos': len(caixas), 'upsample': nivel,
+                          'deteccao_ms': round(1000 * float(np.median(deteccao)), 3)})
+        linhas.append(linha)
+        print(f"  imagem {nome}: ok")
+    return linhas
@@ -0,0 +1,101 @@
+# ==================== CACHE DE RESULTADOS POR CONTEÚDO ====================
+# Quiosques repetem o envio quando dá timeout e alguns clientes mandam o mesmo
+# quadro mais de uma vez: os mesmos bytes de JPEG chegam várias vezes ao /checkin.
+#
+# A chave é um hash rápido (BLAKE2b, 128 bits) dos bytes enviados:
+#   - o resultado da inferência (caixas + encodings) fica guardado pela chave,
+#     então uma repetição não decodifica a foto nem passa pelo dlib;
+#   - o resultado da busca fica guardado por (chave, versão da galeria): só é
+#     refeito quando a galeria mudou (cadastro/remoção) desde a última vez.
+# Envios idênticos simultâneos são calculados uma vez só (singleflight): quem
+# chega depois espera o resultado de quem chegou primeiro.
+#
+# LRU limitado a 'capacidade' itens, cada um válido por 'ttl' segundos. O cache
+# é por processo (com servidor.py, cada worker tem o seu).
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def chave_conteudo(conteudo):
+    """Hash dos bytes enviados (o hashlib solta o GIL em buffers grandes)"""
+    return hashlib.blake2b(conteudo, digest_size=16).digest()
+
+
+class CacheResultados:
+    """LRU com TTL e singleflight: obter(chave, calcular) calcula cada chave uma vez"""
+
+    def __init__(self, capacidade=1024, ttl=60.0):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._itens = OrderedDict()  # chave -> (expira_em, valor)
+        self._calculando = {}        # chave -> Future de quem está calculando
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.coalescidas = 0         # esperaram o cálculo de outra requisição
+        self.expiradas = 0
+        self.descartadas = 0         # saíram pelo limite de capacidade
+
+    def obter(self, chave, calcular):
+        """Valor da chave: do cache, do cálculo em andamento ou de calcular() (que pode levantar)"""
+        if self.capacidade <= 0:
+            return calcular()
+
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                if item[0] > time.monotonic():
+                    self._itens.move_to_end(chave)
+                    self.acertos += 1
+                    return item[1]
+                del self._itens[chave]
+                self.expiradas += 1
+            futuro = self._calculando.get(chave)
+            lider = futuro is None
+            if lider:
+                self.faltas += 1
+                futuro = self._calculando[chave] = Future()
+            else:
+                self.coalescidas += 1
+        if not lider:
+            return futuro.result()
+
+        try:
+            valor = calcular()
+        except BaseException as e:
+            # Erros não ficam no cache: quem esperava recebe o mesmo erro
+            with self._lock:
+                del self._calculando[chave]
+            futuro.set_exception(e)
+            raise
+        with self._lock:
+            del self._calculando[chave]
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+                self.descartadas += 1
+        futuro.set_result(valor)
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.faltas + self.coalescidas
+            return {
+                "itens": len(self._itens),
+                "capacidade": self.capacidade,
+                "ttl_s": self.ttl,
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "coalescidas": self.coalescidas,
+                "expiradas": self.expiradas,
+                "descartadas": self.descartadas,
+                "taxa_acerto": round((self.acertos + self.coalescidas) / consultas, 4) if consultas else 0.0,
+            }
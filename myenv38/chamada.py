@@ -0,0 +1,140 @@
+# ==================== CHAMADA POR FOTO DE GRUPO ====================
+# Identifica todos os rostos de uma foto da turma de uma vez:
+#   1. as distâncias de todos os rostos (Q) contra a galeria (N) saem de um
+#      único produto de matrizes Q x N (em blocos, para galerias grandes);
+#   2. só os pares dentro da tolerância viram candidatos;
+#   3. uma atribuição um-para-um (algoritmo húngaro) escolhe o conjunto de pares
+#      de menor distância total, então dois rostos nunca ficam com o mesmo cadastro.
+#
+# As colunas da atribuição são os cadastros ('arquivo'), não os nomes: dois alunos
+# diferentes com o mesmo nome podem estar na mesma foto. O nome só aparece no
+# resultado.
+#
+# O trabalho em Python cresce com o número de rostos e de candidatos, não com
+# rostos x tamanho da galeria.
+#
+# Na galeria só de códigos PQ (precisão 'pq') não há vetores para o passo 1: os
+# candidatos de cada rosto são os 'rerank' mais próximos pelas tabelas ADC,
+# conferidos com os vetores exatos do banco.
+
+import numpy as np
+
+from galeria import DIMENSAO
+from matcher import BLOCO_DISTANCIAS, TOLERANCIA_PADRAO, distancias_lote
+from quantizacao import MARGEM_PADRAO
+
+
+def atribuir_hungaro(custo):
+    """
+    Atribuição de custo mínimo (algoritmo húngaro, O(n² m)) para uma matriz
+    n x m com n <= m. Retorna, para cada linha, a coluna atribuída.
+    """
+    custo = np.asarray(custo, dtype=np.float64)
+    n, m = custo.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    dono = np.zeros(m + 1, dtype=np.int64)     # dono[j] = linha (1..n) na coluna j; coluna 0 é auxiliar
+    caminho = np.zeros(m + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        dono[0] = i
+        j0 = 0
+        minimo = np.full(m + 1, np.inf)
+        usada = np.zeros(m + 1, dtype=bool)
+        while True:
+            usada[j0] = True
+            i0 = dono[j0]
+            livres = ~usada[1:]
+            reduzido = custo[i0 - 1] - u[i0] - v[1:]
+            melhora = livres & (reduzido < minimo[1:])
+            minimo[1:][melhora] = reduzido[melhora]
+            caminho[1:][melhora] = j0
+
+            candidatos = np.where(livres, minimo[1:], np.inf)
+            j1 = int(np.argmin(candidatos)) + 1
+            delta = candidatos[j1 - 1]
+            u[dono[usada]] += delta
+            v[usada] -= delta
+            minimo[1:][livres] -= delta
+            j0 = j1
+            if dono[j0] == 0:
+                break
+        # Inverte o caminho aumentante
+        while j0:
+            j1 = caminho[j0]
+            dono[j0] = dono[j1]
+            j0 = j1
+
+    atribuicao = np.full(n, -1, dtype=np.int64)
+    for j in range(1, m + 1):
+        if dono[j]:
+            atribuicao[dono[j] - 1] = j - 1
+    return atribuicao
+
+
+def _candidatos(snapshot, consultas, limite):
+    """Pares (rosto, linha da galeria, distância) com distância <= limite"""
+    rostos, linhas, dists = [], [], []
+    for inicio in range(0, len(snapshot), BLOCO_DISTANCIAS):
+        fim = min(inicio + BLOCO_DISTANCIAS, len(snapshot))
+        bloco = distancias_lote(snapshot.vetores(slice(inicio, fim)), snapshot.normas2[inicio:fim], consultas)
+        q, j = np.nonzero(bloco <= limite)
+        rostos.append(q)
+        linhas.append(j + inicio)
+        dists.append(bloco[q, j])
+    if not rostos:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+    return np.concatenate(rostos), np.concatenate(linhas), np.concatenate(dists)
+
+
+def _candidatos_pq(snapshot, consultas, rerank):
+    """Pares (rosto, linha da galeria) com as 'rerank' linhas mais próximas de cada rosto pelas tabelas ADC"""
+    codec = snapshot.escala
+    r = min(rerank, len(snapshot))
+    linhas = [np.argpartition(codec.distancias_adc(codec.tabelas(c), snapshot.matriz), r - 1)[:r] for c in consultas]
+    return np.repeat(np.arange(len(consultas)), r), np.concatenate(linhas)
+
+
+def identificar_grupo(snapshot, encodings, tolerancia=TOLERANCIA_PADRAO, fonte_exata=None, rerank=64):
+    """
+    Identifica cada encoding (Q x 128) na galeria, sem repetir pessoas.
+    Retorna uma lista (na ordem dos encodings) com (metadados, distância) ou None.
+    'rerank' só vale para a galeria de códigos PQ (candidatos por rosto).
+    """
+    consultas = np.asarray(encodings, dtype=np.float32).reshape(-1, DIMENSAO)
+    q = len(consultas)
+    if q == 0 or len(snapshot) == 0:
+        return [None] * q
+
+    if snapshot.precisao == 'pq':
+        rostos, linhas = _candidatos_pq(snapshot, consultas, rerank)
+        margem = MARGEM_PADRAO['pq']
+    else:
+        # Galerias quantizadas: pega candidatos com folga e refaz a conta em float32
+        margem = MARGEM_PADRAO[snapshot.precisao] if fonte_exata is not None else 0.0
+        rostos, linhas, dists = _candidatos(snapshot, consultas, tolerancia + margem)
+    if margem and len(linhas):
+        if fonte_exata is not None:
+            exatos = np.asarray(fonte_exata([snapshot.metadados[j]['arquivo'] for j in linhas]), dtype=np.float32)
+        else:
+            exatos = snapshot.vetores(linhas)  # PQ sem banco: vetores aproximados
+        dists = np.linalg.norm(exatos - consultas[rostos], axis=1)
+        dentro = dists <= tolerancia
+        rostos, linhas, dists = rostos[dentro], linhas[dentro], dists[dentro]
+
+    # Uma coluna por cadastro candidato (linha da galeria)
+    cadastros, coluna = np.unique(linhas, return_inverse=True)
+    p = len(cadastros)
+    # Colunas extras "desconhecido" (uma por rosto) com custo = tolerância:
+    # nenhum par acima da tolerância vale mais a pena que ficar sem identificação
+    custo = np.full((q, p + q), tolerancia + 1.0)
+    custo[np.arange(q), p + np.arange(q)] = tolerancia
+    custo[rostos, coluna] = dists
+
+    resultado = []
+    for r, c in enumerate(atribuir_hungaro(custo)):
+        if c < p and custo[r, c] <= tolerancia:
+            resultado.append((snapshot.metadados[cadastros[c]], float(custo[r, c])))
+        else:
+            resultado.append(None)
+    return resultado
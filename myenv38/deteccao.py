@@ -0,0 +1,259 @@
+# ==================== DETECÇÃO REDUZIDA / ENCODING EM RESOLUÇÃO TOTAL ====================
+# O detector HOG custa proporcionalmente ao número de pixels (e ~4x mais com
+# upsample=1). Fotos de celular de 12 MP levavam segundos só para achar o rosto.
+#
+# Aqui a detecção roda em uma cópia reduzida (maior lado <= max_lado), as caixas
+# são levadas de volta para as coordenadas da imagem original e o encoding é
+# calculado em um recorte da imagem original em volta de cada rosto, então a
+# qualidade do encoding não depende do tamanho usado na detecção.
+#
+# A detecção é adaptativa (localizar_rostos_adaptativo): tenta primeiro sem
+# upsample, que custa ~4x menos e basta para a selfie típica do quiosque, e só
+# sobe para upsample 1 e 2 quando não acha nada ou quando os rostos achados
+# estão perto do tamanho mínimo que aquele nível enxerga (indício de que há
+# rostos menores passando despercebidos). O nível usado fica contado em
+# contagem_niveis().
+#
+# Benchmark (latência e concordância com a detecção em resolução total):
+#   python deteccao.py benchmark pasta_de_fotos --tamanhos 480 640 800 1024 1600
+
+import argparse
+import glob
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+import face_recognition
+from face_recognition.api import _raw_face_locations, _rect_to_css, _trim_css_to_bounds
+
+MAX_LADO_PADRAO = 1024
+
+# Modelos do dlib que este pipeline usa (detector HOG, landmarks de 5 pontos e o
+# encoder). O detector CNN e o preditor de 68 pontos nunca são carregados.
+MODELOS = ("face_detector", "pose_predictor_5_point", "face_encoder")
+
+# O detector HOG do dlib usa uma janela de 80x80: sem upsample, rostos menores
+# que isso não aparecem. Rostos abaixo de ROSTO_MINIMO / 2**nivel fazem a
+# cascata subir de nível.
+ROSTO_MINIMO = 100
+UPSAMPLE_MAXIMO = 2
+
+_lock_niveis = threading.Lock()
+_niveis = Counter()  # nível da cascata -> quantas detecções terminaram nele
+
+# Folga em volta da caixa no recorte usado para o encoding (fração do lado da caixa).
+# Os landmarks e o alinhamento do dlib olham um pouco além da caixa do detector.
+MARGEM_RECORTE = 0.5
+
+
+def _area(caixa):
+    return (caixa[2] - caixa[0]) * (caixa[1] - caixa[3])
+
+
+def reduzir(imagem, max_lado):
+    """
+    Cópia da imagem com o maior lado <= max_lado (max_lado 0/None = sem redução).
+    Retorna (imagem_reduzida, (escala_y, escala_x)) para voltar às coordenadas originais.
+    """
+    altura, largura = imagem.shape[:2]
+    if not max_lado or max(altura, largura) <= max_lado:
+        return imagem, (1.0, 1.0)
+    fator = max_lado / max(altura, largura)
+    tamanho = (max(1, round(largura * fator)), max(1, round(altura * fator)))
+    # reducing_gap faz primeiro uma redução inteira barata (box) e só então o bilinear
+    pequena = np.asarray(Image.fromarray(imagem).resize(tamanho, Image.BILINEAR, reducing_gap=2.0))
+    return pequena, (altura / pequena.shape[0], largura / pequena.shape[1])
+
+
+def ampliar_caixas(caixas, escala, formato):
+    """Leva caixas (top, right, bottom, left) da imagem reduzida para a original"""
+    escala_y, escala_x = escala
+    altura, largura = formato[:2]
+    return [(max(int(round(top * escala_y)), 0),
+             min(int(round(right * escala_x)), largura),
+             min(int(round(bottom * escala_y)), altura),
+             max(int(round(left * escala_x)), 0))
+            for top, right, bottom, left in caixas]
+
+
+def localizar_rostos(imagem, max_lado=MAX_LADO_PADRAO, upsample=1):
+    """Caixas dos rostos, em coordenadas da imagem original, detectadas na cópia reduzida"""
+    pequena, escala = reduzir(imagem, max_lado)
+    caixas = face_recognition.face_locations(pequena, number_of_times_to_upsample=upsample)
+    return ampliar_caixas(caixas, escala, imagem.shape)
+
+
+def carregar_modelos():
+    """Carrega agora (em vez de no primeiro uso) só os modelos do pipeline"""
+    return face_recognition.load_models(MODELOS)
+
+
+def _detectar(imagem, upsample):
+    """Um nível da cascata: caixas (top, right, bottom, left) com o upsample dado"""
+    return [_trim_css_to_bounds(_rect_to_css(r), imagem.shape) for r in _raw_face_locations(imagem, upsample)]
+
+
+def localizar_rostos_adaptativo(imagem, max_lado=MAX_LADO_PADRAO, upsample_maximo=UPSAMPLE_MAXIMO,
+                                rosto_minimo=ROSTO_MINIMO):
+    """
+    Como localizar_rostos, mas com upsample 0, 1, 2... só até onde precisar.
+    Retorna (caixas em coordenadas da imagem original, nível de upsample usado).
+    """
+    pequena, escala = reduzir(imagem, max_lado)
+    for nivel in range(upsample_maximo + 1):
+        caixas = _detectar(pequena, nivel)
+        menor = min((min(b - t, r - l) for t, r, b, l in caixas), default=0)
+        if caixas and menor >= rosto_minimo / 2 ** nivel:
+            break
+    with _lock_niveis:
+        _niveis[nivel] += 1
+    return ampliar_caixas(caixas, escala, imagem.shape), nivel
+
+
+def contagem_niveis():
+    """Quantas detecções adaptativas terminaram em cada nível de upsample"""
+    with _lock_niveis:
+        return dict(_niveis)
+
+
+ESTRATEGIAS = ('maior', 'central', 'todos')
+
+
+def escolher_rostos(caixas, formato, estrategia='maior'):
+    """
+    Escolhe, antes do encoding, quais rostos serão usados:
+      'maior'   -> só o rosto de maior área (quem está mais perto da câmera)
+      'central' -> só o rosto cujo centro está mais perto do centro da imagem
+      'todos'   -> todos, na ordem da detecção
+    """
+    if estrategia not in ESTRATEGIAS:
+        raise ValueError(f"Estratégia inválida: {estrategia}. Use uma de {ESTRATEGIAS}")
+    if estrategia == 'todos' or len(caixas) <= 1:
+        return list(caixas)
+    if estrategia == 'maior':
+        return [max(caixas, key=_area)]
+    centro_y, centro_x = formato[0] / 2, formato[1] / 2
+    return [min(caixas, key=lambda c: ((c[0] + c[2]) / 2 - centro_y) ** 2 + ((c[1] + c[3]) / 2 - centro_x) ** 2)]
+
+
+def _recorte(imagem, caixa):
+    """Recorte contíguo da imagem em volta da caixa e a caixa relativa ao recorte"""
+    top, right, bottom, left = caixa
+    folga = int(MARGEM_RECORTE * max(bottom - top, right - left))
+    y0, x0 = max(top - folga, 0), max(left - folga, 0)
+    y1, x1 = min(bottom + folga, imagem.shape[0]), min(right + folga, imagem.shape[1])
+    recorte = np.ascontiguousarray(imagem[y0:y1, x0:x1])
+    return recorte, (top - y0, right - x0, bottom - y0, left - x0)
+
+
+def codificar_rostos(imagem, caixas):
+    """
+    Encodings de cada caixa, calculados na resolução original. Os recortes vão
+    juntos para o dlib (uma chamada só); retorna uma lista de vetores float32.
+    """
+    if not caixas:
+        return []
+    recortes = [_recorte(imagem, caixa) for caixa in caixas]
+    encodings = face_recognition.batch_face_encodings([r for r, _ in recortes], [[c] for _, c in recortes])
+    return [e[0] for e in encodings]
+
+
+def codificar_rostos_lote(imagem, caixas):
+    """
+    Encodings de todas as caixas com uma única chamada ao descritor do dlib
+    (todas as formas de landmarks de uma vez). Retorna uma matriz k x 128 float32.
+    """
+    return face_recognition.face_encodings_batch(imagem, caixas)
+
+
+def detectar_e_codificar(imagem, max_lado=MAX_LADO_PADRAO, upsample=1):
+    """Atalho: (caixas, encodings) de todos os rostos da imagem"""
+    caixas = localizar_rostos(imagem, max_lado, upsample)
+    return caixas, codificar_rostos(imagem, caixas)
+
+
+# ==================== BENCHMARK ====================
+
+def _iou(a, b):
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    uniao = _area(a) + _area(b) - inter
+    return inter / uniao if uniao > 0 else 0.0
+
+
+def benchmark(imagens, tamanhos, upsample=1):
+    """
+    Para cada max_lado, mede o tempo de detecção+encoding e compara com a
+    referência em resolução total: rostos reencontrados (IoU >= 0.5) e a
+    distância entre o encoding obtido e o da referência.
+    """
+    referencia = []
+    inicio = time.perf_counter()
+    for imagem in imagens:
+        caixas = face_recognition.face_locations(imagem, number_of_times_to_upsample=upsample)
+        referencia.append((caixas, face_recognition.face_encodings_batch(imagem, caixas)))
+    linhas = [{'max_lado': 'original', 'ms': 1000 * (time.perf_counter() - inicio) / len(imagens),
+               'recall': 1.0, 'extras': 0, 'dist_media': 0.0, 'dist_max': 0.0}]
+
+    total_ref = sum(len(c) for c, _ in referencia)
+    for max_lado in tamanhos:
+        encontrados, extras, dists = 0, 0, []
+        inicio = time.perf_counter()
+        resultados = [detectar_e_codificar(imagem, max_lado, upsample) for imagem in imagens]
+        tempo = time.perf_counter() - inicio
+
+        for (caixas_ref, enc_ref), (caixas, encs) in zip(referencia, resultados):
+            usados = set()
+            for caixa_ref, e_ref in zip(caixas_ref, enc_ref):
+                pares = [(_iou(caixa_ref, c), j) for j, c in enumerate(caixas) if j not in usados]
+                melhor = max(pares, default=(0.0, None))
+                if melhor[0] >= 0.5:
+                    usados.add(melhor[1])
+                    encontrados += 1
+                    dists.append(float(np.linalg.norm(encs[melhor[1]] - e_ref)))
+            extras += len(caixas) - len(usados)
+
+        linhas.append({
+            'max_lado': max_lado,
+            'ms': 1000 * tempo / len(imagens),
+            'recall': encontrados / total_ref if total_ref else 1.0,
+            'extras': extras,
+            'dist_media': float(np.mean(dists)) if dists else 0.0,
+            'dist_max': float(np.max(dists)) if dists else 0.0,
+        })
+    return linhas
+
+
+def _carregar_pasta(pasta):
+    caminhos = sorted(c for ext in ('jpg', 'jpeg', 'png')
+                      for c in glob.glob(os.path.join(pasta, f"*.{ext}")))
+    return [face_recognition.load_image_file(c) for c in caminhos]
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Detecção reduzida + encoding em resolução total")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    bench = sub.add_parser('benchmark', help="varre o tamanho máximo da detecção")
+    bench.add_argument('pasta', help="pasta com fotos (.jpg/.png)")
+    bench.add_argument('--tamanhos', type=int, nargs='+', default=[480, 640, 800, 1024, 1600])
+    bench.add_argument('--upsample', type=int, default=1)
+    args = parser.parse_args()
+
+    imagens = _carregar_pasta(args.pasta)
+    if not imagens:
+        print(f"❌ Nenhuma foto encontrada em {args.pasta}")
+        return
+    print(f"{len(imagens)} fotos, upsample={args.upsample}")
+    print(f"{'max_lado':>9} {'ms/foto':>9} {'recall':>7} {'extras':>7} {'dist média':>11} {'dist máx':>9}")
+    for linha in benchmark(imagens, args.tamanhos, args.upsample):
+        print(f"{linha['max_lado']:>9} {linha['ms']:>9.1f} {linha['recall']:>7.3f} {linha['extras']:>7} "
+              f"{linha['dist_media']:>11.4f} {linha['dist_max']:>9.4f}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,124 @@
+# ==================== GRAVAÇÃO DAS FOTOS EM SEGUNDO PLANO ====================
+# O cadastro já está decidido quando o encoding existe; salvar a foto (codificar
+# o JPEG e escrever no disco) não precisa atrasar a resposta do /register.
+# As fotos entram em uma fila limitada e são gravadas por threads de fundo.
+#
+# - Do /register chegam os bytes enviados: um JPEG é gravado como veio (resolução
+#   original, sem recodificar); outros formatos são decodificados e convertidos
+#   para JPEG aqui, fora da requisição. A imagem decodificada da requisição vem
+#   reduzida para a detecção (imagem.py) e não serve para guardar.
+# - Um array RGB também é aceito e codificado direto (PIL), sem cópia para BGR.
+# - Cada arquivo é gravado em um .tmp, com fsync, e renomeado (nunca fica pela metade).
+# - Com a fila cheia, quem chama grava a foto na hora (backpressure, sem perder fotos).
+# - encerrar() (chamado também no atexit) espera a fila esvaziar.
+# - Depois de um fork (servidor.py), o processo filho recria a fila e as threads.
+
+import atexit
+import io
+import os
+import queue
+import threading
+
+from PIL import Image
+
+_FIM = object()  # sinaliza para as threads pararem
+_JPEG = b'\xff\xd8\xff'  # início de todo arquivo JPEG
+
+
+class GravadorFotos:
+    """Pool limitado de threads que grava fotos (bytes enviados ou arrays RGB) como JPEG"""
+
+    def __init__(self, max_fila=64, threads=2, qualidade=95):
+        self.qualidade = qualidade
+        self.max_fila = max_fila
+        self.n_threads = threads
+        self._iniciar()
+        atexit.register(self.encerrar)
+        if hasattr(os, 'register_at_fork'):
+            # Threads não sobrevivem ao fork: o filho começa com fila e threads novas
+            os.register_at_fork(after_in_child=self._iniciar)
+
+    def _iniciar(self):
+        self._fila = queue.Queue(maxsize=self.max_fila)
+        self._lock = threading.Lock()
+        self.gravadas = 0
+        self.falhas = 0
+        self.sincronas = 0  # gravadas na thread da requisição porque a fila estava cheia
+        self._threads = [
+            threading.Thread(target=self._trabalhar, name=f"gravador-fotos-{i}", daemon=True)
+            for i in range(self.n_threads)
+        ]
+        for t in self._threads:
+            t.start()
+
+    @property
+    def profundidade(self):
+        """Quantas fotos estão esperando na fila"""
+        return self._fila.qsize()
+
+    def estatisticas(self):
+        return {
+            "fila": self.profundidade,
+            "fila_max": self._fila.maxsize,
+            "gravadas": self.gravadas,
+            "sincronas": self.sincronas,
+            "falhas": self.falhas,
+        }
+
+    def enfileirar(self, caminho, foto):
+        """
+        Agenda a gravação de 'foto': bytes do arquivo enviado ou array RGB.
+        Um array não deve ser alterado depois disso.
+        """
+        try:
+            self._fila.put_nowait((caminho, foto))
+        except queue.Full:
+            with self._lock:
+                self.sincronas += 1
+            self._gravar(caminho, foto)
+
+    def _trabalhar(self):
+        while True:
+            item = self._fila.get()
+            try:
+                if item is _FIM:
+                    return
+                self._gravar(*item)
+            finally:
+                self._fila.task_done()
+
+    def _gravar(self, caminho, foto):
+        temporario = caminho + ".tmp"
+        try:
+            with open(temporario, 'wb') as f:
+                if isinstance(foto, (bytes, bytearray)) and foto.startswith(_JPEG):
+                    f.write(foto)
+                elif isinstance(foto, (bytes, bytearray)):
+                    Image.open(io.BytesIO(foto)).convert('RGB').save(f, 'JPEG', quality=self.qualidade)
+                else:
+                    Image.fromarray(foto).save(f, 'JPEG', quality=self.qualidade)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, caminho)
+            with self._lock:
+                self.gravadas += 1
+        except Exception as e:
+            with self._lock:
+                self.falhas += 1
+            print(f"⚠️  Erro ao gravar a foto {caminho}: {e}")
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def esperar(self):
+        """Bloqueia até todas as fotos enfileiradas estarem no disco"""
+        self._fila.join()
+
+    def encerrar(self):
+        """Grava o que falta na fila e para as threads"""
+        if not any(t.is_alive() for t in self._threads):
+            return
+        for _ in self._threads:
+            self._fila.put(_FIM)
+        for t in self._threads:
+            t.join()
+        print(f"✓ Gravador de fotos encerrado ({self.gravadas} fotos gravadas)")
@@ -0,0 +1,231 @@
+# ==================== GALERIA EM MEMÓRIA ====================
+# Mantém os usuários cadastrados residentes em memória, para que o /checkin
+# não precise reler o armazenamento a cada requisição.
+
+import threading
+
+import numpy as np
+
+from quantizacao import calibrar_int8, dequantizar, dtype_de, fora_da_faixa, quantizar
+
+DIMENSAO = 128  # tamanho de um encoding do face_recognition
+
+
+class SnapshotGaleria:
+    """
+    Visão imutável da galeria em um determinado momento.
+
+    'matriz' é uma view (N x 128, contígua) do buffer da galeria, na precisão
+    da galeria ('float32', 'float16' ou 'int8'; ver quantizacao.py), e
+    'normas2' guarda ||x||² de cada linha (float32), usados pelo matcher.
+    Na precisão 'pq' a matriz tem os códigos (N x M, uint8) e 'escala' é o CodecPQ.
+    'metadados' é uma tupla de dicts com 'nome', 'data_cadastro' e 'arquivo'.
+    """
+
+    __slots__ = ('versao', 'matriz', 'normas2', 'metadados', 'precisao', 'escala', 'deslocamento')
+
+    def __init__(self, versao, matriz, normas2, metadados, precisao='float32', escala=None, deslocamento=None):
+        self.versao = versao
+        self.matriz = matriz
+        self.normas2 = normas2
+        self.metadados = metadados
+        self.precisao = precisao
+        self.escala = escala
+        self.deslocamento = deslocamento
+
+    def __len__(self):
+        return len(self.metadados)
+
+    def vetores(self, linhas=slice(None)):
+        """Linhas da galeria em float32 (sem cópia quando a galeria já é float32)"""
+        if self.precisao == 'float32':
+            return self.matriz[linhas]
+        return dequantizar(self.matriz[linhas], self.precisao, self.escala, self.deslocamento)
+
+
+class GaleriaMemoria:
+    """
+    Galeria de rostos carregada uma única vez e atualizada no lugar.
+
+    Os encodings ficam em uma matriz pré-alocada (com folga), junto com o
+    quadrado da norma de cada linha. Leitores chamam snapshot() e recebem uma
+    visão consistente, que não muda mesmo que um cadastro ou remoção aconteça
+    enquanto a usam:
+      - cadastro escreve na primeira linha livre, que nenhum snapshot antigo enxerga;
+      - remoção (rara) monta um buffer novo, sem tocar no que já foi publicado.
+    Escritores trabalham sob um lock e trocam a referência do snapshot de uma vez só.
+
+    'precisao' escolhe como os encodings são guardados: 'float32' (padrão),
+    'float16' ou 'int8' (com escala/deslocamento por dimensão, calibrados a
+    cada carregar_matriz e recalibrados quando um cadastro sai da faixa), ou
+    'pq' (só os códigos do 'codec', um CodecPQ treinado).
+
+    Estruturas derivadas (ex.: o índice IVF) podem se registrar com observar()
+    para serem avisadas de cada mudança e se atualizarem de forma incremental.
+    """
+
+    def __init__(self, capacidade_inicial=1024, precisao='float32', codec=None):
+        self._lock = threading.Lock()
+        self._capacidade_inicial = capacidade_inicial
+        self._definir_precisao(precisao, codec)
+        self._matriz = np.empty((capacidade_inicial, self._colunas), dtype=self._dtype)
+        self._normas2 = np.empty(capacidade_inicial, dtype=np.float32)
+        self._snapshot = self._novo_snapshot(0, 0, ())
+        self._observadores = []
+
+    def _definir_precisao(self, precisao, codec=None):
+        self.precisao = precisao
+        self._dtype = dtype_de(precisao)
+        self._colunas = DIMENSAO
+        self._escala, self._deslocamento = None, None
+        if precisao == 'int8':
+            self._escala, self._deslocamento = calibrar_int8(np.empty((0, DIMENSAO)), DIMENSAO)
+        elif precisao == 'pq':
+            if codec is None or not codec.treinado:
+                raise ValueError("A precisão 'pq' precisa de um CodecPQ treinado")
+            self._escala, self._colunas = codec, codec.m
+
+    def observar(self, callback):
+        """
+        Registra callback(evento, snapshot, indice), chamado sob o lock de escrita
+        logo após cada publicação. evento é 'carregar', 'adicionar' ou 'remover';
+        indice é a linha afetada (None em 'carregar').
+        """
+        with self._lock:
+            self._observadores.append(callback)
+            callback('carregar', self._snapshot, None)
+
+    def _notificar(self, evento, indice):
+        for callback in self._observadores:
+            try:
+                callback(evento, self._snapshot, indice)
+            except Exception as e:
+                print(f"⚠️  Erro ao notificar observador da galeria: {e}")
+
+    def snapshot(self):
+        """Retorna a visão atual da galeria (sem lock)"""
+        return self._snapshot
+
+    def _novo_snapshot(self, versao, n, metadados):
+        return SnapshotGaleria(versao, self._matriz[:n], self._normas2[:n], metadados,
+                               self.precisao, self._escala, self._deslocamento)
+
+    def _publicar(self, n, metadados):
+        self._snapshot = self._novo_snapshot(self._snapshot.versao + 1, n, metadados)
+
+    def _gravar(self, inicio, vetores):
+        """Grava vetores float a partir da linha 'inicio' (quantizando) e atualiza as normas"""
+        fim = inicio + len(vetores)
+        self._matriz[inicio:fim] = quantizar(vetores, self.precisao, self._escala, self._deslocamento)
+        # As normas vêm dos valores guardados, para ficarem coerentes com a matriz
+        guardados = dequantizar(self._matriz[inicio:fim], self.precisao, self._escala, self._deslocamento)
+        np.einsum('ij,ij->i', guardados, guardados, out=self._normas2[inicio:fim])
+
+    def _alocar(self, capacidade):
+        """Troca para um buffer novo; snapshots antigos continuam no buffer anterior"""
+        n = len(self._snapshot)
+        matriz = np.empty((capacidade, self._colunas), dtype=self._dtype)
+        normas2 = np.empty(capacidade, dtype=np.float32)
+        matriz[:n] = self._matriz[:n]
+        normas2[:n] = self._normas2[:n]
+        self._matriz, self._normas2 = matriz, normas2
+
+    def carregar(self, usuarios):
+        """Substitui todo o conteúdo da galeria a partir de uma lista de dicts de usuário"""
+        usuarios = list(usuarios)
+        matriz = np.array([u['encoding'] for u in usuarios], dtype=np.float32).reshape(-1, DIMENSAO)
+        self.carregar_matriz(matriz, tuple(_metadados(u) for u in usuarios))
+
+    def carregar_matriz(self, matriz, metadados):
+        """Substitui todo o conteúdo da galeria a partir de uma matriz N x 128 já pronta"""
+        matriz = np.asarray(matriz, dtype=np.float32).reshape(-1, DIMENSAO)
+        with self._lock:
+            n = len(metadados)
+            capacidade = max(self._capacidade_inicial, 2 * n)
+            if self.precisao == 'int8':
+                self._escala, self._deslocamento = calibrar_int8(matriz, DIMENSAO)
+            self._matriz = np.empty((capacidade, self._colunas), dtype=self._dtype)
+            self._normas2 = np.empty(capacidade, dtype=np.float32)
+            self._gravar(0, matriz)
+            self._publicar(n, tuple(metadados))
+            self._notificar('carregar', None)
+
+    def _recalibrar(self, extra):
+        """
+        int8: calibra de novo com a galeria atual + 'extra' e requantiza tudo em
+        um buffer novo (copy-on-write: snapshots antigos mantêm buffer e escala).
+        """
+        n = len(self._snapshot)
+        atuais = self._snapshot.vetores()
+        self._escala, self._deslocamento = calibrar_int8(np.concatenate([atuais, extra]), DIMENSAO)
+        self._matriz = np.empty((len(self._matriz), self._colunas), dtype=self._dtype)
+        self._normas2 = np.empty(len(self._matriz), dtype=np.float32)
+        self._gravar(0, atuais)
+        print(f"✓ Galeria int8 recalibrada ({n} rostos requantizados)")
+
+    def requantizar(self, precisao, codec=None):
+        """
+        Troca a precisão da galeria (ex.: para 'pq' quando os codebooks ficam
+        prontos) mantendo usuários e versões: tudo é regravado em um buffer novo.
+        A conversão pesada roda fora do lock; se um cadastro/remoção chegar no
+        meio, ela é refeita sob o lock.
+        """
+        def converter(snapshot):
+            destino = GaleriaMemoria(self._capacidade_inicial, precisao, codec)
+            destino.carregar_matriz(snapshot.vetores(), snapshot.metadados)
+            return destino
+
+        base = self._snapshot
+        destino = converter(base)
+        with self._lock:
+            atual = self._snapshot
+            if atual is not base:
+                destino = converter(atual)
+            self.precisao, self._dtype, self._colunas = destino.precisao, destino._dtype, destino._colunas
+            self._escala, self._deslocamento = destino._escala, destino._deslocamento
+            self._matriz, self._normas2 = destino._matriz, destino._normas2
+            self._publicar(len(atual), atual.metadados)
+            self._notificar('carregar', None)
+
+    def adicionar(self, usuario):
+        """Adiciona um usuário e publica uma nova visão"""
+        vetor = np.asarray(usuario['encoding'], dtype=np.float32).reshape(1, DIMENSAO)
+        with self._lock:
+            n = len(self._snapshot)
+            if self.precisao == 'int8' and fora_da_faixa(vetor, self._escala, self._deslocamento):
+                self._recalibrar(vetor)
+            if n == len(self._matriz):
+                self._alocar(max(2 * n, 1))
+            self._gravar(n, vetor)
+            self._publicar(n + 1, self._snapshot.metadados + (_metadados(usuario),))
+            self._notificar('adicionar', n)
+
+    def remover(self, arquivo):
+        """Remove um usuário pelo ID (nome do arquivo). Retorna True se existia."""
+        with self._lock:
+            atual = self._snapshot
+            indice = next((i for i, m in enumerate(atual.metadados) if m['arquivo'] == arquivo), None)
+            if indice is None:
+                return False
+
+            # Copy-on-write: o buffer publicado pode estar sendo lido agora
+            n = len(atual) - 1
+            capacidade = max(self._capacidade_inicial, len(self._matriz))
+            matriz = np.empty((capacidade, self._colunas), dtype=self._dtype)
+            normas2 = np.empty(capacidade, dtype=np.float32)
+            matriz[:indice] = atual.matriz[:indice]
+            matriz[indice:n] = atual.matriz[indice + 1:]
+            normas2[:indice] = atual.normas2[:indice]
+            normas2[indice:n] = atual.normas2[indice + 1:]
+            self._matriz, self._normas2 = matriz, normas2
+            self._publicar(n, atual.metadados[:indice] + atual.metadados[indice + 1:])
+            self._notificar('remover', indice)
+            return True
+
+
+def _metadados(usuario):
+    return {
+        'nome': usuario['nome'],
+        'data_cadastro': usuario.get('data_cadastro', 'N/A'),
+        'arquivo': usuario['arquivo']
+    }
@@ -0,0 +1,52 @@
+# ==================== DECODIFICAÇÃO DAS FOTOS ENVIADAS ====================
+# np.array(Image.open(f).convert('RGB')) decodifica todos os pixels da foto e
+# ainda copia tudo para o NumPy; uma foto de 12 MP vira ~36 MB (duas vezes).
+#
+# Aqui só o cabeçalho é lido primeiro, para saber as dimensões. Em JPEG, o
+# draft() pede ao decodificador libjpeg uma escala de 1/2, 1/4 ou 1/8 (o DCT é
+# reduzido durante a decodificação, os pixels cheios nunca existem). Nos outros
+# formatos, reduce() faz uma redução inteira logo após decodificar. A escala é a
+# menor que ainda deixa o maior lado >= lado_minimo (o tamanho que a detecção usa).
+#
+# O array final é uint8, contíguo (C) e somente leitura: np.asarray usa direto
+# os bytes do PIL, sem uma segunda cópia.
+
+import numpy as np
+from PIL import Image
+
+
+def _fator_reducao(tamanho, lado_minimo):
+    """Maior fator inteiro que mantém o maior lado >= lado_minimo"""
+    if not lado_minimo:
+        return 1
+    return max(1, max(tamanho) // lado_minimo)
+
+
+def carregar_imagem(arquivo, lado_minimo=0):
+    """
+    Abre uma foto (caminho ou stream) e retorna um array RGB uint8 contíguo.
+
+    Com lado_minimo, a foto é decodificada já reduzida, mas nunca abaixo de
+    lado_minimo no maior lado. Retorna (array, (largura, altura) original).
+
+    O array é somente leitura (aponta para os bytes do PIL): operações in-place
+    levantam ValueError; quem precisar alterar os pixels faz uma cópia antes.
+    Por vir reduzido, também não serve para guardar a foto original.
+    """
+    img = Image.open(arquivo)  # só lê o cabeçalho
+    original = img.size
+    fator = _fator_reducao(original, lado_minimo)
+
+    if fator > 1 and img.format == 'JPEG':
+        # O draft escolhe a escala (1/2, 1/4, 1/8) que ainda cobre o tamanho pedido
+        largura, altura = original
+        img.draft('RGB', (-(-largura // fator), -(-altura // fator)))
+    elif fator > 1:
+        # reduce() só aceita alguns modos (não aceita paleta 'P' nem '1')
+        if img.mode not in ('RGB', 'L', 'RGBA'):
+            img = img.convert('RGB')
+        img = img.reduce(fator)
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return np.asarray(img), original
@@ -0,0 +1,393 @@
+# ==================== POOL DE PROCESSOS DE INFERÊNCIA ====================
+# A detecção e o encoding (dlib) são CPU puro. Rodando na thread da requisição,
+# um upload lento segura o worker do Flask e o servidor não usa todos os núcleos.
+#
+# Aqui eles rodam em processos separados, iniciados uma vez, que carregam os
+# modelos e fazem um aquecimento antes de receber trabalho:
+#   - a imagem vai para o processo por um segmento multiprocessing.shared_memory
+#     (uma cópia, sem pickle dos pixels); só os parâmetros e o resultado
+#     (caixas + encodings) passam pela fila;
+#   - a admissão é limitada (processos + max_fila tarefas ao mesmo tempo); com o
+#     pool saturado, enviar() levanta PoolSaturado e o endpoint responde 503 com
+#     Retry-After, em vez de empilhar requisições sem fim; uma tarefa que passa
+#     do timeout vira InferenciaExpirada (504, também com Retry-After);
+#   - estatisticas() informa a fila e a utilização de cada processo;
+#   - um processo que morre é substituído e a tarefa que ele fazia falha.
+#
+# Com processos=0 tudo roda na própria thread que chamou (útil para depurar).
+
+import atexit
+import collections
+import itertools
+import math
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturoExpirado
+from contextlib import contextmanager
+from multiprocessing import get_context, shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+import metricas
+
+OPERACOES = ('cadastro', 'checkin', 'grupo')
+
+
+class PoolSaturado(Exception):
+    """O pool já tem o máximo de tarefas em andamento"""
+
+    status = 503
+
+    def __init__(self, retry_after, mensagem=None):
+        super().__init__(mensagem or f"Pool de inferência saturado; tente de novo em {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferenciaExpirada(PoolSaturado):
+    """A tarefa não terminou dentro do timeout do pool (fila longa ou processo travado)"""
+
+    status = 504
+
+    def __init__(self, timeout, retry_after):
+        super().__init__(retry_after, f"Inferência passou de {timeout:g}s; tente de novo em {retry_after}s")
+
+
+# ==================== O TRABALHO (roda dentro dos processos) ====================
+
+def executar(operacao, imagem, parametros):
+    """
+    Detecção + escolha dos rostos + encoding para um endpoint.
+    Retorna um dict com 'caixas' (todas), 'nivel' (upsample usado),
+    'escolhidas' (as caixas codificadas), 'encodings' (k x 128 float32) e
+    'tempos' (lista de (etapa, segundos) medidos dentro do dlib).
+    """
+    import face_recognition
+    from deteccao import codificar_rostos, codificar_rostos_lote, escolher_rostos, localizar_rostos_adaptativo
+
+    # Os tempos do dlib são medidos aqui, no processo da inferência, e voltam no resultado
+    face_recognition.set_stage_timer(metricas.anotar_dlib)
+    with metricas.capturar() as tempos:
+        caixas, nivel = localizar_rostos_adaptativo(imagem, parametros['max_lado'], parametros['upsample'],
+                                                    parametros['rosto_minimo'])
+        if operacao == 'cadastro':
+            # O cadastro exige exatamente um rosto; com zero ou vários nem codifica
+            escolhidas = caixas if len(caixas) == 1 else []
+            encodings = codificar_rostos(imagem, escolhidas)
+        elif operacao == 'checkin':
+            escolhidas = escolher_rostos(caixas, imagem.shape, parametros.get('estrategia', 'maior'))
+            encodings = codificar_rostos(imagem, escolhidas)
+        elif operacao == 'grupo':
+            escolhidas = caixas
+            encodings = codificar_rostos_lote(imagem, escolhidas)
+        else:
+            raise ValueError(f"Operação inválida: {operacao}. Use uma de {OPERACOES}")
+
+    return {
+        'caixas': caixas,
+        'nivel': nivel,
+        'escolhidas': escolhidas,
+        'encodings': np.asarray(encodings, dtype=np.float32).reshape(-1, 128),
+        'tempos': tempos,
+    }
+
+
+def _aquecer():
+    """Carrega só os modelos do pipeline e roda o detector uma vez"""
+    from deteccao import carregar_modelos, localizar_rostos_adaptativo
+    inicio = time.perf_counter()
+    carregar_modelos()
+    localizar_rostos_adaptativo(np.zeros((64, 64, 3), dtype=np.uint8), 0, 0)
+    return time.perf_counter() - inicio
+
+
+def _trabalhar(conexao):
+    """Laço de um processo do pool: recebe tarefas e devolve resultados pela sua conexão"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # o Ctrl+C é tratado pelo servidor
+    duracao = _aquecer()
+    conexao.send(('pronto', os.getpid(), duracao))
+    while True:
+        try:
+            tarefa = conexao.recv()
+        except EOFError:
+            return
+        if tarefa is None:
+            return
+        id_tarefa, nome_shm, formato, operacao, parametros = tarefa
+        inicio = time.perf_counter()
+        try:
+            shm = shared_memory.SharedMemory(name=nome_shm)
+            try:
+                imagem = np.ndarray(formato, dtype=np.uint8, buffer=shm.buf)
+                resposta = (True, executar(operacao, imagem, parametros))
+                del imagem
+            finally:
+                shm.close()
+        except Exception as e:
+            resposta = (False, f"{type(e).__name__}: {e}")
+        conexao.send(('feito', id_tarefa) + resposta + (time.perf_counter() - inicio,))
+
+
+@contextmanager
+def _principal_neutro():
+    """
+    Com 'spawn', cada processo novo reimporta o módulo principal do pai; sendo
+    ele o main.py, isso recriaria o storage, o app etc. em cada processo. Durante
+    o start() o principal passa a ser este módulo, que só tem definições.
+    """
+    principal = sys.modules['__main__']
+    sys.modules['__main__'] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = principal
+
+
+# ==================== O POOL (roda no processo do servidor) ====================
+
+class _Worker:
+    """Um processo do pool, com a conexão exclusiva dele e a tarefa que está fazendo"""
+
+    __slots__ = ('processo', 'conexao', 'pronto', 'tarefa', 'ocupacao')
+
+    def __init__(self, processo, conexao):
+        self.processo = processo
+        self.conexao = conexao
+        self.pronto = False
+        self.tarefa = None     # id da tarefa em execução
+        self.ocupacao = 0.0    # segundos trabalhados
+
+
+class PoolInferencia:
+    """
+    Processos de inferência pré-aquecidos com admissão limitada.
+
+    Cada processo tem um Pipe só dele: o pool entrega uma tarefa por vez a cada
+    processo livre e guarda as demais em uma fila local. Assim um processo que
+    morre não deixa travas de uma fila compartilhada presas.
+    """
+
+    def __init__(self, processos=2, max_fila=16, timeout=30.0):
+        self.processos = processos
+        self.capacidade = processos + max_fila
+        self.timeout = timeout
+        self._admissao = threading.BoundedSemaphore(max(self.capacidade, 1))
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pendentes = {}          # id -> (Future, SharedMemory)
+        self._fila = collections.deque()  # tarefas aguardando um processo livre
+        self.rejeitadas = 0
+        self.concluidas = 0
+        self.falhas = 0
+        self._tempo_medio = 0.5       # média móvel do tempo por tarefa (s)
+        self._inicio = time.monotonic()
+        self._encerrado = False
+        self._workers = []
+
+        if processos <= 0:
+            # Sem processos, os modelos são carregados aqui mesmo, em segundo plano,
+            # para o servidor já atender rotas que não precisam deles (ex.: /users)
+            self._aquecido = threading.Event()
+            threading.Thread(target=self._aquecer_local, name="aquecimento", daemon=True).start()
+            return
+        self._ctx = get_context('spawn')
+        self._workers = [self._iniciar_worker() for _ in range(processos)]
+        self._coletor = threading.Thread(target=self._coletar, name="coletor-inferencia", daemon=True)
+        self._coletor.start()
+        atexit.register(self.encerrar)
+        print(f"✓ Pool de inferência: {processos} processo(s), até {self.capacidade} tarefas em andamento")
+
+    def _iniciar_worker(self):
+        nossa, deles = self._ctx.Pipe()
+        processo = self._ctx.Process(target=_trabalhar, args=(deles,), name="inferencia", daemon=True)
+        with _principal_neutro():
+            processo.start()
+        deles.close()
+        return _Worker(processo, nossa)
+
+    def _aquecer_local(self):
+        try:
+            print(f"✓ Modelos carregados em {_aquecer():.1f}s")
+        except Exception as e:
+            print(f"❌ Erro ao carregar os modelos: {e}")
+        else:
+            self._aquecido.set()
+
+    @property
+    def pronto(self):
+        """True quando o aquecimento (carga dos modelos) terminou em todos os processos"""
+        if self.processos <= 0:
+            return self._aquecido.is_set()
+        return all(w.pronto for w in self._workers)
+
+    # ---------- envio ----------
+
+    def _retry_after(self):
+        """Estimativa (s) de quando haverá vaga: tarefas em andamento / vazão do pool"""
+        vazao = max(self.processos, 1) / self._tempo_medio
+        return max(1, math.ceil(len(self._pendentes) / vazao))
+
+    def enviar(self, operacao, imagem, **parametros):
+        """Agenda uma tarefa e retorna um Future com o dict de executar()"""
+        if not self._admissao.acquire(blocking=False):
+            with self._lock:
+                self.rejeitadas += 1
+            raise PoolSaturado(self._retry_after())
+
+        if self.processos <= 0:
+            futuro = Future()
+            try:
+                futuro.set_result(executar(operacao, imagem, parametros))
+                self.concluidas += 1
+            except Exception as e:
+                self.falhas += 1
+                futuro.set_exception(e)
+            finally:
+                self._admissao.release()
+            return futuro
+
+        imagem = np.ascontiguousarray(imagem, dtype=np.uint8)
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=max(imagem.nbytes, 1))
+            destino = np.ndarray(imagem.shape, dtype=np.uint8, buffer=shm.buf)
+            destino[...] = imagem
+            del destino
+        except Exception:
+            self._admissao.release()
+            raise
+
+        futuro = Future()
+        id_tarefa = next(self._ids)
+        with self._lock:
+            self._pendentes[id_tarefa] = (futuro, shm)
+            self._fila.append((id_tarefa, shm.name, imagem.shape, operacao, parametros))
+            self._despachar()
+        return futuro
+
+    def processar(self, operacao, imagem, **parametros):
+        """enviar() + espera o resultado (até 'timeout' segundos, senão InferenciaExpirada)"""
+        futuro = self.enviar(operacao, imagem, **parametros)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoExpirado:
+            # A tarefa continua no pool (o resultado é descartado); só esta espera termina
+            with self._lock:
+                retry_after = self._retry_after()
+            raise InferenciaExpirada(self.timeout, retry_after) from None
+
+    def _despachar(self):
+        """Entrega tarefas da fila aos processos livres (chamado sob o lock)"""
+        for worker in self._workers:
+            if not self._fila:
+                return
+            if worker.pronto and worker.tarefa is None:
+                tarefa = self._fila.popleft()
+                worker.tarefa = tarefa[0]
+                try:
+                    worker.conexao.send(tarefa)
+                except (OSError, ValueError):
+                    # O processo morreu; a tarefa volta para a fila e o coletor o substitui
+                    worker.tarefa, worker.pronto = None, False
+                    self._fila.appendleft(tarefa)
+
+    # ---------- retorno ----------
+
+    def _finalizar(self, id_tarefa, ok, valor):
+        """Conclui o Future de uma tarefa e libera o segmento e a vaga (chamado sob o lock)"""
+        item = self._pendentes.pop(id_tarefa, None)
+        if item is None:
+            return
+        futuro, shm = item
+        shm.close()
+        shm.unlink()
+        self._admissao.release()
+        if ok:
+            self.concluidas += 1
+            futuro.set_result(valor)
+        else:
+            self.falhas += 1
+            futuro.set_exception(RuntimeError(f"Falha na inferência: {valor}"))
+
+    def _coletar(self):
+        while not self._encerrado:
+            conexoes = {w.conexao: w for w in self._workers}
+            sentinelas = {w.processo.sentinel: w for w in self._workers}
+            try:
+                prontos = wait(list(conexoes) + list(sentinelas), timeout=1.0)
+            except OSError:
+                continue
+            with self._lock:
+                for objeto in prontos:
+                    if objeto in conexoes:
+                        self._receber(conexoes[objeto])
+                for objeto in prontos:
+                    if objeto in sentinelas and not self._encerrado:
+                        self._substituir(sentinelas[objeto])
+                self._despachar()
+
+    def _receber(self, worker):
+        try:
+            mensagem = worker.conexao.recv()
+        except (EOFError, OSError):
+            return  # o processo morreu; a sentinela cuida disso
+        if mensagem[0] == 'pronto':
+            worker.pronto = True
+            print(f"✓ Processo de inferência pronto (pid {mensagem[1]}, aquecimento em {mensagem[2]:.1f}s)")
+            return
+        _, id_tarefa, ok, valor, duracao = mensagem
+        worker.tarefa = None
+        worker.ocupacao += duracao
+        self._tempo_medio = 0.9 * self._tempo_medio + 0.1 * duracao
+        self._finalizar(id_tarefa, ok, valor)
+
+    def _substituir(self, worker):
+        """Troca um processo que morreu (e falha a tarefa que ele estava fazendo)"""
+        print(f"⚠️  Processo de inferência terminou (código {worker.processo.exitcode}); reiniciando")
+        if worker.tarefa is not None:
+            self._finalizar(worker.tarefa, False, "o processo de inferência terminou")
+        worker.conexao.close()
+        novo = self._iniciar_worker()
+        novo.ocupacao = worker.ocupacao
+        self._workers[self._workers.index(worker)] = novo
+
+    # ---------- estado ----------
+
+    def estatisticas(self):
+        decorrido = max(time.monotonic() - self._inicio, 1e-9)
+        with self._lock:
+            return {
+                "processos": self.processos,
+                "pronto": self.pronto,
+                "prontos": sum(w.pronto for w in self._workers),
+                "capacidade": self.capacidade,
+                "em_andamento": len(self._pendentes),
+                "fila": len(self._fila),
+                "concluidas": self.concluidas,
+                "falhas": self.falhas,
+                "rejeitadas": self.rejeitadas,
+                "tempo_medio_ms": round(self._tempo_medio * 1000, 1),
+                "utilizacao": [round(w.ocupacao / decorrido, 4) for w in self._workers],
+            }
+
+    def encerrar(self):
+        """Para os processos (as tarefas pendentes falham)"""
+        if self._encerrado or self.processos <= 0:
+            return
+        self._encerrado = True
+        self._coletor.join(timeout=2)
+        for worker in self._workers:
+            try:
+                worker.conexao.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.processo.join(timeout=5)
+            if worker.processo.is_alive():
+                worker.processo.terminate()
+        with self._lock:
+            self._fila.clear()
+            for id_tarefa in list(self._pendentes):
+                self._finalizar(id_tarefa, False, "pool encerrado")
@@ -0,0 +1,378 @@
+# ==================== ÍNDICE IVF (BUSCA APROXIMADA) ====================
+# Com 100 mil+ rostos cadastrados, a busca exata compara o rosto enviado com
+# todos os vetores da galeria a cada check-in. O índice IVF ("inverted file")
+# divide a galeria em células com k-means; cada célula tem uma lista com as
+# linhas da galeria mais próximas do seu centróide. Na busca, só as 'nprobe'
+# células mais próximas do rosto são comparadas.
+#
+# Uso offline (reconstruir os centróides / relatório recall x latência):
+#   python ivf.py treinar   --db faces.db --saida face-models/ivf_centroides.npz
+#   python ivf.py relatorio --sintetico 100000
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from galeria import DIMENSAO
+from matcher import TOLERANCIA_PADRAO, MatcherExato, distancias_lote, montar_resultado
+
+BLOCO_ATRIBUICAO = 8192  # linhas por bloco ao atribuir vetores às células (limita a memória)
+
+
+def atribuir(dados, centroides):
+    """Retorna, para cada linha de 'dados', o índice do centróide mais próximo"""
+    normas2 = np.einsum('ij,ij->i', centroides, centroides)
+    atribuicao = np.empty(len(dados), dtype=np.int32)
+    for inicio in range(0, len(dados), BLOCO_ATRIBUICAO):
+        bloco = np.ascontiguousarray(dados[inicio:inicio + BLOCO_ATRIBUICAO], dtype=np.float32)
+        # ||c||² - 2 x·c basta para o argmin (||x||² é constante na linha)
+        d = normas2 - 2 * (bloco @ centroides.T)
+        atribuicao[inicio:inicio + len(bloco)] = np.argmin(d, axis=1)
+    return atribuicao
+
+
+def kmeans(dados, k, iteracoes=20, amostra=256 * 1024, seed=0):
+    """K-means simples em NumPy. Treina sobre no máximo 'amostra' vetores."""
+    rng = np.random.default_rng(seed)
+    dados = np.asarray(dados, dtype=np.float32)
+    if len(dados) > amostra:
+        dados = dados[rng.choice(len(dados), amostra, replace=False)]
+    k = min(k, len(dados))
+
+    centroides = dados[rng.choice(len(dados), k, replace=False)].copy()
+    for _ in range(iteracoes):
+        atribuicao = atribuir(dados, centroides)
+        ordem = np.argsort(atribuicao, kind='stable')
+        contagem = np.bincount(atribuicao, minlength=k)
+        inicios = np.concatenate(([0], np.cumsum(contagem)[:-1]))
+
+        nao_vazias = contagem > 0
+        somas = np.add.reduceat(dados[ordem], inicios[nao_vazias], axis=0)
+        centroides[nao_vazias] = somas / contagem[nao_vazias, None]
+
+        # Células vazias recebem um vetor aleatório para não desperdiçar centróides
+        vazias = np.flatnonzero(~nao_vazias)
+        if len(vazias):
+            centroides[vazias] = dados[rng.choice(len(dados), len(vazias), replace=False)]
+    return centroides
+
+
+def salvar_npz(caminho, **arrays):
+    """np.savez em um arquivo temporário + troca atômica (vários processos podem salvar ao mesmo tempo)"""
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporario, caminho)
+
+
+def nlist_padrao(n):
+    """Número de células sugerido para uma galeria com n rostos (~4 * raiz de n)"""
+    return max(1, int(4 * np.sqrt(n)))
+
+
+class TarefaSegundoPlano:
+    """
+    Roda uma função pesada (treino, reconstrução de índice) em uma thread, uma
+    execução por vez: pedidos feitos enquanto ela roda são ignorados. Quem pediu
+    não espera; as buscas seguem pelo caminho exato até a estrutura ficar pronta.
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self._iniciar()
+        if hasattr(os, 'register_at_fork'):
+            # A thread não sobrevive ao fork (servidor.py): sem isso, um filho criado
+            # durante um treino herdaria _rodando=True e nunca mais dispararia nada
+            os.register_at_fork(after_in_child=self._iniciar)
+
+    def _iniciar(self):
+        self._lock = threading.Lock()
+        self._rodando = False
+
+    @property
+    def rodando(self):
+        return self._rodando
+
+    def iniciar(self, funcao, *args):
+        """Dispara funcao(*args) se nada estiver rodando. Retorna True se disparou."""
+        with self._lock:
+            if self._rodando:
+                return False
+            self._rodando = True
+        threading.Thread(target=self._executar, args=(funcao, args), name=self.nome, daemon=True).start()
+        return True
+
+    def _executar(self, funcao, args):
+        try:
+            funcao(*args)
+        except Exception as e:
+            print(f"⚠️  Erro em {self.nome}: {e}")
+        finally:
+            with self._lock:
+                self._rodando = False
+
+
+class EstadoIVF:
+    """Estado imutável do índice, correspondente a uma versão da galeria"""
+
+    __slots__ = ('versao', 'listas')
+
+    def __init__(self, versao, listas):
+        self.versao = versao
+        self.listas = listas  # tupla com um array int64 de linhas da galeria por célula
+
+
+class IndiceIVF:
+    """
+    Índice IVF sobre a galeria.
+
+    Os centróides são treinados uma vez (treinar() ou carregados de arquivo);
+    as listas acompanham a galeria. Quando registrado com galeria.observar(),
+    cadastros e remoções atualizam as listas de forma incremental. Cada
+    atualização publica um EstadoIVF novo, então buscas em andamento nunca
+    veem listas pela metade. Treino e reconstruções completas pedidos pelo
+    MatcherIVF rodam em segundo plano ('tarefa').
+    """
+
+    def __init__(self, centroides=None):
+        self.centroides = None if centroides is None else np.ascontiguousarray(centroides, dtype=np.float32)
+        self.estado = None
+        self.incremental = False  # True quando recebe avisos da galeria
+        self.tarefa = TarefaSegundoPlano("índice IVF")
+        self._lock = threading.Lock()
+
+    @property
+    def treinado(self):
+        return self.centroides is not None
+
+    # ---------- treino / persistência ----------
+
+    def treinar(self, matriz, nlist=None, iteracoes=20):
+        """Treina os centróides com k-means sobre a galeria"""
+        nlist = nlist or nlist_padrao(len(matriz))
+        inicio = time.perf_counter()
+        self.centroides = kmeans(matriz, nlist, iteracoes)
+        print(f"✓ IVF treinado: {len(self.centroides)} células em {time.perf_counter() - inicio:.1f}s")
+
+    def salvar(self, caminho):
+        salvar_npz(caminho, centroides=self.centroides)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as dados:
+            return cls(dados['centroides'])
+
+    # ---------- sincronização com a galeria ----------
+
+    def reconstruir_listas(self, snapshot):
+        """Atribui todas as linhas do snapshot às células; só publica se ele for mais novo que o estado atual"""
+        estado = self._montar_estado(snapshot.versao, atribuir(snapshot.vetores(), self.centroides))
+        with self._lock:
+            if self.estado is None or self.estado.versao < snapshot.versao:
+                self.estado = estado
+
+    def _montar_estado(self, versao, atribuicao):
+        ordem = np.argsort(atribuicao, kind='stable')
+        contagem = np.bincount(atribuicao, minlength=len(self.centroides))
+        listas = tuple(np.split(ordem.astype(np.int64), np.cumsum(contagem)[:-1]))
+        return EstadoIVF(versao, listas)
+
+    def ao_mudar_galeria(self, evento, snapshot, indice):
+        """Callback para GaleriaMemoria.observar()"""
+        self.incremental = True
+        if not self.treinado:
+            return
+        with self._lock:
+            estado = self.estado
+            # Só aplica a mudança sobre a versão imediatamente anterior; senão reatribui tudo
+            if evento == 'carregar' or estado is None or estado.versao != snapshot.versao - 1:
+                self.estado = self._montar_estado(snapshot.versao, atribuir(snapshot.vetores(), self.centroides))
+            elif evento == 'adicionar':
+                celula = int(atribuir(snapshot.vetores(slice(indice, indice + 1)), self.centroides)[0])
+                listas = list(estado.listas)
+                listas[celula] = np.append(listas[celula], indice)
+                self.estado = EstadoIVF(snapshot.versao, tuple(listas))
+            elif evento == 'remover':
+                # A galeria remove a linha e desloca as seguintes uma posição para cima
+                listas = []
+                for lista in estado.listas:
+                    lista = lista[lista != indice]
+                    listas.append(lista - (lista > indice))
+                self.estado = EstadoIVF(snapshot.versao, tuple(listas))
+
+    # ---------- busca ----------
+
+    def candidatos(self, encoding, nprobe, estado):
+        """Linhas da galeria nas 'nprobe' células mais próximas do encoding"""
+        encoding = np.asarray(encoding, dtype=np.float32)
+        d = np.einsum('ij,ij->i', self.centroides, self.centroides) - 2 * (self.centroides @ encoding)
+        nprobe = min(nprobe, len(d))
+        celulas = np.argpartition(d, nprobe - 1)[:nprobe]
+        return np.concatenate([estado.listas[c] for c in celulas])
+
+
+class MatcherIVF:
+    """
+    Matcher que usa o IVF quando a galeria passa de 'limiar' rostos.
+    Abaixo disso (ou sem índice pronto para a versão da galeria) usa a busca exata.
+
+    Se a galeria passa do limiar sem centróides, eles são treinados em segundo
+    plano na primeira busca (e ao_treinar(indice) é chamado, ex.: para salvá-los).
+
+    Observação: 'dentro_tolerancia' considera só as células visitadas.
+    """
+
+    def __init__(self, indice, tolerancia=TOLERANCIA_PADRAO, k=5, nprobe=8, limiar=20000, fonte_exata=None,
+                 ao_treinar=None):
+        self.indice = indice
+        self.tolerancia = tolerancia
+        self.k = k
+        self.nprobe = nprobe
+        self.limiar = limiar
+        self.ao_treinar = ao_treinar
+        self.exato = MatcherExato(tolerancia, k, fonte_exata=fonte_exata)
+
+    def buscar(self, snapshot, encoding):
+        estado = self._estado_para(snapshot)
+        if estado is None:
+            return self.exato.buscar(snapshot, encoding)
+
+        linhas = self.indice.candidatos(encoding, self.nprobe, estado)
+        dists = distancias_lote(snapshot.vetores(linhas), snapshot.normas2[linhas], encoding)[0]
+        dists = self.exato.refinar(snapshot, dists, encoding, indices=linhas)
+        return montar_resultado(snapshot.metadados, dists, self.tolerancia, self.k, indices=linhas)
+
+    def buscar_lote(self, snapshot, encodings):
+        """Vários encodings: um produto de matrizes na busca exata, uma busca por vez na aproximada"""
+        if self._estado_para(snapshot) is None:
+            return self.exato.buscar_lote(snapshot, encodings)
+        return [self.buscar(snapshot, encoding) for encoding in encodings]
+
+    def _estado_para(self, snapshot):
+        if len(snapshot) < self.limiar:
+            return None
+        if not self.indice.treinado:
+            self.indice.tarefa.iniciar(self._treinar, snapshot)
+            return None
+        estado = self.indice.estado
+        if estado is not None and estado.versao == snapshot.versao:
+            return estado
+        if self.indice.incremental and estado is not None:
+            return None  # a galeria acabou de mudar; o aviso chega em instantes
+        # Sem avisos (ex.: galeria mapeada de outro processo) ou recém-treinado:
+        # reatribui tudo em segundo plano; até terminar, as buscas são exatas
+        self.indice.tarefa.iniciar(self.indice.reconstruir_listas, snapshot)
+        return None
+
+    def _treinar(self, snapshot):
+        print(f"⚠️  Galeria com {len(snapshot)} rostos e IVF sem centróides: treinando em segundo plano")
+        self.indice.treinar(snapshot.vetores())
+        if self.ao_treinar is not None:
+            self.ao_treinar(self.indice)
+
+
+# ==================== RELATÓRIO RECALL x LATÊNCIA ====================
+
+def galeria_sintetica(n, pessoas=None, seed=0):
+    """
+    Gera n encodings sintéticos agrupados por "pessoa" (centro + ruído), com
+    distâncias intra/inter-pessoa na mesma faixa dos encodings do dlib.
+    """
+    rng = np.random.default_rng(seed)
+    pessoas = pessoas or n
+    centros = rng.normal(0, 0.09, (pessoas, DIMENSAO)).astype(np.float32)
+    dono = rng.integers(0, pessoas, n) if pessoas < n else np.arange(n)
+    return centros[dono] + rng.normal(0, 0.02, (n, DIMENSAO)).astype(np.float32)
+
+
+def relatorio_recall(matriz, consultas, nprobes=(1, 2, 4, 8, 16, 32), nlist=None, tolerancia=TOLERANCIA_PADRAO):
+    """
+    Compara o IVF com a busca exata para cada nprobe.
+    recall@1: mesmo vizinho mais próximo; decisao: mesma decisão de match (<= tolerância).
+    """
+    from galeria import GaleriaMemoria
+
+    galeria = GaleriaMemoria()
+    metadados = tuple({'nome': str(i), 'data_cadastro': 'N/A', 'arquivo': str(i)} for i in range(len(matriz)))
+    galeria.carregar_matriz(matriz, metadados)
+    snapshot = galeria.snapshot()
+
+    indice = IndiceIVF()
+    indice.treinar(snapshot.matriz, nlist)
+    galeria.observar(indice.ao_mudar_galeria)
+
+    def medir(matcher):
+        resultados, tempos = [], []
+        for q in consultas:
+            inicio = time.perf_counter()
+            resultados.append(matcher.buscar(snapshot, q))
+            tempos.append(time.perf_counter() - inicio)
+        return resultados, np.array(tempos) * 1000
+
+    exatos, tempos_exato = medir(MatcherExato(tolerancia, k=1))
+    linhas = [{'nprobe': 'exato', 'recall@1': 1.0, 'decisao': 1.0,
+               'ms_medio': float(tempos_exato.mean()), 'ms_p95': float(np.percentile(tempos_exato, 95))}]
+    for nprobe in nprobes:
+        aproximados, tempos = medir(MatcherIVF(indice, tolerancia, k=1, nprobe=nprobe, limiar=0))
+        linhas.append({
+            'nprobe': nprobe,
+            'recall@1': float(np.mean([a.indice == e.indice for a, e in zip(aproximados, exatos)])),
+            'decisao': float(np.mean([_decisao(a) == _decisao(e) for a, e in zip(aproximados, exatos)])),
+            'ms_medio': float(tempos.mean()),
+            'ms_p95': float(np.percentile(tempos, 95)),
+        })
+    return linhas
+
+
+def _decisao(resultado):
+    return resultado.indice if resultado.encontrado else None
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Índice IVF da galeria de rostos")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_treinar = sub.add_parser('treinar', help="treina os centróides a partir do faces.db")
+    p_treinar.add_argument('--db', default='faces.db')
+    p_treinar.add_argument('--saida', default='face-models/ivf_centroides.npz')
+    p_treinar.add_argument('--nlist', type=int, default=None)
+
+    p_rel = sub.add_parser('relatorio', help="recall x latência contra a busca exata")
+    p_rel.add_argument('--db', default=None, help="usa a galeria do banco em vez de dados sintéticos")
+    p_rel.add_argument('--sintetico', type=int, default=100000, help="tamanho da galeria sintética")
+    p_rel.add_argument('--consultas', type=int, default=500)
+    p_rel.add_argument('--nlist', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.comando == 'treinar':
+        from banco import BancoRostos
+        matriz, _ = BancoRostos(args.db).carregar_galeria()
+        indice = IndiceIVF()
+        indice.treinar(matriz, args.nlist)
+        indice.salvar(args.saida)
+        print(f"✓ Centróides salvos em {args.saida}")
+        return
+
+    if args.db:
+        from banco import BancoRostos
+        matriz, _ = BancoRostos(args.db).carregar_galeria()
+    else:
+        matriz = galeria_sintetica(args.sintetico, pessoas=args.sintetico // 2)
+
+    # Consultas: rostos da galeria com ruído (mesma pessoa, outra foto)
+    rng = np.random.default_rng(1)
+    consultas = matriz[rng.integers(0, len(matriz), args.consultas)]
+    consultas = consultas + rng.normal(0, 0.02, consultas.shape).astype(np.float32)
+
+    print(f"Galeria: {len(matriz)} rostos, {len(consultas)} consultas, tolerância {TOLERANCIA_PADRAO}")
+    print(f"{'nprobe':>7} {'recall@1':>9} {'decisão':>8} {'ms médio':>9} {'ms p95':>8}")
+    for linha in relatorio_recall(matriz, consultas, nlist=args.nlist):
+        print(f"{linha['nprobe']:>7} {linha['recall@1']:>9.3f} {linha['decisao']:>8.3f} "
+              f"{linha['ms_medio']:>9.3f} {linha['ms_p95']:>8.3f}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,19 +1,131 @@
 ﻿# ==================== IMPORTAÇÕES ====================
 # Instalar bibliotecas:
-# pip install flask flask-cors face-recognition numpy pillow opencv-python
+# pip install flask flask-cors face-recognition numpy pillow
 
-import face_recognition
-import cv2  # Usado apenas para salvar/ler imagens, não para UI
-import numpy as np
-import pickle
 import os
-from PIL import Image  # Melhor para ler streams de imagem do que OpenCV
+import base64
+import io
+import json
+import sqlite3
+import threading
 from datetime import datetime
 
 # Importações do Flask
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 
+import metricas
+from agendador import AgendadorLote
+from banco import BancoRostos
+from cache import CacheResultados, chave_conteudo
+from chamada import identificar_grupo
+from deteccao import ESTRATEGIAS
+from imagem import carregar_imagem
+from fotos import GravadorFotos
+from inferencia import PoolInferencia, PoolSaturado
+from galeria import GaleriaMemoria
+from ivf import IndiceIVF, MatcherIVF
+from pq import CodecPQ, CodigosGaleria, MatcherPQ
+from quente import MatcherQuente
+from memoria_compartilhada import GaleriaCompartilhada
+from snapshot_mmap import GaleriaMapeada
+
+# ==================== CONFIGURAÇÃO ====================
+# Ao rodar com vários processos (ex.: gunicorn -w 4), aponte GALERIA_SNAPSHOT_DIR
+# para uma pasta local: todos os workers passam a compartilhar um único snapshot
+# da galeria mapeado em memória, em vez de cada um guardar sua própria cópia.
+GALERIA_SNAPSHOT_DIR = os.environ.get("GALERIA_SNAPSHOT_DIR", "")
+
+# Alternativa ao snapshot em arquivo: com GALERIA_SHM definido (prefixo dos
+# segmentos, ex.: "pyface_galeria"), a matriz da galeria fica em memória
+# compartilhada. O primeiro processo (de preferência o master, com preload)
+# vira o coordenador; os workers só anexam os segmentos para leitura.
+GALERIA_SHM = os.environ.get("GALERIA_SHM", "")
+
+# Precisão dos encodings na galeria em memória: "float32", "float16" ou "int8".
+# Vazio = usa a precisão gravada no banco (float32 na primeira execução).
+GALERIA_PRECISAO = os.environ.get("GALERIA_PRECISAO", "")
+
+# Quantas entradas recentes do journal de mudanças manter ao compactá-lo
+JOURNAL_MANTER = int(os.environ.get("JOURNAL_MANTER", "10000"))
+
+# Tipo de busca aproximada para galerias grandes: "ivf" ou "pq" (quantização por produto).
+BUSCA_APROXIMADA = os.environ.get("BUSCA_APROXIMADA", "ivf")
+
+# Busca aproximada (IVF): usada quando a galeria tem pelo menos IVF_LIMIAR rostos.
+# IVF_NPROBE = quantas células visitar por busca (mais = mais preciso e mais lento).
+# Sem IVF_CENTROIDES, os centróides são treinados em segundo plano (e salvos) na
+# primeira vez que a galeria passa do limiar; até lá a busca é exata.
+# Os centróides podem ser reconstruídos offline com: python ivf.py treinar
+IVF_LIMIAR = int(os.environ.get("IVF_LIMIAR", "20000"))
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", "8"))
+IVF_CENTROIDES = os.environ.get("IVF_CENTROIDES", os.path.join("face-models", "ivf_centroides.npz"))
+
+# Quantização por produto (PQ): PQ_M bytes por rosto em memória; os PQ_RERANK
+# melhores candidatos são reordenados com a distância exata. Com a galeria em
+# memória e codebooks treinados, ela guarda só os códigos (os vetores exatos dos
+# candidatos são lidos do faces.db), ignorando GALERIA_PRECISAO.
+# Sem PQ_CODEBOOK, os codebooks são treinados em segundo plano (e salvos) na
+# primeira vez que a galeria passa de PQ_LIMIAR; até lá a busca é exata.
+# Os codebooks podem ser reconstruídos offline com: python pq.py treinar
+PQ_LIMIAR = int(os.environ.get("PQ_LIMIAR", "20000"))
+PQ_M = int(os.environ.get("PQ_M", "16"))
+PQ_RERANK = int(os.environ.get("PQ_RERANK", "64"))
+PQ_CODEBOOK = os.environ.get("PQ_CODEBOOK", os.path.join("face-models", "pq_codebook.npz"))
+
+# Fotos do cadastro são gravadas em segundo plano, fora da latência do /register.
+# FOTOS_FILA = quantas fotos podem esperar na fila (cheia = grava na própria requisição).
+FOTOS_FILA = int(os.environ.get("FOTOS_FILA", "64"))
+FOTOS_THREADS = int(os.environ.get("FOTOS_THREADS", "2"))
+
+# A detecção de rostos roda em uma cópia com o maior lado <= DETECCAO_MAX_LADO
+# (0 = resolução original); o encoding usa a imagem decodificada, sem redução extra.
+# Fotos JPEG grandes já são decodificadas reduzidas (1/2, 1/4 ou 1/8), mas nunca
+# abaixo de DETECCAO_MAX_LADO no maior lado (ver imagem.py).
+# Para escolher o valor: python deteccao.py benchmark pasta_de_fotos
+DETECCAO_MAX_LADO = int(os.environ.get("DETECCAO_MAX_LADO", "1024"))
+# Upsample adaptativo: começa em 0 e sobe até DETECCAO_UPSAMPLE só quando não acha
+# rostos ou quando eles têm menos de DETECCAO_ROSTO_MINIMO px (na imagem da detecção).
+DETECCAO_UPSAMPLE = int(os.environ.get("DETECCAO_UPSAMPLE", "2"))
+DETECCAO_ROSTO_MINIMO = int(os.environ.get("DETECCAO_ROSTO_MINIMO", "100"))
+
+# Qual rosto o /checkin usa quando a foto tem vários: "maior", "central" ou "todos".
+# Só os rostos escolhidos passam pelo encoder (a parte cara depois da detecção).
+CHECKIN_ESTRATEGIA = os.environ.get("CHECKIN_ESTRATEGIA", "maior")
+
+# Chamada por foto de grupo (/checkin/grupo): fotos da turma têm rostos pequenos,
+# então a detecção usa uma imagem maior que a do /checkin individual.
+GRUPO_MAX_LADO = int(os.environ.get("GRUPO_MAX_LADO", "2048"))
+
+# Detecção e encoding rodam em INFERENCIA_PROCESSOS processos separados (0 = na
+# própria thread da requisição). Até INFERENCIA_FILA tarefas esperam por um
+# processo livre; além disso o servidor responde 503 com Retry-After. Uma tarefa
+# que passa de INFERENCIA_TIMEOUT segundos responde 504, também com Retry-After.
+# O servidor.py sempre usa 0 (inferência nos workers; ver o cabeçalho dele).
+INFERENCIA_PROCESSOS = int(os.environ.get("INFERENCIA_PROCESSOS", str(min(4, os.cpu_count() or 1))))
+INFERENCIA_FILA = int(os.environ.get("INFERENCIA_FILA", "16"))
+INFERENCIA_TIMEOUT = float(os.environ.get("INFERENCIA_TIMEOUT", "30"))
+
+# Micro-lotes no /checkin: encodings de requisições simultâneas esperam até
+# LOTE_JANELA_MS (ou até juntar LOTE_MAXIMO) e são comparados com a galeria de
+# uma vez. LOTE_JANELA_MS=0 desliga (cada requisição busca sozinha).
+LOTE_JANELA_MS = float(os.environ.get("LOTE_JANELA_MS", "2"))
+LOTE_MAXIMO = int(os.environ.get("LOTE_MAXIMO", "32"))
+
+# Cache do /checkin pelo conteúdo da foto: um reenvio dos mesmos bytes reaproveita
+# as caixas/encodings e, se a galeria não mudou, o próprio resultado da busca.
+# Até CACHE_CHECKIN_ITENS fotos por CACHE_CHECKIN_TTL segundos (0 itens = desligado).
+CACHE_CHECKIN_ITENS = int(os.environ.get("CACHE_CHECKIN_ITENS", "1024"))
+CACHE_CHECKIN_TTL = float(os.environ.get("CACHE_CHECKIN_TTL", "60"))
+
+# Conjunto quente do /checkin: as últimas QUENTE_CAPACIDADE pessoas reconhecidas são
+# comparadas antes da galeria inteira; o match só vale se a distância for
+# <= 0.6 - QUENTE_MARGEM e o segundo do conjunto quente estiver QUENTE_FOLGA mais
+# longe (senão, busca completa). QUENTE_CAPACIDADE=0 desliga.
+QUENTE_CAPACIDADE = int(os.environ.get("QUENTE_CAPACIDADE", "512"))
+QUENTE_MARGEM = float(os.environ.get("QUENTE_MARGEM", "0.3"))
+QUENTE_FOLGA = float(os.environ.get("QUENTE_FOLGA", "0.1"))
+
 # ==================== CONFIGURAÇÃO DO APP FLASK ====================
 app = Flask(__name__)
 CORS(app)
@@ -23,75 +135,138 @@ CORS(app)
 # (Sua classe estava ótima, quase não mudei nada)
 
 class FaceStorage:
-    """Classe para gerenciar o armazenamento de rostos em arquivos"""
+    """Classe para gerenciar o armazenamento de rostos (SQLite + fotos em arquivo)"""
 
-    def __init__(self, models_dir="face-models"):
+    def __init__(self, models_dir="face-models", db_path="faces.db", snapshot_dir=None, precisao=None,
+                 prefixo_shm=None, codec_pq=None):
         self.models_dir = models_dir
         self.fotos_dir = os.path.join(models_dir, "fotos")
         self.encodings_dir = os.path.join(models_dir, "encodings")
         self.create_directories()
-        print(f"✓ Storage inicializado. Pastas em: {self.models_dir}")
+        self.fotos = GravadorFotos(max_fila=FOTOS_FILA, threads=FOTOS_THREADS)
+
+        # Encodings ficam no faces.db; os .pkl antigos são importados na primeira execução
+        self.banco = BancoRostos(db_path, encodings_dir=self.encodings_dir)
+        self._lock_sync = threading.Lock()
+        self._seq = 0
+
+        # Galeria residente: carregada uma vez e atualizada a cada cadastro/remoção.
+        # Com snapshot_dir, fica em um arquivo mapeado e compartilhado entre processos;
+        # com prefixo_shm, em segmentos de memória compartilhada.
+        if snapshot_dir:
+            self.galeria = GaleriaMapeada(self.banco, snapshot_dir)
+        elif prefixo_shm:
+            self.galeria = GaleriaCompartilhada(self.banco, prefixo_shm)
+        elif codec_pq is not None and codec_pq.treinado:
+            # Busca PQ: só os códigos ficam em memória
+            self.galeria = GaleriaMemoria(precisao='pq', codec=codec_pq)
+            self._recarregar_galeria()
+        else:
+            # A precisão escolhida fica registrada no banco
+            precisao = precisao or self.banco.configuracao('precisao_galeria', 'float32')
+            self.banco.definir_configuracao('precisao_galeria', precisao)
+            self.galeria = GaleriaMemoria(precisao=precisao)
+            self._recarregar_galeria()
+        print(f"✓ Storage inicializado. Banco: {db_path}, fotos em: {self.fotos_dir} "
+              f"({len(self.galeria.snapshot())} usuários em memória)")
 
     def create_directories(self):
         """Cria as pastas necessárias se não existirem"""
         os.makedirs(self.models_dir, exist_ok=True)
         os.makedirs(self.fotos_dir, exist_ok=True)
-        os.makedirs(self.encodings_dir, exist_ok=True)
 
-    def adicionar_usuario(self, nome, encoding, foto_array):
-        """Salva o encoding e a foto do usuário"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # ---------- sincronização da galeria em memória com o journal ----------
+
+    def _recarregar_galeria(self):
+        """Carga completa da galeria em memória, guardando até qual seq do journal ela vai"""
+        matriz, metadados, self._seq = self.banco.carregar_galeria_com_seq()
+        self.galeria.carregar_matriz(matriz, metadados)
+
+    def sincronizar(self):
+        """
+        Aplica na galeria em memória só as mudanças do journal que ela ainda não viu
+        (inclusive as feitas por outros processos). Custo O(mudanças), não O(usuários).
+        As galerias mapeada/compartilhada se atualizam sozinhas.
+        """
+        if not isinstance(self.galeria, GaleriaMemoria) or self.banco.ultimo_seq() == self._seq:
+            return
+        with self._lock_sync:
+            mudancas = self.banco.mudancas_desde(self._seq)
+            if mudancas is None:
+                # O journal foi compactado além do que vimos: recarrega tudo
+                print("⚠️  Journal compactado além da última sincronização; recarregando a galeria")
+                self._recarregar_galeria()
+                return
+            for seq, operacao, arquivo, nome, data_cadastro, encoding in mudancas:
+                if operacao == 'adicionar':
+                    self.galeria.adicionar({'nome': nome, 'encoding': encoding,
+                                            'data_cadastro': data_cadastro, 'arquivo': arquivo})
+                else:
+                    self.galeria.remover(arquivo)
+                self._seq = seq
+
+    def snapshot(self):
+        """Visão atual e sincronizada da galeria"""
+        self.sincronizar()
+        return self.galeria.snapshot()
+
+    def _apos_escrita(self):
+        """Propaga uma escrita no banco para a galeria e compacta o journal quando preciso"""
+        if isinstance(self.galeria, GaleriaMemoria):
+            self.sincronizar()
+        self.banco.compactar_journal(JOURNAL_MANTER)
+
+    def adicionar_usuario(self, nome, encoding, foto):
+        """Salva o encoding e agenda a gravação da foto do usuário (bytes enviados ou array RGB)"""
+        agora = datetime.now()
+        # Microssegundos no timestamp: dois cadastros do mesmo nome no mesmo segundo
+        # não colidem no índice único de 'arquivo'
+        timestamp = agora.strftime("%Y%m%d_%H%M%S_%f")
         base_filename = f"{nome.lower().replace(' ', '_')}_{timestamp}"
+        data_cadastro = agora.strftime("%Y-%m-%d %H:%M:%S")
+        # O ID público mantém o formato antigo ("<nome>_<timestamp>.pkl"), que os clientes já usam
+        arquivo = f"{base_filename}.pkl"
+
+        # Grava o encoding no banco (transação curta, com entrada no journal)
+        foto_path = os.path.join(self.fotos_dir, f"{base_filename}.jpg")
+        self.banco.inserir(nome, encoding, foto_path, data_cadastro, arquivo)
 
-        # Salva o encoding como arquivo pickle
-        encoding_path = os.path.join(self.encodings_dir, f"{base_filename}.pkl")
-        with open(encoding_path, 'wb') as f:
-            pickle.dump({
+        # Só depois do COMMIT a foto vai para a fila do gravador (o JPEG é gerado
+        # fora da requisição): um cadastro recusado pelo banco nunca toca em foto_path
+        self.fotos.enfileirar(foto_path, foto)
+
+        # Atualiza a galeria: a em memória aplica o journal; as compartilhadas republicam
+        if not isinstance(self.galeria, GaleriaMemoria):
+            self.galeria.adicionar({
                 'nome': nome,
                 'encoding': encoding,
-                'data_cadastro': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }, f)
-
-        # Salva a foto
-        foto_path = os.path.join(self.fotos_dir, f"{base_filename}.jpg")
-        cv2.imwrite(foto_path, foto_array)  # cv2.imwrite é ótimo para isso
+                'data_cadastro': data_cadastro,
+                'arquivo': arquivo
+            })
+        self._apos_escrita()
 
-        print(f"✓ Usuário '{nome}' cadastrado com sucesso!")
-        return {"status": "success", "nome": nome, "arquivo_pkl": f"{base_filename}.pkl"}
+        print(f"✓ Usuário '{nome}' cadastrado com sucesso! (fotos na fila: {self.fotos.profundidade})")
+        return {"status": "success", "nome": nome, "arquivo_pkl": arquivo,
+                "fotos_na_fila": self.fotos.profundidade}
 
     def carregar_todos_usuarios(self):
         """Carrega todos os encodings salvos"""
-        usuarios = []
-        if not os.path.exists(self.encodings_dir):
-            return usuarios
-
-        for filename in os.listdir(self.encodings_dir):
-            if filename.endswith('.pkl'):
-                filepath = os.path.join(self.encodings_dir, filename)
-                try:
-                    with open(filepath, 'rb') as f:
-                        data = pickle.load(f)
-                        usuarios.append({
-                            'nome': data['nome'],
-                            'encoding': data['encoding'],
-                            'data_cadastro': data.get('data_cadastro', 'N/A'),
-                            'arquivo': filename
-                        })
-                except Exception as e:
-                    print(f"⚠️  Erro ao carregar {filename}: {e}")
-        return usuarios
+        matriz, metadados = self.banco.carregar_galeria()
+        return [dict(m, encoding=encoding) for m, encoding in zip(metadados, matriz)]
 
     # Este método agora é chamado pela API, não tem mais o decorator @app.route
     def remover_usuario(self, arquivo):
-        """Remove um usuário pelo nome do arquivo pkl"""
-        encoding_path = os.path.join(self.encodings_dir, arquivo)
-
-        if os.path.exists(encoding_path):
-            os.remove(encoding_path)
-            base_name = arquivo.replace('.pkl', '')
-            foto_path = os.path.join(self.fotos_dir, f"{base_name}.jpg")
-            if os.path.exists(foto_path):
+        """Remove um usuário pelo ID ('arquivo')"""
+        foto_path = self.banco.remover(arquivo)
+
+        if foto_path is not None:
+            # A foto pode ainda estar na fila do gravador
+            self.fotos.esperar()
+            if foto_path and os.path.exists(foto_path):
                 os.remove(foto_path)
+            if not isinstance(self.galeria, GaleriaMemoria):
+                self.galeria.remover(arquivo)
+            self._apos_escrita()
             print(f"✓ Usuário removido: {arquivo}")
             return True
         else:
@@ -101,7 +276,87 @@ class FaceStorage:
 
 # ==================== INSTÂNCIA GLOBAL DO STORAGE ====================
 # Cria uma instância única da classe para ser usada pelos endpoints
-storage = FaceStorage()
+codec_pq = None
+if BUSCA_APROXIMADA == "pq":
+    codec_pq = CodecPQ.carregar(PQ_CODEBOOK) if os.path.exists(PQ_CODEBOOK) else CodecPQ(m=PQ_M)
+
+storage = FaceStorage(snapshot_dir=GALERIA_SNAPSHOT_DIR or None, precisao=GALERIA_PRECISAO or None,
+                      prefixo_shm=GALERIA_SHM or None, codec_pq=codec_pq)
+
+
+def criar_matcher(storage):
+    """Monta o matcher do /checkin: exato para galerias pequenas, IVF ou PQ para as grandes"""
+    if BUSCA_APROXIMADA == "pq":
+        def ao_treinar(codec):
+            codec.salvar(PQ_CODEBOOK)
+            if isinstance(storage.galeria, GaleriaMemoria):
+                storage.galeria.requantizar('pq', codec)  # daqui em diante, só os códigos em memória
+
+        # A galeria em memória guarda os próprios códigos; a mapeada/compartilhada tem os seus à parte
+        return MatcherPQ(CodigosGaleria(codec_pq), tolerancia=0.6, rerank=PQ_RERANK, limiar=PQ_LIMIAR,
+                         fonte_exata=storage.banco.carregar_encodings, ao_treinar=ao_treinar)
+
+    indice = IndiceIVF.carregar(IVF_CENTROIDES) if os.path.exists(IVF_CENTROIDES) else IndiceIVF()
+    # Com a galeria em memória, o índice acompanha cadastros/remoções de forma incremental
+    if hasattr(storage.galeria, 'observar'):
+        storage.galeria.observar(indice.ao_mudar_galeria)
+    return MatcherIVF(indice, tolerancia=0.6, nprobe=IVF_NPROBE, limiar=IVF_LIMIAR,
+                      fonte_exata=storage.banco.carregar_encodings,
+                      ao_treinar=lambda indice: indice.salvar(IVF_CENTROIDES))
+
+
+matcher = criar_matcher(storage)
+if QUENTE_CAPACIDADE > 0:
+    matcher = MatcherQuente(matcher, capacidade=QUENTE_CAPACIDADE, margem=QUENTE_MARGEM, folga=QUENTE_FOLGA,
+                            fonte_exata=storage.banco.carregar_encodings)
+agendador = AgendadorLote(matcher, janela_ms=LOTE_JANELA_MS, max_lote=LOTE_MAXIMO) if LOTE_JANELA_MS > 0 else None
+
+# Inferência por hash da foto (+ estratégia) e busca por (hash, versão da galeria)
+cache_inferencia = CacheResultados(capacidade=CACHE_CHECKIN_ITENS, ttl=CACHE_CHECKIN_TTL)
+cache_busca = CacheResultados(capacidade=CACHE_CHECKIN_ITENS, ttl=CACHE_CHECKIN_TTL)
+
+
+# ==================== POOL DE INFERÊNCIA ====================
+# Processos que carregam os modelos do dlib uma vez e fazem detecção + encoding
+pool = PoolInferencia(processos=INFERENCIA_PROCESSOS, max_fila=INFERENCIA_FILA, timeout=INFERENCIA_TIMEOUT)
+
+
+def _inferir(operacao, image_rgb, max_lado=None, **parametros):
+    """Roda a detecção/encoding de um endpoint no pool e espera o resultado"""
+    with metricas.etapa('inferencia'):  # inclui a espera na fila do pool
+        resultado = pool.processar(operacao, image_rgb, max_lado=max_lado or DETECCAO_MAX_LADO,
+                                   upsample=DETECCAO_UPSAMPLE, rosto_minimo=DETECCAO_ROSTO_MINIMO, **parametros)
+    # Detecção, landmarks e encoder, medidos dentro do dlib no processo da inferência
+    for nome, segundos in resultado['tempos']:
+        metricas.anotar(nome, segundos)
+    print(f"  Detecção: {len(resultado['caixas'])} rosto(s) com upsample={resultado['nivel']}")
+    return resultado
+
+
+def _resposta_saturado(erro):
+    """
+    503 com Retry-After quando o pool de inferência não aceita mais tarefas,
+    504 (também com Retry-After) quando a tarefa passa de INFERENCIA_TIMEOUT
+    """
+    print(f"⚠️  {erro}")
+    resposta = jsonify({"status": "error", "message": "Servidor ocupado. Tente novamente em instantes."})
+    resposta.headers['Retry-After'] = str(erro.retry_after)
+    return resposta, erro.status
+
+
+# ==================== MÉTRICAS POR REQUISIÇÃO ====================
+
+@app.before_request
+def _iniciar_metricas():
+    metricas.iniciar_requisicao()
+
+
+@app.after_request
+def _finalizar_metricas(resposta):
+    """Histogramas das etapas + cabeçalho Server-Timing com o detalhamento desta requisição"""
+    endpoint = request.url_rule.rule if request.url_rule is not None else request.path
+    resposta.headers['Server-Timing'] = metricas.server_timing(metricas.finalizar_requisicao(endpoint))
+    return resposta
 
 
 # ==================== ENDPOINTS DA API FLASK ====================
@@ -125,29 +380,38 @@ def api_register():
         return jsonify({"status": "error", "message": "Nome não pode ser vazio."}), 400
 
     try:
-        # Carrega a imagem do stream usando PIL e converte para RGB
-        image_pil = Image.open(file_stream)
-        image_rgb = np.array(image_pil.convert('RGB'))
+        # Decodifica a foto já reduzida (draft do JPEG), no mínimo do tamanho da detecção;
+        # os bytes originais ficam para a gravação da foto em resolução total
+        conteudo = file_stream.read()
+        with metricas.etapa('decodificacao'):
+            image_rgb, _ = carregar_imagem(io.BytesIO(conteudo), DETECCAO_MAX_LADO)
 
-        # Detecta o rosto e gera o encoding
-        face_locations = face_recognition.face_locations(image_rgb)
+        # Detecta o rosto (em escala reduzida) e gera o encoding (em resolução total) no pool
+        inferencia = _inferir('cadastro', image_rgb)
+        face_locations = inferencia['caixas']
+        metricas.ROSTOS_DETECTADOS.incrementar('/register', len(face_locations))
 
         if len(face_locations) == 0:
+            metricas.SEM_ROSTO.incrementar('/register')
             print("❌ Nenhum rosto detectado!")
             return jsonify({"status": "error", "message": "Nenhum rosto detectado na imagem."}), 400
         if len(face_locations) > 1:
             print("⚠️  Múltiplos rostos detectados!")
             return jsonify({"status": "error", "message": "Múltiplos rostos detectados. Envie apenas um."}), 400
 
-        face_encoding = face_recognition.face_encodings(image_rgb, face_locations)[0]
-
-        # Converte para BGR (formato do OpenCV) para salvar a foto
-        image_bgr = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
+        face_encoding = inferencia['encodings'][0]
 
-        # Salva o usuário usando nossa classe
-        resultado = storage.adicionar_usuario(nome, face_encoding, image_bgr)
+        # Salva o usuário usando nossa classe (a foto é gravada como foi enviada)
+        with metricas.etapa('cadastro'):
+            resultado = storage.adicionar_usuario(nome, face_encoding, conteudo)
         return jsonify(resultado), 201  # 201 = Created
 
+    except PoolSaturado as e:
+        return _resposta_saturado(e)
+    except sqlite3.IntegrityError as e:
+        # Outro cadastro gravou o mesmo ID ao mesmo tempo
+        print(f"⚠️  Cadastro em conflito: {e}")
+        return jsonify({"status": "error", "message": "Cadastro em conflito com outro. Tente novamente."}), 409
     except Exception as e:
         print(f"❌ Erro interno: {e}")
         return jsonify({"status": "error", "message": f"Erro interno no servidor: {e}"}), 500
@@ -157,46 +421,63 @@ def api_register():
 def api_checkin():
     """
     Endpoint para validar um rosto (fazer a chamada).
-    Recebe um formulário com 'photo' (arquivo de imagem da câmera).
+    Recebe um formulário com 'photo' (arquivo de imagem da câmera) e, opcionalmente,
+    'estrategia' ("maior", "central" ou "todos") para fotos com mais de um rosto.
     """
     print("\nRecebendo requisição em /checkin...")
 
     if 'photo' not in request.files:
         return jsonify({"status": "error", "message": "Requisição inválida. Envie 'photo'."}), 400
 
-    # 1. Carrega usuários cadastrados
-    usuarios = storage.carregar_todos_usuarios()
-    if len(usuarios) == 0:
-        return jsonify({"status": "error", "message": "Nenhum usuário cadastrado no sistema."}), 400
+    estrategia = request.form.get('estrategia', CHECKIN_ESTRATEGIA)
+    if estrategia not in ESTRATEGIAS:
+        return jsonify({"status": "error", "message": f"Estratégia inválida. Use uma de {list(ESTRATEGIAS)}."}), 400
 
-    known_encodings = [u['encoding'] for u in usuarios]
-    known_names = [u['nome'] for u in usuarios]
-
-    # 2. Processa a foto enviada
-    file_stream = request.files['photo']
     try:
-        image_pil = Image.open(file_stream)
-        image_rgb = np.array(image_pil.convert('RGB'))
-
-        # Detecta rostos na imagem
-        face_locations = face_recognition.face_locations(image_rgb)
-        face_encodings = face_recognition.face_encodings(image_rgb, face_locations)
+        # 1. Pega a visão atual da galeria em memória (sem reler os arquivos)
+        with metricas.etapa('galeria'):
+            galeria = storage.snapshot()
+        if len(galeria) == 0:
+            return jsonify({"status": "error", "message": "Nenhum usuário cadastrado no sistema."}), 400
+
+        # 2. Processa a foto enviada
+        conteudo = request.files['photo'].read()
+        chave = (chave_conteudo(conteudo), estrategia)
+
+        def inferir():
+            with metricas.etapa('decodificacao'):
+                image_rgb, _ = carregar_imagem(io.BytesIO(conteudo), DETECCAO_MAX_LADO)
+            # Detecta rostos e escolhe o(s) rosto(s) antes do encoding (no pool):
+            # os descartados nem passam pelo encoder
+            return _inferir('checkin', image_rgb, estrategia=estrategia)
+
+        # Uma foto repetida (ou enviada ao mesmo tempo por outra requisição) não passa pelo dlib
+        inferencia = cache_inferencia.obter(chave, inferir)
+        face_encodings = inferencia['encodings']
+        metricas.ROSTOS_DETECTADOS.incrementar('/checkin', len(inferencia['caixas']))
 
         if len(face_encodings) == 0:
+            metricas.SEM_ROSTO.incrementar('/checkin')
             return jsonify({"status": "not_found", "message": "Nenhum rosto detectado."})
 
-        # Pega o primeiro rosto encontrado
-        unknown_encoding = face_encodings[0]
-
-        # 3. Compara o rosto com o banco de dados
-        matches = face_recognition.compare_faces(known_encodings, unknown_encoding, tolerance=0.6)
-        face_distances = face_recognition.face_distance(known_encodings, unknown_encoding)
-
-        best_match_index = np.argmin(face_distances)
-
-        if matches[best_match_index]:
-            nome = known_names[best_match_index]
-            confidence = (1 - face_distances[best_match_index]) * 100
+        # 3. Compara com a galeria (em lote com as requisições simultâneas, se ligado);
+        #    com vários rostos, fica o reconhecimento de menor distância
+        def buscar():
+            with metricas.etapa('busca'):
+                if agendador is not None:
+                    return agendador.buscar(galeria, face_encodings)
+                return matcher.buscar_lote(galeria, face_encodings)
+
+        # A busca só é refeita se a galeria mudou desde a última vez que esta foto chegou
+        resultados = cache_busca.obter((chave, galeria.versao), buscar)
+        # Rostos sem candidato (ex.: removidos durante a busca) vêm com distancia=None
+        resultado = min(resultados, key=lambda r: (not r.encontrado,
+                                                   float('inf') if r.distancia is None else r.distancia))
+        metricas.IDENTIFICACOES.incrementar('encontrado' if resultado.encontrado else 'nao_encontrado')
+
+        if resultado.encontrado:
+            nome = resultado.nome
+            confidence = resultado.confianca
 
             print(f"✓ Rosto reconhecido: {nome} (Conf: {confidence:.2f}%)")
 
@@ -211,26 +492,162 @@ def api_checkin():
             print("❌ Rosto não reconhecido.")
             return jsonify({"status": "not_found", "message": "Desconhecido"})
 
+    except PoolSaturado as e:
+        return _resposta_saturado(e)
+    except Exception as e:
+        print(f"❌ Erro interno: {e}")
+        return jsonify({"status": "error", "message": f"Erro interno no servidor: {e}"}), 500
+
+
+@app.route('/checkin/grupo', methods=['POST'])
+def api_checkin_grupo():
+    """
+    Endpoint para fazer a chamada com uma foto da turma.
+    Recebe um formulário com 'photo' e identifica todos os rostos de uma vez,
+    sem que dois rostos fiquem com a mesma pessoa. Retorna um item por rosto,
+    com a caixa [top, right, bottom, left] na foto decodificada.
+    """
+    print("\nRecebendo requisição em /checkin/grupo...")
+
+    if 'photo' not in request.files:
+        return jsonify({"status": "error", "message": "Requisição inválida. Envie 'photo'."}), 400
+
+    try:
+        with metricas.etapa('galeria'):
+            galeria = storage.snapshot()
+        if len(galeria) == 0:
+            return jsonify({"status": "error", "message": "Nenhum usuário cadastrado no sistema."}), 400
+
+        with metricas.etapa('decodificacao'):
+            image_rgb, _ = carregar_imagem(request.files['photo'], GRUPO_MAX_LADO)
+        # Todos os encodings em uma chamada ao dlib (no pool) e todos os matches em uma passada
+        inferencia = _inferir('grupo', image_rgb, max_lado=GRUPO_MAX_LADO)
+        face_locations, encodings = inferencia['caixas'], inferencia['encodings']
+        metricas.ROSTOS_DETECTADOS.incrementar('/checkin/grupo', len(face_locations))
+        if len(face_locations) == 0:
+            metricas.SEM_ROSTO.incrementar('/checkin/grupo')
+        with metricas.etapa('busca'):
+            identificados = identificar_grupo(galeria, encodings, tolerancia=0.6,
+                                              fonte_exata=storage.banco.carregar_encodings, rerank=PQ_RERANK)
+
+        rostos = []
+        for caixa, identificado in zip(face_locations, identificados):
+            if identificado is None:
+                rostos.append({"caixa": list(caixa), "status": "not_found"})
+                continue
+            metadados, distancia = identificado
+            rostos.append({
+                "caixa": list(caixa),
+                "status": "success",
+                "nome": metadados['nome'],
+                "arquivo": metadados['arquivo'],
+                "confidence": f"{(1 - distancia) * 100:.2f}%"
+            })
+
+        presentes = sum(r['status'] == 'success' for r in rostos)
+        metricas.IDENTIFICACOES.incrementar('encontrado', presentes)
+        metricas.IDENTIFICACOES.incrementar('nao_encontrado', len(rostos) - presentes)
+        print(f"✓ Chamada: {presentes} de {len(rostos)} rosto(s) reconhecido(s)")
+        return jsonify({"status": "success", "total_rostos": len(rostos), "reconhecidos": presentes,
+                        "rostos": rostos})
+
+    except PoolSaturado as e:
+        return _resposta_saturado(e)
     except Exception as e:
         print(f"❌ Erro interno: {e}")
         return jsonify({"status": "error", "message": f"Erro interno no servidor: {e}"}), 500
 
 
+@app.route('/ready', methods=['GET'])
+def api_ready():
+    """
+    Prontidão: 200 quando os modelos já foram carregados e aquecidos (em todos os
+    processos de inferência), 503 enquanto isso. As rotas que não usam os modelos
+    (ex.: /users) já funcionam antes.
+    """
+    if pool.pronto:
+        return jsonify({"status": "ready"})
+    return jsonify({"status": "warming_up", "inferencia": pool.estatisticas()}), 503
+
+
+@app.route('/status', methods=['GET'])
+def api_status():
+    """Estado do pool de inferência, dos micro-lotes e do cache do /checkin e do gravador de fotos"""
+    return jsonify({"inferencia": pool.estatisticas(),
+                    "lotes": agendador.estatisticas() if agendador is not None else None,
+                    "cache_checkin": {"inferencia": cache_inferencia.estatisticas(),
+                                      "busca": cache_busca.estatisticas()},
+                    "conjunto_quente": matcher.estatisticas() if isinstance(matcher, MatcherQuente) else None,
+                    "fotos": storage.fotos.estatisticas()})
+
+
+@app.route('/metrics', methods=['GET'])
+def api_metrics():
+    """Métricas no formato texto do Prometheus (histogramas por etapa, contadores e gauges)"""
+    medidores = {
+        "pyface_galeria_rostos": ("Rostos na galeria em memória", lambda: len(storage.snapshot())),
+        "pyface_inferencia_fila": ("Tarefas esperando um processo de inferência",
+                                   lambda: pool.estatisticas()["fila"]),
+        "pyface_fotos_fila": ("Fotos esperando gravação", lambda: storage.fotos.profundidade),
+        "pyface_cache_checkin_taxa_acerto": ("Fração dos /checkin que reaproveitaram a inferência (neste processo)",
+                                             lambda: cache_inferencia.estatisticas()["taxa_acerto"]),
+    }
+    if isinstance(matcher, MatcherQuente):
+        medidores["pyface_conjunto_quente_taxa_acerto"] = (
+            "Fração das buscas resolvidas pelo conjunto quente (neste processo)",
+            lambda: matcher.estatisticas()["taxa_acerto"])
+        medidores["pyface_conjunto_quente_economizado_ms"] = (
+            "Tempo de busca estimado que o conjunto quente evitou (ms, neste processo)",
+            lambda: matcher.estatisticas()["economizado_ms"])
+    texto = metricas.exportar(medidores)
+    return texto, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+def _codificar_cursor(chave):
+    """(nome, id) -> cursor opaco para a próxima página"""
+    return base64.urlsafe_b64encode(json.dumps(chave).encode('utf-8')).decode('ascii')
+
+
+def _decodificar_cursor(cursor):
+    nome, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    return nome, int(id_)
+
+
 @app.route('/users', methods=['GET'])
 def api_list_users():
-    """Endpoint para listar todos os usuários cadastrados."""
-    usuarios = storage.carregar_todos_usuarios()
-
-    # Limpa os encodings (que são dados binários) antes de enviar como JSON
-    lista_limpa = []
-    for u in usuarios:
-        lista_limpa.append({
-            "nome": u['nome'],
-            "data_cadastro": u['data_cadastro'],
-            "arquivo": u['arquivo']  # O 'arquivo' é o ID único para remoção
-        })
+    """
+    Endpoint para listar os usuários cadastrados (só metadados, sem encodings).
+    Parâmetros opcionais na query string:
+      - limit:  tamanho da página, inteiro >= 1 (até 1000; sem ele, devolve todos)
+      - cursor: valor do cabeçalho X-Proximo-Cursor da página anterior
+      - prefixo: filtra pelo começo do nome
+    A resposta traz um ETag que só muda quando a galeria muda (If-None-Match -> 304).
+    """
+    # O número de sequência do journal muda a cada cadastro/remoção
+    etag = f'"galeria-{storage.banco.ultimo_seq()}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return '', 304, {'ETag': etag}
 
-    return jsonify(lista_limpa)
+    try:
+        limite = request.args.get('limit')
+        if limite is not None:
+            limite = int(limite)
+            if limite < 1:
+                raise ValueError(limite)
+            limite = min(limite, 1000)
+        cursor = request.args.get('cursor')
+        apos = _decodificar_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        return jsonify({"status": "error", "message": "Parâmetros 'limit' ou 'cursor' inválidos."}), 400
+
+    # O 'arquivo' de cada usuário é o ID único para remoção
+    lista, proximo = storage.banco.listar_usuarios(limite, apos, request.args.get('prefixo'))
+
+    resposta = jsonify(lista)
+    resposta.headers['ETag'] = etag
+    if proximo is not None:
+        resposta.headers['X-Proximo-Cursor'] = _codificar_cursor(proximo)
+    return resposta
 
 
 @app.route('/users/delete', methods=['POST'])
@@ -253,6 +670,8 @@ def api_delete_user():
 
 # ==================== EXECUÇÃO ====================
 
+# Servidor de desenvolvimento. Em produção use: python servidor.py
+# (modelos carregados uma vez, vários workers e threads; ver servidor.py)
 if __name__ == "__main__":
     print("Iniciando servidor Flask...")
     # host='0.0.0.0' permite que o servidor seja acessado
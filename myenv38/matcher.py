@@ -0,0 +1,155 @@
+# ==================== MATCHER VETORIZADO ====================
+# Compara um rosto com toda a galeria em uma única passada.
+#
+# O face_recognition.compare_faces e o face_distance calculam, cada um,
+# np.linalg.norm(galeria - rosto, axis=1) sobre uma cópia float64 da galeria.
+# Aqui a distância é calculada uma vez só, com um produto de matrizes:
+#     ||g - q||² = ||g||² - 2 g·q + ||q||²
+# usando as normas ||g||² que a galeria já guarda.
+#
+# Em galerias quantizadas (float16/int8) a conta é feita em blocos, convertendo
+# cada bloco para float32, e os candidatos perto da fronteira de decisão são
+# reverificados com os vetores exatos (ver quantizacao.py).
+
+import numpy as np
+
+from galeria import DIMENSAO
+from quantizacao import MARGEM_PADRAO
+
+TOLERANCIA_PADRAO = 0.6
+BLOCO_DISTANCIAS = 8192  # linhas convertidas para float32 por vez em galerias quantizadas
+
+
+class ResultadoBusca:
+    """Resultado de uma busca na galeria (melhor match, top-k e todos dentro da tolerância)"""
+
+    __slots__ = ('indice', 'distancia', 'metadados', 'encontrado', 'top_k', 'dentro_tolerancia')
+
+    def __init__(self, indice, distancia, metadados, encontrado, top_k, dentro_tolerancia):
+        self.indice = indice              # índice do mais próximo (None se a galeria está vazia)
+        self.distancia = distancia        # distância do mais próximo
+        self.metadados = metadados        # dict do mais próximo ('nome', 'data_cadastro', 'arquivo')
+        self.encontrado = encontrado      # True se o mais próximo está dentro da tolerância
+        self.top_k = top_k                # lista de (metadados, distancia), do mais próximo ao mais distante
+        self.dentro_tolerancia = dentro_tolerancia  # lista de (metadados, distancia) com distancia <= tolerância
+
+    @property
+    def nome(self):
+        return self.metadados['nome'] if self.metadados else None
+
+    @property
+    def confianca(self):
+        """Mesma fórmula usada pelo /checkin: (1 - distância) * 100"""
+        return (1 - self.distancia) * 100
+
+
+def distancias_lote(matriz, normas2, consultas):
+    """
+    Distâncias euclidianas entre cada consulta (Q x 128) e cada linha da galeria (N x 128).
+    Retorna uma matriz Q x N float32.
+    """
+    consultas = np.ascontiguousarray(consultas, dtype=np.float32).reshape(-1, matriz.shape[1])
+    d2 = consultas @ matriz.T
+    d2 *= -2
+    d2 += normas2
+    d2 += np.einsum('ij,ij->i', consultas, consultas)[:, None]
+    np.maximum(d2, 0, out=d2)  # erros de arredondamento podem dar valores levemente negativos
+    return np.sqrt(d2, out=d2)
+
+
+def distancias(snapshot, encoding):
+    """Distâncias entre um encoding e todos os usuários do snapshot (vetor de N posições)"""
+    return distancias_consultas(snapshot, encoding)[0]
+
+
+def distancias_consultas(snapshot, consultas):
+    """Distâncias entre Q encodings e todos os usuários do snapshot (matriz Q x N)"""
+    if snapshot.precisao == 'float32':
+        return distancias_lote(snapshot.matriz, snapshot.normas2, consultas)
+
+    consultas = np.asarray(consultas, dtype=np.float32).reshape(-1, DIMENSAO)
+    dists = np.empty((len(consultas), len(snapshot)), dtype=np.float32)
+    for inicio in range(0, len(snapshot), BLOCO_DISTANCIAS):
+        fim = min(inicio + BLOCO_DISTANCIAS, len(snapshot))
+        bloco = snapshot.vetores(slice(inicio, fim))
+        dists[:, inicio:fim] = distancias_lote(bloco, snapshot.normas2[inicio:fim], consultas)
+    return dists
+
+
+class MatcherExato:
+    """
+    Busca exata (força bruta) sobre o snapshot da galeria.
+
+    Em galerias quantizadas, 'fonte_exata(arquivos)' deve devolver os encodings
+    float32 originais desses usuários (ex.: BancoRostos.carregar_encodings);
+    com ela, os candidatos a menos de 'margem' da tolerância ou do melhor match
+    têm a distância refeita em float32, para a decisão ser a mesma da galeria exata.
+    """
+
+    def __init__(self, tolerancia=TOLERANCIA_PADRAO, k=5, fonte_exata=None, margem=None):
+        self.tolerancia = tolerancia
+        self.k = k
+        self.fonte_exata = fonte_exata
+        self.margem = margem
+        self.reverificados = 0  # total de distâncias refeitas em float32
+
+    def buscar(self, snapshot, encoding):
+        """Compara um encoding com a galeria e retorna um ResultadoBusca"""
+        dists = self.refinar(snapshot, distancias(snapshot, encoding), encoding)
+        return montar_resultado(snapshot.metadados, dists, self.tolerancia, self.k)
+
+    def buscar_lote(self, snapshot, encodings):
+        """Como buscar(), para vários encodings com um único produto de matrizes (Q x N)"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, DIMENSAO)
+        todas = distancias_consultas(snapshot, encodings)
+        return [montar_resultado(snapshot.metadados, self.refinar(snapshot, dists, encoding), self.tolerancia, self.k)
+                for dists, encoding in zip(todas, encodings)]
+
+    def refinar(self, snapshot, dists, encoding, indices=None):
+        """Refaz em float32 as distâncias aproximadas perto da fronteira de decisão"""
+        if snapshot.precisao == 'float32' or self.fonte_exata is None or len(dists) == 0:
+            return dists
+
+        margem = MARGEM_PADRAO[snapshot.precisao] if self.margem is None else self.margem
+        perto = (dists <= dists.min() + 2 * margem) | (np.abs(dists - self.tolerancia) <= margem)
+        posicoes = np.flatnonzero(perto)
+        linhas = posicoes if indices is None else indices[posicoes]
+
+        exatos = self.fonte_exata([snapshot.metadados[i]['arquivo'] for i in linhas])
+        dists = dists.copy()
+        dists[posicoes] = np.linalg.norm(np.asarray(exatos, dtype=np.float32) - np.asarray(encoding, dtype=np.float32), axis=1)
+        self.reverificados += len(posicoes)
+        return dists
+
+
+def montar_resultado(metadados, dists, tolerancia, k, indices=None):
+    """
+    Extrai melhor match, top-k e os dentro da tolerância de um vetor de distâncias.
+    Se 'indices' for dado, dists[j] é a distância até a linha indices[j] da galeria
+    (busca sobre um subconjunto de candidatos, como no IVF).
+    """
+    n = len(dists)
+    if n == 0:
+        return ResultadoBusca(None, None, None, False, [], [])
+
+    k = min(k, n)
+    if k < n:
+        candidatos = np.sort(np.argpartition(dists, k - 1)[:k])  # em empate, vence o menor índice
+    else:
+        candidatos = np.arange(n)
+    candidatos = candidatos[np.argsort(dists[candidatos], kind='stable')]
+    # Distância infinita = usuário removido durante a busca (ver BancoRostos.carregar_encodings)
+    candidatos = candidatos[np.isfinite(dists[candidatos])]
+    if len(candidatos) == 0:
+        return ResultadoBusca(None, None, None, False, [], [])
+    if indices is None:
+        indices = np.arange(n)
+    top_k = [(metadados[indices[j]], float(dists[j])) for j in candidatos]
+
+    dentro = np.flatnonzero(dists <= tolerancia)
+    dentro = dentro[np.argsort(dists[dentro], kind='stable')]
+    dentro_tolerancia = [(metadados[indices[j]], float(dists[j])) for j in dentro]
+
+    melhor = int(indices[candidatos[0]])
+    distancia = float(dists[candidatos[0]])
+    return ResultadoBusca(melhor, distancia, metadados[melhor], distancia <= tolerancia, top_k, dentro_tolerancia)
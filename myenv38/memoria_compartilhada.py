@@ -0,0 +1,267 @@
+# ==================== GALERIA EM MEMÓRIA COMPARTILHADA ====================
+# Com vários processos (para fugir do GIL durante a inferência do dlib), cada
+# um recarregaria a galeria e guardaria uma cópia própria. Aqui a matriz da
+# galeria fica em um segmento multiprocessing.shared_memory: ocupa RAM uma vez
+# por máquina e os workers só o anexam para leitura.
+#
+# Segmentos (prefixo padrão "pyface_galeria"):
+#   <prefixo>_ctl        controle: contador de geração + nome do segmento vigente + pid do coordenador
+#   <prefixo>_<geracao>  dados: cabeçalho, matriz float32 N x 128, normas2, metadados JSON
+#
+# O coordenador (o primeiro processo, normalmente o master antes do fork) cria
+# o controle e publica a primeira geração. Cadastros/remoções em qualquer
+# worker publicam um segmento novo (montado a partir do faces.db, sob a trava
+# de escrita do banco) e incrementam a geração; os outros workers percebem na
+# próxima leitura e anexam o segmento novo. Segmentos de gerações antigas são
+# desvinculados (unlink); quem ainda os tem anexados continua lendo normalmente.
+# Se o segmento some entre a leitura do controle e o anexo (outras publicações
+# passaram na frente), o controle é relido; se o da geração vigente não existe
+# mais, o processo publica de novo a partir do banco.
+# Quem publica mantém o segmento aberto até passar para uma geração mais nova
+# (no Windows o segmento deixa de existir quando o último handle é fechado).
+#
+# Os segmentos não somem sozinhos se o coordenador morrer sem limpar (kill -9,
+# queda da máquina virtual...). Ao iniciar, cada processo confere se o
+# coordenador registrado ainda existe (se não, assume o papel) e se a geração
+# vigente bate com o banco (quantidade e maior id, como na GaleriaMapeada);
+# em qualquer dos casos, publica de novo a partir do faces.db.
+
+import atexit
+import json
+import os
+import struct
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from galeria import DIMENSAO, SnapshotGaleria
+
+PREFIXO_PADRAO = "pyface_galeria"
+
+# Controle: geração (par = estável, ímpar = publicação em andamento) + nome do segmento,
+# seguidos do pid do coordenador
+_CONTROLE = struct.Struct('<Q56s')
+_DONO = struct.Struct('<Q')
+# Dados: n, tamanho dos metadados, maior id do banco na publicação
+_CABECALHO = struct.Struct('<QQQ')
+TAMANHO_CABECALHO = 64
+
+
+def _sem_rastreamento(shm):
+    """
+    O resource_tracker do Python 3.8 desvincula, quando o processo termina,
+    todo segmento que ele criou ou anexou. Aqui quem decide a vida útil dos
+    segmentos é o coordenador, então eles saem do rastreamento.
+    """
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+def _processo_vivo(pid):
+    if pid <= 0:
+        return False
+    if os.name == 'nt':
+        return True  # no Windows os segmentos somem junto com o último processo que os usa
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # existe, mas é de outro usuário
+    return True
+
+
+class GaleriaCompartilhada:
+    """
+    Galeria em memória compartilhada entre processos.
+
+    Tem a mesma interface da GaleriaMemoria (snapshot/adicionar/remover).
+    snapshot() lê o contador de geração (8 bytes) e, se outro processo publicou,
+    anexa o segmento novo. Os arrays dos snapshots são somente leitura.
+    """
+
+    def __init__(self, banco, prefixo=PREFIXO_PADRAO):
+        self.banco = banco
+        self.prefixo = prefixo
+        self._lock = threading.Lock()
+        self._geracao = None
+        self._snapshot = None
+        self._segmentos = {}  # nome -> SharedMemory anexado por este processo
+        self._resumo = None   # (n, maior id) do segmento vigente, para comparar com o banco
+        self.coordenador = False
+
+        try:
+            self._controle = _sem_rastreamento(shared_memory.SharedMemory(name=f"{prefixo}_ctl"))
+        except FileNotFoundError:
+            self._controle = _sem_rastreamento(shared_memory.SharedMemory(
+                name=f"{prefixo}_ctl", create=True, size=_CONTROLE.size + _DONO.size))
+            self._controle.buf[:_CONTROLE.size] = _CONTROLE.pack(0, b'')
+            self._assumir()
+            self.publicar()
+            print(f"✓ Coordenador da galeria compartilhada iniciado ({prefixo})")
+            return
+
+        if not _processo_vivo(self._dono()):
+            print(f"⚠️  O coordenador da galeria compartilhada ({prefixo}) não existe mais; assumindo")
+            self._assumir()
+            self.publicar()
+            return
+        self.snapshot()  # se o segmento vigente sumiu, já publica de novo
+        if self._desatualizado():
+            print("⚠️  Galeria compartilhada diferente do banco; publicando de novo")
+            self.publicar()
+
+    def _dono(self):
+        """pid do coordenador registrado no controle (0 se não houver)"""
+        if len(self._controle.buf) < _CONTROLE.size + _DONO.size:
+            return 0  # controle de uma versão antiga, sem o pid
+        return _DONO.unpack_from(self._controle.buf, _CONTROLE.size)[0]
+
+    def _assumir(self):
+        """Torna este processo o coordenador (dono do controle e da limpeza ao sair)"""
+        self.coordenador = True
+        self._pid_dono = os.getpid()
+        if len(self._controle.buf) >= _CONTROLE.size + _DONO.size:
+            _DONO.pack_into(self._controle.buf, _CONTROLE.size, self._pid_dono)
+        atexit.register(self.encerrar)
+
+    def _desatualizado(self):
+        """Confere se a geração vigente bate com o banco (quantidade e maior id)"""
+        return self.banco.resumo() != self._resumo
+
+    # ---------- leitura ----------
+
+    def _ler_controle(self):
+        """Lê (geração, nome) de forma consistente (seqlock)"""
+        while True:
+            geracao, nome = _CONTROLE.unpack(bytes(self._controle.buf[:_CONTROLE.size]))
+            if geracao % 2 == 0 and struct.unpack_from('<Q', self._controle.buf, 0)[0] == geracao:
+                return geracao, nome.rstrip(b'\0').decode('ascii')
+
+    def snapshot(self):
+        """Retorna a visão atual, anexando o segmento novo se a geração mudou"""
+        geracao = struct.unpack_from('<Q', self._controle.buf, 0)[0]
+        if geracao == self._geracao:
+            return self._snapshot
+        perdida = None
+        for _ in range(5):
+            with self._lock:
+                geracao, nome = self._ler_controle()
+                if geracao == self._geracao:
+                    return self._snapshot
+                if geracao == perdida:
+                    break  # o controle não mudou: o segmento vigente não existe mais
+                try:
+                    self._snapshot = self._anexar(geracao, nome)
+                except FileNotFoundError:
+                    # Publicações mais novas desvincularam este segmento entre a leitura
+                    # do controle e o anexo: relê o controle
+                    perdida = geracao
+                    continue
+                self._geracao = geracao
+                self._fechar_antigos(nome)
+                return self._snapshot
+        print(f"⚠️  Segmento da galeria compartilhada não encontrado ({self.prefixo}); publicando de novo")
+        self.publicar()
+        return self._snapshot
+
+    def _anexar(self, geracao, nome, shm=None):
+        if shm is None:
+            shm = _sem_rastreamento(shared_memory.SharedMemory(name=nome))
+        self._segmentos[nome] = shm
+        n, len_meta, maior_id = _CABECALHO.unpack_from(shm.buf, 0)
+        self._resumo = (n, maior_id)
+        off_normas = TAMANHO_CABECALHO + n * DIMENSAO * 4
+        off_meta = off_normas + n * 4
+
+        matriz = np.ndarray((n, DIMENSAO), dtype=np.float32, buffer=shm.buf, offset=TAMANHO_CABECALHO)
+        normas2 = np.ndarray((n,), dtype=np.float32, buffer=shm.buf, offset=off_normas)
+        matriz.flags.writeable = False
+        normas2.flags.writeable = False
+        metadados = tuple(json.loads(bytes(shm.buf[off_meta:off_meta + len_meta]).decode('utf-8')))
+        return SnapshotGaleria(geracao, matriz, normas2, metadados)
+
+    def _fechar_antigos(self, atual):
+        """Fecha segmentos antigos que nenhum snapshot deste processo usa mais"""
+        for nome in list(self._segmentos):
+            if nome != atual:
+                try:
+                    self._segmentos[nome].close()
+                    del self._segmentos[nome]
+                except BufferError:
+                    pass  # ainda há um snapshot antigo em uso; tenta de novo na próxima troca
+
+    # ---------- escrita ----------
+
+    def publicar(self):
+        """Monta um segmento novo a partir do banco e avança a geração"""
+        with self.banco.lock_escrita():
+            matriz, metadados, ids = self.banco.carregar_galeria(com_ids=True)
+            meta = json.dumps(list(metadados), ensure_ascii=False).encode('utf-8')
+            n = len(matriz)
+
+            geracao_atual = struct.unpack_from('<Q', self._controle.buf, 0)[0]
+            geracao_atual += geracao_atual % 2  # ímpar = alguém caiu no meio de uma publicação
+            nova = geracao_atual + 2
+            nome = f"{self.prefixo}_{nova}"
+            tamanho = TAMANHO_CABECALHO + matriz.nbytes + n * 4 + len(meta)
+            shm = _sem_rastreamento(shared_memory.SharedMemory(name=nome, create=True, size=max(tamanho, 1)))
+
+            _CABECALHO.pack_into(shm.buf, 0, n, len(meta), int(ids[-1]) if n else 0)
+            off_normas = TAMANHO_CABECALHO + matriz.nbytes
+            destino = np.ndarray((n, DIMENSAO), dtype=np.float32, buffer=shm.buf, offset=TAMANHO_CABECALHO)
+            destino[:] = matriz
+            normas2 = np.ndarray((n,), dtype=np.float32, buffer=shm.buf, offset=off_normas)
+            np.einsum('ij,ij->i', destino, destino, out=normas2)
+            shm.buf[off_normas + n * 4:off_normas + n * 4 + len(meta)] = meta
+            del destino, normas2
+
+            # Seqlock: geração ímpar enquanto o nome é trocado
+            struct.pack_into('<Q', self._controle.buf, 0, geracao_atual + 1)
+            self._controle.buf[:_CONTROLE.size] = _CONTROLE.pack(geracao_atual + 1, nome.encode('ascii'))
+            struct.pack_into('<Q', self._controle.buf, 0, nova)
+
+            # O handle de criação não é fechado: vira o segmento vigente deste processo
+            with self._lock:
+                self._snapshot = self._anexar(nova, nome, shm)
+                self._geracao = nova
+                self._fechar_antigos(nome)
+
+        self._desvincular(f"{self.prefixo}_{geracao_atual - 2}")
+        print(f"✓ Galeria compartilhada publicada: geração {nova // 2} ({n} usuários)")
+        return nova
+
+    def _desvincular(self, nome):
+        """Remove o nome de um segmento antigo (quem já o anexou continua lendo)"""
+        try:
+            shm = shared_memory.SharedMemory(name=nome)
+        except FileNotFoundError:
+            return
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def adicionar(self, usuario):
+        """O usuário já está no banco; só publica uma geração nova"""
+        self.publicar()
+
+    def remover(self, arquivo):
+        """O usuário já saiu do banco; só publica uma geração nova"""
+        self.publicar()
+        return True
+
+    def encerrar(self):
+        """Coordenador: desvincula o controle e os segmentos ao sair"""
+        if not self.coordenador or os.getpid() != self._pid_dono:
+            return  # workers criados por fork herdam o atexit, mas não são donos
+        geracao = struct.unpack_from('<Q', self._controle.buf, 0)[0]
+        for g in (geracao, geracao - 2):
+            self._desvincular(f"{self.prefixo}_{g}")
+        self._desvincular(f"{self.prefixo}_ctl")
@@ -0,0 +1,201 @@
+# ==================== MÉTRICAS (PROMETHEUS) E SERVER-TIMING ====================
+# Tempo de cada etapa de /register e /checkin (decodificação, detecção,
+# landmarks, encoder, galeria, busca...), em histogramas expostos em /metrics
+# no formato texto do Prometheus, e no cabeçalho Server-Timing de cada resposta.
+#
+# - As etapas de uma requisição ficam em uma lista por thread; medir custa duas
+#   chamadas a perf_counter e um append.
+# - As etapas do dlib são medidas dentro do face_recognition (set_stage_timer)
+#   no processo que roda a inferência e voltam junto com o resultado.
+# - Contadores e histogramas ficam em uma área de memória compartilhada criada
+#   na importação: depois do fork (servidor.py) todos os workers somam na mesma
+#   área e qualquer um responde /metrics com o total. Por isso todas as séries
+#   (e os valores dos rótulos) são declaradas aqui, antes do fork.
+
+import mmap
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Limites (s) dos buckets dos histogramas
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ETAPAS = ("decodificacao", "carga_modelos", "deteccao", "landmarks", "encoder", "inferencia",
+          "galeria", "busca", "cadastro")
+ENDPOINTS = ("/register", "/checkin", "/checkin/grupo")
+
+# Nomes das etapas do face_recognition -> nomes usados aqui
+_ETAPAS_DLIB = {"model_load": "carga_modelos", "face_detector": "deteccao",
+                "landmarks": "landmarks", "face_encoder": "encoder"}
+
+
+class _Area:
+    """Vetor float64 em memória anônima compartilhada (sobrevive ao fork)"""
+
+    def __init__(self, tamanho=4096):
+        self._mmap = mmap.mmap(-1, tamanho * 8)
+        self.valores = np.frombuffer(self._mmap, dtype=np.float64)
+        self.lock = multiprocessing.Lock()
+        self._livre = 0
+
+    def reservar(self, n):
+        if self._livre + n > len(self.valores):
+            raise MemoryError("Área de métricas cheia")
+        inicio, self._livre = self._livre, self._livre + n
+        return inicio
+
+
+_area = _Area()
+
+
+class Contador:
+    """Contador com um rótulo de valores fixos"""
+
+    def __init__(self, nome, ajuda, rotulo, valores):
+        self.nome, self.ajuda, self.rotulo = nome, ajuda, rotulo
+        self._indice = {v: i for i, v in enumerate(valores)}
+        self._inicio = _area.reservar(len(valores))
+
+    def incrementar(self, valor, quantidade=1):
+        i = self._indice.get(valor)
+        if i is None:
+            return
+        with _area.lock:
+            _area.valores[self._inicio + i] += quantidade
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        for valor, i in self._indice.items():
+            linhas.append(f'{self.nome}{{{self.rotulo}="{valor}"}} {_area.valores[self._inicio + i]:g}')
+        return linhas
+
+
+class Histograma:
+    """Histograma com um rótulo de valores fixos: contagem por bucket, soma e total"""
+
+    def __init__(self, nome, ajuda, rotulo, valores, buckets=BUCKETS):
+        self.nome, self.ajuda, self.rotulo = nome, ajuda, rotulo
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        self._largura = len(buckets) + 2  # buckets, +Inf, soma
+        self._indice = {v: i for i, v in enumerate(valores)}
+        self._inicio = _area.reservar(len(valores) * self._largura)
+
+    def observar(self, valor, segundos):
+        i = self._indice.get(valor)
+        if i is None:
+            return
+        base = self._inicio + i * self._largura
+        bucket = int(np.searchsorted(self.buckets, segundos))  # primeiro limite >= segundos
+        with _area.lock:
+            _area.valores[base + bucket] += 1
+            _area.valores[base + self._largura - 1] += segundos
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        for valor, i in self._indice.items():
+            base = self._inicio + i * self._largura
+            contagens = np.cumsum(_area.valores[base:base + self._largura - 1])
+            rotulo = f'{self.rotulo}="{valor}"'
+            for limite, acumulado in zip(self.buckets, contagens):
+                linhas.append(f'{self.nome}_bucket{{{rotulo},le="{limite:g}"}} {acumulado:g}')
+            linhas.append(f'{self.nome}_bucket{{{rotulo},le="+Inf"}} {contagens[-1]:g}')
+            linhas.append(f'{self.nome}_sum{{{rotulo}}} {_area.valores[base + self._largura - 1]:.6f}')
+            linhas.append(f'{self.nome}_count{{{rotulo}}} {contagens[-1]:g}')
+        return linhas
+
+
+# ==================== SÉRIES ====================
+
+ETAPA_SEGUNDOS = Histograma("pyface_etapa_segundos", "Tempo de cada etapa das requisições",
+                            "etapa", ETAPAS)
+REQUISICAO_SEGUNDOS = Histograma("pyface_requisicao_segundos", "Tempo total das requisições",
+                                 "endpoint", ENDPOINTS)
+ROSTOS_DETECTADOS = Contador("pyface_rostos_detectados_total", "Rostos encontrados nas fotos enviadas",
+                             "endpoint", ENDPOINTS)
+IDENTIFICACOES = Contador("pyface_identificacoes_total", "Resultado de cada rosto procurado na galeria",
+                          "resultado", ("encontrado", "nao_encontrado"))
+SEM_ROSTO = Contador("pyface_sem_rosto_total", "Fotos enviadas sem nenhum rosto",
+                     "endpoint", ENDPOINTS)
+
+_SERIES = (ETAPA_SEGUNDOS, REQUISICAO_SEGUNDOS, ROSTOS_DETECTADOS, IDENTIFICACOES, SEM_ROSTO)
+
+
+# ==================== ETAPAS DA REQUISIÇÃO ====================
+
+_local = threading.local()
+
+
+def anotar(etapa, segundos):
+    """Registra uma etapa na requisição (ou captura) em andamento nesta thread"""
+    etapas = getattr(_local, 'etapas', None)
+    if etapas is not None:
+        etapas.append((etapa, segundos))
+
+
+def anotar_dlib(etapa, segundos):
+    """Callback para face_recognition.set_stage_timer"""
+    anotar(_ETAPAS_DLIB.get(etapa, etapa), segundos)
+
+
+@contextmanager
+def etapa(nome):
+    """Mede o bloco como uma etapa da requisição atual"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        anotar(nome, time.perf_counter() - inicio)
+
+
+@contextmanager
+def capturar():
+    """Junta em uma lista nova as etapas medidas no bloco (ex.: dentro da inferência)"""
+    anterior = getattr(_local, 'etapas', None)
+    _local.etapas = etapas = []
+    try:
+        yield etapas
+    finally:
+        _local.etapas = anterior
+
+
+def iniciar_requisicao():
+    _local.etapas = []
+    _local.inicio = time.perf_counter()
+
+
+def finalizar_requisicao(endpoint):
+    """
+    Fecha a requisição desta thread: alimenta os histogramas e retorna
+    a lista de (etapa, segundos), com a etapa 'total' no fim.
+    """
+    etapas = getattr(_local, 'etapas', None) or []
+    total = time.perf_counter() - getattr(_local, 'inicio', time.perf_counter())
+    _local.etapas = None
+    for nome, segundos in etapas:
+        ETAPA_SEGUNDOS.observar(nome, segundos)
+    REQUISICAO_SEGUNDOS.observar(endpoint, total)
+    return etapas + [("total", total)]
+
+
+def server_timing(etapas):
+    """Valor do cabeçalho Server-Timing (etapas repetidas são somadas, em ms)"""
+    somas = {}
+    for nome, segundos in etapas:
+        somas[nome] = somas.get(nome, 0.0) + segundos
+    return ", ".join(f"{nome};dur={1000 * segundos:.2f}" for nome, segundos in somas.items())
+
+
+def exportar(medidores=None):
+    """
+    Texto no formato do Prometheus. 'medidores' = {nome: (ajuda, função)} com
+    gauges lidos na hora (ex.: tamanho da galeria deste processo).
+    """
+    linhas = []
+    for serie in _SERIES:
+        linhas.extend(serie.exportar())
+    for nome, (ajuda, funcao) in (medidores or {}).items():
+        linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} gauge", f"{nome} {funcao():g}"]
+    return "\n".join(linhas) + "\n"
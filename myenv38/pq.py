@@ -0,0 +1,247 @@
+# ==================== QUANTIZAÇÃO POR PRODUTO (PQ) ====================
+# Cada encoding de 128 dimensões é dividido em M sub-vetores (padrão 16 x 8 dims)
+# e cada sub-vetor é trocado pelo índice (1 byte) do centróide mais próximo de
+# um codebook de 256 entradas. Um rosto passa de 512 bytes (float32) para 16.
+#
+# Na busca, a distância até cada código é aproximada com tabelas (ADC):
+# para o rosto enviado calcula-se, uma vez, a distância de cada sub-vetor até
+# as 256 entradas do codebook; a distância até um rosto da galeria é a soma de
+# M consultas nessas tabelas. Os melhores candidatos são então reordenados com
+# a distância exata.
+#
+# Com a galeria em memória e codebooks treinados, a galeria guarda só os códigos
+# (precisão 'pq', ver galeria.py): a reordenação lê do banco os vetores exatos
+# dos candidatos. Nas galerias mapeada/compartilhada, os códigos são montados à
+# parte (CodigosGaleria) e a reordenação usa os vetores completos do snapshot.
+#
+# Uso offline:
+#   python pq.py treinar --db faces.db --saida face-models/pq_codebook.npz
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from galeria import DIMENSAO
+from ivf import BLOCO_ATRIBUICAO, TarefaSegundoPlano, kmeans, salvar_npz
+from matcher import TOLERANCIA_PADRAO, MatcherExato, distancias_lote, montar_resultado
+
+
+class CodecPQ:
+    """Codebooks da quantização por produto (M sub-quantizadores x 256 centróides)"""
+
+    def __init__(self, codebooks=None, m=16):
+        self.codebooks = None if codebooks is None else np.ascontiguousarray(codebooks, dtype=np.float32)
+        self.m = m if codebooks is None else len(codebooks)
+
+    @property
+    def treinado(self):
+        return self.codebooks is not None
+
+    @property
+    def dsub(self):
+        return DIMENSAO // self.m
+
+    def treinar(self, matriz, iteracoes=15, amostra=65536):
+        """Treina um codebook de 256 centróides para cada sub-espaço"""
+        if DIMENSAO % self.m:
+            raise ValueError(f"M={self.m} precisa dividir {DIMENSAO}")
+        matriz = np.asarray(matriz, dtype=np.float32)
+        codebooks = np.zeros((self.m, 256, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            sub = matriz[:, j * self.dsub:(j + 1) * self.dsub]
+            centroides = kmeans(sub, 256, iteracoes, amostra=amostra, seed=j)
+            codebooks[j, :len(centroides)] = centroides
+        self.codebooks = codebooks
+
+    def codificar(self, matriz):
+        """Converte vetores (N x 128) em códigos (N x M, uint8)"""
+        matriz = np.asarray(matriz, dtype=np.float32).reshape(-1, DIMENSAO)
+        codigos = np.empty((len(matriz), self.m), dtype=np.uint8)
+        normas2 = np.einsum('mkd,mkd->mk', self.codebooks, self.codebooks)
+        # Em blocos de linhas: a matriz de distâncias fica em BLOCO_ATRIBUICAO x 256
+        for inicio in range(0, len(matriz), BLOCO_ATRIBUICAO):
+            bloco = matriz[inicio:inicio + BLOCO_ATRIBUICAO]
+            for j in range(self.m):
+                sub = bloco[:, j * self.dsub:(j + 1) * self.dsub]
+                d = normas2[j] - 2 * (sub @ self.codebooks[j].T)
+                codigos[inicio:inicio + len(bloco), j] = np.argmin(d, axis=1)
+        return codigos
+
+    def decodificar(self, codigos):
+        """Vetores aproximados (N x 128, float32) a partir dos códigos"""
+        codigos = np.asarray(codigos, dtype=np.uint8).reshape(-1, self.m)
+        return np.concatenate([self.codebooks[j][codigos[:, j]] for j in range(self.m)], axis=1)
+
+    def tabelas(self, encoding):
+        """Tabela M x 256 com ||q_j - c_jk||² para o rosto consultado"""
+        q = np.asarray(encoding, dtype=np.float32).reshape(self.m, 1, self.dsub)
+        diff = self.codebooks - q
+        return np.einsum('mkd,mkd->mk', diff, diff)
+
+    def distancias_adc(self, tabelas, codigos):
+        """Distância² aproximada até cada código (soma das M consultas às tabelas)"""
+        d2 = np.take(tabelas[0], codigos[:, 0])
+        for j in range(1, self.m):
+            d2 += np.take(tabelas[j], codigos[:, j])
+        return d2
+
+    def salvar(self, caminho):
+        salvar_npz(caminho, codebooks=self.codebooks)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as dados:
+            return cls(dados['codebooks'])
+
+
+class CodigosGaleria:
+    """
+    Códigos PQ de todas as linhas da galeria, acompanhando suas versões.
+
+    Mesma estratégia da GaleriaMemoria: buffer pré-alocado, cadastro escreve na
+    próxima linha livre e remoção monta um buffer novo. Cada mudança publica
+    (versao, view dos códigos) de uma vez só.
+
+    Sem avisos da galeria (galeria mapeada/compartilhada), os códigos são
+    refeitos por inteiro em segundo plano (ver MatcherPQ._codigos_para).
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.estado = None        # (versao, codigos N x M)
+        self.incremental = False  # True quando recebe avisos da galeria
+        self.tarefa = TarefaSegundoPlano("recodificação PQ")
+        self._buffer = np.empty((0, codec.m), dtype=np.uint8)
+        self._lock = threading.Lock()
+
+    def reconstruir(self, snapshot):
+        """Codifica todas as linhas do snapshot; só publica se ele for mais novo que o estado atual"""
+        codigos = self.codec.codificar(snapshot.vetores())
+        with self._lock:
+            if self.estado is None or self.estado[0] < snapshot.versao:
+                self._publicar_codigos(snapshot.versao, codigos)
+
+    def _publicar_codigos(self, versao, codigos):
+        n = len(codigos)
+        self._buffer = np.empty((max(1024, 2 * n), self.codec.m), dtype=np.uint8)
+        self._buffer[:n] = codigos
+        self.estado = (versao, self._buffer[:n])
+
+    def ao_mudar_galeria(self, evento, snapshot, indice):
+        """Callback para GaleriaMemoria.observar()"""
+        self.incremental = True
+        if not self.codec.treinado:
+            return
+        with self._lock:
+            # Só aplica a mudança sobre a versão imediatamente anterior; senão recodifica tudo
+            if evento == 'carregar' or self.estado is None or self.estado[0] != snapshot.versao - 1:
+                self._publicar_codigos(snapshot.versao, self.codec.codificar(snapshot.vetores()))
+            elif evento == 'adicionar':
+                if indice == len(self._buffer):
+                    buffer = np.empty((2 * len(self._buffer), self.codec.m), dtype=np.uint8)
+                    buffer[:indice] = self._buffer[:indice]
+                    self._buffer = buffer
+                self._buffer[indice] = self.codec.codificar(snapshot.vetores(indice))[0]
+                self.estado = (snapshot.versao, self._buffer[:indice + 1])
+            elif evento == 'remover':
+                # Copy-on-write: o buffer publicado pode estar sendo lido agora
+                self._buffer = np.delete(self._buffer, indice, axis=0)
+                self.estado = (snapshot.versao, self._buffer[:len(snapshot)])
+
+
+class MatcherPQ:
+    """
+    Busca pelos códigos PQ com reordenação exata dos 'rerank' melhores candidatos.
+    Abaixo de 'limiar' rostos (ou sem códigos prontos) usa a busca exata.
+
+    Se a galeria passa do limiar sem codebooks, eles são treinados em segundo
+    plano na primeira busca e ao_treinar(codec) é chamado (ex.: para salvá-los e
+    converter a galeria em memória para a precisão 'pq').
+    """
+
+    def __init__(self, codigos, tolerancia=TOLERANCIA_PADRAO, k=5, rerank=64, limiar=20000, fonte_exata=None,
+                 ao_treinar=None):
+        self.codigos = codigos
+        self.tolerancia = tolerancia
+        self.k = k
+        self.rerank = rerank
+        self.limiar = limiar
+        self.ao_treinar = ao_treinar
+        self.exato = MatcherExato(tolerancia, k, fonte_exata=fonte_exata)
+
+    def buscar(self, snapshot, encoding):
+        codigos = self._codigos_para(snapshot)
+        if codigos is None:
+            return self.exato.buscar(snapshot, encoding)
+
+        codec = self.codigos.codec
+        d2 = codec.distancias_adc(codec.tabelas(encoding), codigos)
+        r = min(max(self.rerank, self.k), len(d2))
+        linhas = np.sort(np.argpartition(d2, r - 1)[:r])
+
+        if snapshot.precisao == 'pq' and self.exato.fonte_exata is not None:
+            # Galeria só com códigos: os vetores exatos dos candidatos vêm do banco
+            exatos = np.asarray(self.exato.fonte_exata([snapshot.metadados[i]['arquivo'] for i in linhas]),
+                                dtype=np.float32)
+            dists = np.linalg.norm(exatos - np.asarray(encoding, dtype=np.float32), axis=1)
+        else:
+            # Reordenação exata: só estas linhas dos vetores completos são lidas
+            dists = distancias_lote(np.ascontiguousarray(snapshot.vetores(linhas)), snapshot.normas2[linhas],
+                                    encoding)[0]
+            dists = self.exato.refinar(snapshot, dists, encoding, indices=linhas)
+        return montar_resultado(snapshot.metadados, dists, self.tolerancia, self.k, indices=linhas)
+
+    def buscar_lote(self, snapshot, encodings):
+        """Vários encodings: um produto de matrizes na busca exata, uma busca por vez na aproximada"""
+        if self._codigos_para(snapshot) is None:
+            return self.exato.buscar_lote(snapshot, encodings)
+        return [self.buscar(snapshot, encoding) for encoding in encodings]
+
+    def _codigos_para(self, snapshot):
+        if snapshot.precisao == 'pq':
+            return snapshot.matriz  # a própria galeria já é de códigos (não há vetores para a busca exata)
+        if len(snapshot) < self.limiar:
+            return None
+        if not self.codigos.codec.treinado:
+            self.codigos.tarefa.iniciar(self._treinar, snapshot)
+            return None
+        estado = self.codigos.estado
+        if estado is not None and estado[0] == snapshot.versao:
+            return estado[1]
+        if self.codigos.incremental and estado is not None:
+            return None  # a galeria acabou de mudar; o aviso chega em instantes
+        # Sem avisos (ex.: galeria mapeada de outro processo): recodifica tudo em
+        # segundo plano, uma vez só; até terminar, esta e as próximas buscas são exatas
+        self.codigos.tarefa.iniciar(self.codigos.reconstruir, snapshot)
+        return None
+
+    def _treinar(self, snapshot):
+        print(f"⚠️  Galeria com {len(snapshot)} rostos e PQ sem codebooks: treinando em segundo plano")
+        inicio = time.perf_counter()
+        self.codigos.codec.treinar(snapshot.vetores())
+        print(f"✓ PQ treinado: {self.codigos.codec.m} sub-quantizadores em {time.perf_counter() - inicio:.1f}s")
+        if self.ao_treinar is not None:
+            self.ao_treinar(self.codigos.codec)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Quantização por produto da galeria de rostos")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p_treinar = sub.add_parser('treinar', help="treina os codebooks a partir do faces.db")
+    p_treinar.add_argument('--db', default='faces.db')
+    p_treinar.add_argument('--saida', default='face-models/pq_codebook.npz')
+    p_treinar.add_argument('--m', type=int, default=16, help="número de sub-quantizadores")
+    args = parser.parse_args()
+
+    from banco import BancoRostos
+    matriz, _ = BancoRostos(args.db).carregar_galeria()
+    codec = CodecPQ(m=args.m)
+    codec.treinar(matriz)
+    codec.salvar(args.saida)
+    print(f"✓ Codebooks salvos em {args.saida} ({codec.m} bytes por rosto)")
+
+
+if __name__ == "__main__":
+    _main()
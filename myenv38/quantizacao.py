@@ -0,0 +1,151 @@
+# ==================== QUANTIZAÇÃO ESCALAR DA GALERIA ====================
+# Precisões suportadas para os encodings guardados na galeria em memória:
+#   float32 -> 512 bytes por rosto (padrão, exato)
+#   float16 -> 256 bytes por rosto
+#   int8    -> 128 bytes por rosto: 8 bits por dimensão com escala e deslocamento
+#              próprios de cada dimensão (x ~= deslocamento + escala * q)
+#   pq      -> M bytes por rosto (padrão 16): códigos da quantização por produto
+#              (ver pq.py). Não é escolhida por GALERIA_PRECISAO: a galeria passa a
+#              guardar só os códigos quando BUSCA_APROXIMADA=pq tem codebooks
+#              treinados, e o 'escala' dessa precisão é o próprio CodecPQ.
+#
+# As distâncias sobre a galeria quantizada são aproximadas. O matcher refaz em
+# float32 (com os vetores exatos do banco) a conta dos candidatos perto da
+# fronteira de decisão, então a decisão de match não muda.
+#
+# Benchmark (memória, vazão e concordância com o face_distance):
+#   python quantizacao.py --tamanho 100000
+
+import argparse
+import time
+
+import numpy as np
+
+PRECISOES = ('float32', 'float16', 'int8')
+
+# Erro máximo esperado na distância para cada precisão. Candidatos a menos
+# disso da fronteira (ou do melhor match) são reverificados em float32.
+# No PQ o erro não tem limite útil: tudo é reverificado (o MatcherPQ e a chamada
+# por grupo reordenam os candidatos das tabelas ADC com os vetores do banco).
+MARGEM_PADRAO = {'float32': 0.0, 'float16': 0.005, 'int8': 0.03, 'pq': float('inf')}
+
+# Faixa mínima do int8 em cada dimensão (cobre os valores dos encodings do dlib).
+# Os dados só alargam a faixa: com poucos rostos calibrados, a escala não fica
+# minúscula e cadastros seguintes não são cortados nas pontas.
+FAIXA_PADRAO = (-0.5, 0.5)
+
+
+def dtype_de(precisao):
+    if precisao not in PRECISOES and precisao != 'pq':
+        raise ValueError(f"Precisão inválida: {precisao}. Use uma de {PRECISOES}")
+    return {'float32': np.float32, 'float16': np.float16, 'int8': np.uint8, 'pq': np.uint8}[precisao]
+
+
+def calibrar_int8(matriz, dimensao):
+    """Escala e deslocamento por dimensão (FAIXA_PADRAO unida ao mínimo/máximo dos dados, com 10% de folga)"""
+    minimo = np.full(dimensao, FAIXA_PADRAO[0], dtype=np.float32)
+    maximo = np.full(dimensao, FAIXA_PADRAO[1], dtype=np.float32)
+    if len(matriz):
+        minimo = np.minimum(minimo, matriz.min(axis=0))
+        maximo = np.maximum(maximo, matriz.max(axis=0))
+    folga = (maximo - minimo) * 0.1
+    minimo, maximo = minimo - folga, maximo + folga
+    return (maximo - minimo) / 255, minimo
+
+
+def quantizar(matriz, precisao, escala=None, deslocamento=None):
+    """Converte vetores float para a precisão da galeria"""
+    matriz = np.asarray(matriz, dtype=np.float32)
+    if precisao == 'int8':
+        q = np.rint((matriz - deslocamento) / escala)
+        return np.clip(q, 0, 255).astype(np.uint8)
+    if precisao == 'pq':
+        return escala.codificar(matriz)
+    return matriz.astype(dtype_de(precisao))
+
+
+def fora_da_faixa(matriz, escala, deslocamento):
+    """True se algum valor não cabe na faixa int8 calibrada (seria cortado por quantizar)"""
+    matriz = np.asarray(matriz, dtype=np.float32)
+    return bool(np.any(matriz < deslocamento) or np.any(matriz > deslocamento + 255 * escala))
+
+
+def dequantizar(dados, precisao, escala=None, deslocamento=None):
+    """Converte vetores da precisão da galeria de volta para float32"""
+    if precisao == 'int8':
+        return dados.astype(np.float32) * escala + deslocamento
+    if precisao == 'pq':
+        return escala.decodificar(dados)
+    return np.asarray(dados, dtype=np.float32)
+
+
+# ==================== BENCHMARK ====================
+
+def _face_distance(encodings, q):
+    """Mesma conta do face_recognition.face_distance (float64)"""
+    return np.linalg.norm(encodings - q, axis=1)
+
+
+def benchmark(matriz, consultas, tolerancia=0.6):
+    from galeria import GaleriaMemoria
+    from matcher import MatcherExato
+
+    matriz64 = matriz.astype(np.float64)
+    referencia = []
+    inicio = time.perf_counter()
+    for q in consultas:
+        d = _face_distance(matriz64, q)
+        melhor = int(np.argmin(d))
+        referencia.append(melhor if d[melhor] <= tolerancia else None)
+    linhas = [{'modo': 'face_distance', 'mb': matriz64.nbytes / 2 ** 20,
+               'consultas_s': len(consultas) / (time.perf_counter() - inicio),
+               'concordancia': 1.0, 'reverificados': 0.0}]
+
+    metadados = tuple({'nome': str(i), 'data_cadastro': 'N/A', 'arquivo': str(i)} for i in range(len(matriz)))
+    for precisao in PRECISOES:
+        galeria = GaleriaMemoria(precisao=precisao)
+        galeria.carregar_matriz(matriz, metadados)
+        snapshot = galeria.snapshot()
+
+        def fonte_exata(arquivos):
+            return matriz[[int(a) for a in arquivos]]
+
+        matcher = MatcherExato(tolerancia, k=1, fonte_exata=fonte_exata)
+        decisoes = []
+        inicio = time.perf_counter()
+        for q in consultas:
+            r = matcher.buscar(snapshot, q)
+            decisoes.append(r.indice if r.encontrado else None)
+        tempo = time.perf_counter() - inicio
+
+        linhas.append({
+            'modo': precisao,
+            'mb': (snapshot.matriz.nbytes + snapshot.normas2.nbytes) / 2 ** 20,
+            'consultas_s': len(consultas) / tempo,
+            'concordancia': float(np.mean([a == b for a, b in zip(decisoes, referencia)])),
+            'reverificados': matcher.reverificados / len(consultas),
+        })
+    return linhas
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Benchmark da galeria quantizada")
+    parser.add_argument('--tamanho', type=int, default=100000)
+    parser.add_argument('--consultas', type=int, default=300)
+    args = parser.parse_args()
+
+    from ivf import galeria_sintetica
+    matriz = galeria_sintetica(args.tamanho, pessoas=args.tamanho // 2)
+    rng = np.random.default_rng(1)
+    consultas = matriz[rng.integers(0, len(matriz), args.consultas)]
+    consultas = consultas + rng.normal(0, 0.03, consultas.shape).astype(np.float32)
+
+    print(f"Galeria: {len(matriz)} rostos, {len(consultas)} consultas")
+    print(f"{'modo':>14} {'MB':>8} {'consultas/s':>12} {'concordância':>13} {'reverif./consulta':>18}")
+    for linha in benchmark(matriz, consultas):
+        print(f"{linha['modo']:>14} {linha['mb']:>8.1f} {linha['consultas_s']:>12.1f} "
+              f"{linha['concordancia']:>13.4f} {linha['reverificados']:>18.2f}")
+
+
+if __name__ == "__main__":
+    _main()
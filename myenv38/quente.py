@@ -0,0 +1,175 @@
+# ==================== CONJUNTO QUENTE (RECONHECIDOS RECENTEMENTE) ====================
+# Num local, quem faz check-in todo dia são as mesmas poucas centenas de pessoas,
+# dentro de uma galeria bem maior. O MatcherQuente guarda os encodings das
+# últimas 'capacidade' pessoas reconhecidas e compara cada rosto primeiro com elas
+# (uma conta de centenas de linhas em vez de toda a galeria).
+#
+# O resultado do conjunto quente só é aceito quando a distância fica claramente
+# dentro da tolerância (<= tolerância - margem, 0.3 no padrão) e o segundo mais
+# próximo do conjunto quente está pelo menos 'folga' mais longe. O conjunto
+# quente não vê o resto da galeria: alguém fora dele (Bia) pode ficar a 0.4 de
+# quem está nele (Ana), por isso o limite bem abaixo da tolerância. Qualquer
+# outro caso segue para a busca completa do matcher de baixo (exato, IVF ou
+# PQ), e cada reconhecimento da busca completa entra (ou volta para o topo) no
+# conjunto quente.
+#
+# Cada item guarda a linha da galeria onde a pessoa estava. Antes de aceitar, a
+# linha é conferida no snapshot atual (mesmo 'arquivo' na mesma linha): se um
+# usuário foi removido (as linhas andam) ou a galeria foi recarregada, o item é
+# descartado e a busca vai para a galeria inteira.
+#
+# Em galerias quantizadas (float16/int8/pq), os encodings do conjunto quente vêm
+# do banco ('fonte_exata'), não dos vetores aproximados do snapshot.
+#
+# Observação: 'top_k' e 'dentro_tolerancia' de um acerto no conjunto quente só
+# trazem o próprio match (como no IVF, que só vê as células visitadas).
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from galeria import DIMENSAO
+from matcher import ResultadoBusca, distancias_lote
+
+MARGEM_QUENTE = 0.3
+FOLGA_QUENTE = 0.1  # distância mínima entre o melhor e o segundo do conjunto quente
+
+
+class _Estado:
+    """Versão imutável do conjunto quente usada pelas buscas (trocada inteira a cada mudança)"""
+
+    __slots__ = ('matriz', 'normas2', 'itens')
+
+    def __init__(self, matriz, normas2, itens):
+        self.matriz = matriz    # k x 128 float32
+        self.normas2 = normas2  # ||x||² de cada linha
+        self.itens = itens      # tupla de (arquivo, linha na galeria, metadados)
+
+
+class MatcherQuente:
+    """Sonda um conjunto pequeno de pessoas reconhecidas recentemente antes da galeria inteira"""
+
+    def __init__(self, base, capacidade=512, margem=MARGEM_QUENTE, folga=FOLGA_QUENTE, fonte_exata=None):
+        self.base = base
+        self.fonte_exata = fonte_exata
+        self.tolerancia = base.tolerancia
+        self.capacidade = capacidade
+        self.margem = margem
+        self.folga = folga
+        self._recentes = OrderedDict()  # arquivo -> (linha na galeria, metadados, encoding)
+        self._lock = threading.Lock()
+        self._estado = _Estado(np.empty((0, DIMENSAO), np.float32), np.empty(0, np.float32), ())
+        self.consultas = 0
+        self.acertos = 0
+        self.invalidados = 0
+        self._tempo_quente = 0.0    # segundos gastos sondando o conjunto quente
+        self._tempo_completo = 0.0  # segundos gastos nas buscas completas
+        self._completas = 0
+
+    def buscar(self, snapshot, encoding):
+        return self.buscar_lote(snapshot, encoding)[0]
+
+    def buscar_lote(self, snapshot, encodings):
+        """Conjunto quente primeiro; os rostos que não foram aceitos vão juntos para o matcher de baixo"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, DIMENSAO)
+        inicio = time.perf_counter()
+        resultados = self._sondar(snapshot, encodings)
+        meio = time.perf_counter()
+
+        restantes = [i for i, r in enumerate(resultados) if r is None]
+        if restantes:
+            for i, resultado in zip(restantes, self.base.buscar_lote(snapshot, encodings[restantes])):
+                resultados[i] = resultado
+            self._lembrar(snapshot, [resultados[i] for i in restantes])
+        fim = time.perf_counter()
+
+        with self._lock:
+            self.consultas += len(encodings)
+            self.acertos += len(encodings) - len(restantes)
+            self._tempo_quente += meio - inicio
+            if restantes:
+                self._tempo_completo += fim - meio
+                self._completas += len(restantes)
+        return resultados
+
+    def _sondar(self, snapshot, encodings):
+        """ResultadoBusca para os rostos aceitos pelo conjunto quente, None para os demais"""
+        estado = self._estado
+        resultados = [None] * len(encodings)
+        if not estado.itens:
+            return resultados
+
+        dists = distancias_lote(estado.matriz, estado.normas2, encodings)
+        melhores = np.argmin(dists, axis=1)
+        # Segundo menor de cada linha (infinito com um item só)
+        segundos = np.partition(dists, 1, axis=1)[:, 1] if dists.shape[1] > 1 else np.full(len(dists), np.inf)
+        limite = self.tolerancia - self.margem
+        for q, j in enumerate(melhores.tolist()):
+            distancia = float(dists[q, j])
+            if distancia > limite or segundos[q] - distancia < self.folga:
+                continue
+            arquivo, linha, metadados = estado.itens[j]
+            if linha >= len(snapshot):
+                continue
+            if snapshot.metadados[linha]['arquivo'] != arquivo:
+                self._esquecer(arquivo)  # a galeria mudou embaixo deste item
+                continue
+            match = [(metadados, distancia)]
+            resultados[q] = ResultadoBusca(linha, distancia, metadados, True, match, match)
+        return resultados
+
+    def _lembrar(self, snapshot, resultados):
+        """Coloca no conjunto quente as pessoas que a busca completa reconheceu"""
+        novos = [(r.indice, r.metadados) for r in resultados if r.encontrado]
+        if not novos:
+            return
+        if snapshot.precisao != 'float32' and self.fonte_exata is not None:
+            vetores = np.asarray(self.fonte_exata([metadados['arquivo'] for _, metadados in novos]), dtype=np.float32)
+        else:
+            vetores = snapshot.vetores(np.array([linha for linha, _ in novos]))
+        with self._lock:
+            for (linha, metadados), vetor in zip(novos, vetores):
+                if not np.isfinite(vetor).all():
+                    continue  # removido do banco depois da busca
+                self._recentes[metadados['arquivo']] = (linha, metadados, np.array(vetor, dtype=np.float32))
+                self._recentes.move_to_end(metadados['arquivo'])
+            while len(self._recentes) > self.capacidade:
+                self._recentes.popitem(last=False)
+            self._publicar()
+
+    def _esquecer(self, arquivo):
+        with self._lock:
+            if self._recentes.pop(arquivo, None) is not None:
+                self.invalidados += 1
+                self._publicar()
+
+    def _publicar(self):
+        """Monta a matriz do conjunto quente (chamado sob o lock)"""
+        itens = tuple((arquivo, linha, metadados) for arquivo, (linha, metadados, _) in self._recentes.items())
+        if itens:
+            matriz = np.stack([vetor for _, _, vetor in self._recentes.values()])
+        else:
+            matriz = np.empty((0, DIMENSAO), np.float32)
+        self._estado = _Estado(matriz, np.einsum('ij,ij->i', matriz, matriz), itens)
+
+    def estatisticas(self):
+        """Taxa de acerto do conjunto quente e estimativa do tempo de busca economizado"""
+        with self._lock:
+            quente_ms = 1000 * self._tempo_quente / self.consultas if self.consultas else 0.0
+            completa_ms = 1000 * self._tempo_completo / self._completas if self._completas else 0.0
+            return {
+                "itens": len(self._recentes),
+                "capacidade": self.capacidade,
+                "limite_distancia": round(self.tolerancia - self.margem, 4),
+                "folga_segundo": self.folga,
+                "consultas": self.consultas,
+                "acertos": self.acertos,
+                "taxa_acerto": round(self.acertos / self.consultas, 4) if self.consultas else 0.0,
+                "invalidados": self.invalidados,
+                "sonda_ms": round(quente_ms, 4),
+                "busca_completa_ms": round(completa_ms, 4),
+                # Cada acerto evitou uma busca completa e custou só a sonda
+                "economizado_ms": round(self.acertos * max(completa_ms - quente_ms, 0.0), 1),
+            }
@@ -0,0 +1,221 @@
+# ==================== SERVIDOR DE PRODUÇÃO (PREFORK) ====================
+# app.run(debug=True) é o servidor de desenvolvimento: um processo só, e o
+# reloader sobe uma segunda cópia do app (que carrega todos os modelos de novo).
+#
+# Aqui o processo pai importa o app (banco, galeria, matcher), carrega os
+# modelos do dlib e abre a porta UMA vez; depois faz fork de SERVIDOR_WORKERS
+# processos que atendem na mesma porta. Modelos e galeria ficam nas páginas de
+# memória herdadas (copy-on-write): N workers não custam N cópias dos modelos.
+# Cada worker atende até SERVIDOR_THREADS requisições ao mesmo tempo.
+#
+# Uso:   python servidor.py
+# Sinais para o processo pai:
+#   SIGTERM / Ctrl+C  -> encerra: os workers param de aceitar conexões, terminam
+#                        as requisições em andamento e gravam as fotos da fila
+#   SIGHUP            -> reload sem derrubar o serviço: o pai sincroniza a galeria,
+#                        sobe uma geração nova de workers e encerra a antiga
+# Workers que morrem são substituídos. Sem fork (Windows), roda em um processo só.
+#
+# INFERENCIA_PROCESSOS é sempre 0 aqui: a detecção e o encoding rodam na thread
+# do worker, com os modelos herdados do pai (um pool por worker multiplicaria os
+# modelos na memória). Com isso o servidor.py não tem o que o pool de processos
+# dá ao main.py (inferencia.py): não há isolamento de processo, não há 504 por
+# INFERENCIA_TIMEOUT, e o 503 por fila cheia praticamente não acontece, porque
+# cada worker atende no máximo SERVIDOR_THREADS requisições. O limite de carga
+# passa a ser SERVIDOR_WORKERS x SERVIDOR_THREADS; o resto espera no backlog do
+# socket. Um valor diferente de 0 no ambiente é substituído com um aviso.
+
+import os
+import sys
+
+SERVIDOR_HOST = os.environ.get("SERVIDOR_HOST", "0.0.0.0")
+SERVIDOR_PORTA = int(os.environ.get("SERVIDOR_PORTA", "5000"))
+SERVIDOR_WORKERS = int(os.environ.get("SERVIDOR_WORKERS", str(os.cpu_count() or 1)))
+SERVIDOR_THREADS = int(os.environ.get("SERVIDOR_THREADS", "4"))
+# Tempo (s) que um worker tem para terminar as requisições ao ser encerrado
+SERVIDOR_TIMEOUT_ENCERRAR = float(os.environ.get("SERVIDOR_TIMEOUT_ENCERRAR", "30"))
+# Threads do BLAS (NumPy) por worker. Com vários workers, o padrão do OpenBLAS/MKL
+# (uma thread por núcleo em cada processo) só gera disputa entre eles.
+SERVIDOR_BLAS_THREADS = os.environ.get("SERVIDOR_BLAS_THREADS", "1")
+
+# Precisa acontecer antes de qualquer import do NumPy (o BLAS lê na carga)
+for _variavel in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                  "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"):
+    os.environ.setdefault(_variavel, SERVIDOR_BLAS_THREADS)
+
+# Os modelos ficam no processo pai e são herdados pelos workers; um pool de
+# processos de inferência por worker multiplicaria os modelos na memória.
+if os.environ.get("INFERENCIA_PROCESSOS", "0") != "0":
+    print(f"⚠️  INFERENCIA_PROCESSOS={os.environ['INFERENCIA_PROCESSOS']} substituído por 0: no servidor.py "
+          "a inferência roda nas threads dos workers, sem isolamento de processo e sem os 503/504 do pool "
+          "(o limite é SERVIDOR_WORKERS x SERVIDOR_THREADS requisições)")
+os.environ["INFERENCIA_PROCESSOS"] = "0"
+
+import gc
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+import main
+from deteccao import carregar_modelos
+
+
+class ServidorWSGI(BaseWSGIServer):
+    """Servidor WSGI do werkzeug com um número fixo de threads por processo"""
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, host, porta, app, threads=4):
+        super().__init__(host, porta, app)
+        self.threads = threads
+        # Com vários workers no mesmo socket, só um ganha cada accept(); nos outros
+        # o accept() não pode bloquear (senão o worker fica preso e não encerra)
+        self.socket.setblocking(False)
+        self._vagas = None
+        self._executor = None
+
+    def iniciar_threads(self):
+        """Cria as threads de atendimento (no worker, depois do fork)"""
+        self._vagas = threading.BoundedSemaphore(self.threads)
+        self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix="http")
+
+    def get_request(self):
+        conexao, endereco = super().get_request()
+        conexao.setblocking(True)
+        return conexao, endereco
+
+    def process_request(self, request, client_address):
+        # Com todas as threads ocupadas, para de aceitar: a conexão fica para outro worker
+        self._vagas.acquire()
+        self._executor.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._vagas.release()
+
+    def atender(self):
+        """Atende até shutdown() e espera as requisições em andamento"""
+        self.iniciar_threads()
+        self.serve_forever()
+        self._executor.shutdown(wait=True)
+
+
+# ==================== WORKERS ====================
+
+def _executar_worker(servidor):
+    """Corpo do processo filho; nunca retorna"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # o Ctrl+C é tratado pelo pai
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # shutdown() espera o loop do serve_forever, que roda nesta thread: chama de outra
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=servidor.shutdown, daemon=True).start())
+    codigo = 0
+    try:
+        servidor.atender()
+    except Exception as e:
+        print(f"❌ Worker {os.getpid()}: {e}")
+        codigo = 1
+    # sys.exit (e não os._exit) para o atexit gravar as fotos que ainda estão na fila
+    sys.exit(codigo)
+
+
+def _iniciar_worker(servidor):
+    pid = os.fork()
+    if pid == 0:
+        _executar_worker(servidor)
+    return pid
+
+
+def _preparar_fork():
+    """Sincroniza a galeria e congela o heap antes de criar workers"""
+    if hasattr(main.storage, 'sincronizar'):
+        main.storage.sincronizar()
+    # Objetos que existem agora vão para uma geração permanente: o coletor de lixo
+    # dos workers não passa por eles e não suja (copia) as páginas herdadas
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def _encerrar_workers(pids, timeout):
+    """SIGTERM para os workers e, passado o timeout, SIGKILL nos que sobrarem"""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    limite = time.monotonic() + timeout
+    restantes = set(pids)
+    while restantes and time.monotonic() < limite:
+        for pid in list(restantes):
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                restantes.discard(pid)
+        time.sleep(0.05)
+    for pid in restantes:
+        print(f"⚠️  Worker {pid} não terminou em {timeout:.0f}s; forçando")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def supervisionar(servidor, workers):
+    """Loop do processo pai: mantém 'workers' processos vivos e trata os sinais"""
+    pedidos = []
+    signal.signal(signal.SIGTERM, lambda *_: pedidos.append('encerrar'))
+    signal.signal(signal.SIGINT, lambda *_: pedidos.append('encerrar'))
+    signal.signal(signal.SIGHUP, lambda *_: pedidos.append('recarregar'))
+
+    _preparar_fork()
+    ativos = {_iniciar_worker(servidor) for _ in range(workers)}
+    print(f"✓ Servidor em http://{SERVIDOR_HOST}:{servidor.port} — {workers} worker(s) x "
+          f"{servidor.threads} thread(s), BLAS com {os.environ['OMP_NUM_THREADS']} thread(s) (pai {os.getpid()})")
+
+    while True:
+        while pedidos:
+            pedido = pedidos.pop(0)
+            if pedido == 'encerrar':
+                print("Encerrando os workers...")
+                _encerrar_workers(ativos, SERVIDOR_TIMEOUT_ENCERRAR)
+                servidor.server_close()
+                return
+            # Recarga: a geração nova já atende antes de a antiga sair
+            antigos = ativos
+            _preparar_fork()
+            ativos = {_iniciar_worker(servidor) for _ in range(workers)}
+            _encerrar_workers(antigos, SERVIDOR_TIMEOUT_ENCERRAR)
+            print(f"✓ Workers recarregados ({len(ativos)})")
+
+        # Recolhe workers que morreram sozinhos e sobe substitutos
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in ativos:
+            ativos.discard(pid)
+            print(f"⚠️  Worker {pid} terminou (status {status}); iniciando outro")
+            ativos.add(_iniciar_worker(servidor))
+        elif not pid:
+            time.sleep(0.2)
+
+
+# ==================== EXECUÇÃO ====================
+
+if __name__ == "__main__":
+    print("Carregando os modelos antes de criar os workers...")
+    carregar_modelos()
+    while not main.pool.pronto:  # o aquecimento (thread) não pode estar rodando no fork
+        time.sleep(0.05)
+
+    servidor = ServidorWSGI(SERVIDOR_HOST, SERVIDOR_PORTA, main.app, threads=SERVIDOR_THREADS)
+    if not hasattr(os, 'fork') or SERVIDOR_WORKERS <= 0:
+        print(f"✓ Servidor em http://{SERVIDOR_HOST}:{servidor.port} (um processo, {SERVIDOR_THREADS} threads)")
+        servidor.socket.setblocking(True)
+        servidor.atender()
+    else:
+        supervisionar(servidor, SERVIDOR_WORKERS)
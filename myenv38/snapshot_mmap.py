@@ -0,0 +1,194 @@
+# ==================== SNAPSHOT DA GALERIA EM ARQUIVO (MMAP) ====================
+# Com vários processos servindo o app, cada um guardaria sua própria cópia de
+# todos os encodings. Aqui a galeria é publicada em um arquivo versionado que
+# todos os processos abrem com np.memmap: as páginas ficam no page cache do
+# sistema operacional, são compartilhadas e só são lidas quando usadas.
+#
+# Formato de 'galeria-<versao>.snap' (little-endian):
+#   cabeçalho (64 bytes): magic, versao, n, dimensao, offsets/tamanhos das seções
+#   matriz    float32 N x 128    (offset 64, alinhado)
+#   normas2   float32 N          (||x||² de cada linha)
+#   ids       int64   N          (id da linha no faces.db)
+#   metadados JSON               (lista de {'nome', 'data_cadastro', 'arquivo'})
+#
+# O arquivo 'galeria.atual' contém o nome do snapshot vigente. Publicar é
+# escrever um snapshot novo e trocar esse ponteiro com os.replace (atômico).
+# Snapshots antigos não são sobrescritos, então quem ainda os tem mapeados
+# continua lendo dados consistentes.
+
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+from galeria import DIMENSAO, SnapshotGaleria
+
+MAGIC = b'PFGAL001'
+_CABECALHO = struct.Struct('<8sQQIIQQQQ')  # magic, versao, n, dim, reservado, off_normas, off_ids, off_meta, len_meta
+TAMANHO_CABECALHO = 64
+PONTEIRO = "galeria.atual"
+
+
+def _alinhar(offset, alinhamento=64):
+    return (offset + alinhamento - 1) // alinhamento * alinhamento
+
+
+def escrever_snapshot(caminho, versao, matriz, ids, metadados):
+    """Grava um snapshot completo em 'caminho' (com fsync)"""
+    matriz = np.ascontiguousarray(matriz, dtype=np.float32).reshape(-1, DIMENSAO)
+    n = len(matriz)
+    normas2 = np.einsum('ij,ij->i', matriz, matriz).astype(np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    meta = json.dumps(list(metadados), ensure_ascii=False).encode('utf-8')
+
+    off_matriz = TAMANHO_CABECALHO
+    off_normas = _alinhar(off_matriz + matriz.nbytes)
+    off_ids = _alinhar(off_normas + normas2.nbytes)
+    off_meta = _alinhar(off_ids + ids.nbytes)
+
+    with open(caminho, 'wb') as f:
+        f.write(_CABECALHO.pack(MAGIC, versao, n, DIMENSAO, 0, off_normas, off_ids, off_meta, len(meta)))
+        for offset, dados in ((off_matriz, matriz), (off_normas, normas2), (off_ids, ids)):
+            f.seek(offset)
+            f.write(dados.tobytes())
+        f.seek(off_meta)
+        f.write(meta)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def abrir_snapshot(caminho):
+    """Abre um snapshot com np.memmap e retorna (SnapshotGaleria, ids)"""
+    with open(caminho, 'rb') as f:
+        magic, versao, n, dim, _, off_normas, off_ids, off_meta, len_meta = \
+            _CABECALHO.unpack(f.read(_CABECALHO.size))
+        if magic != MAGIC or dim != DIMENSAO:
+            raise ValueError(f"Snapshot inválido: {caminho}")
+        f.seek(off_meta)
+        metadados = tuple(json.loads(f.read(len_meta).decode('utf-8')))
+
+    if n == 0:
+        matriz = np.empty((0, DIMENSAO), dtype=np.float32)
+        normas2 = np.empty(0, dtype=np.float32)
+        ids = np.empty(0, dtype=np.int64)
+    else:
+        matriz = np.memmap(caminho, dtype=np.float32, mode='r', offset=TAMANHO_CABECALHO, shape=(n, DIMENSAO))
+        normas2 = np.memmap(caminho, dtype=np.float32, mode='r', offset=off_normas, shape=(n,))
+        ids = np.memmap(caminho, dtype=np.int64, mode='r', offset=off_ids, shape=(n,))
+    return SnapshotGaleria(versao, matriz, normas2, metadados), ids
+
+
+class GaleriaMapeada:
+    """
+    Galeria compartilhada entre processos através de um snapshot mapeado em memória.
+
+    Tem a mesma interface da GaleriaMemoria (snapshot/adicionar/remover). Cada
+    chamada a snapshot() confere (com um stat) se outro processo publicou uma
+    versão nova e, se sim, remapeia o arquivo; não é preciso reiniciar o worker.
+    Cadastro/remoção republicam o snapshot a partir do faces.db, dentro de uma
+    transação de escrita que serializa os publicadores entre processos.
+    """
+
+    def __init__(self, banco, diretorio):
+        self.banco = banco
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self._ponteiro = os.path.join(diretorio, PONTEIRO)
+        self._lock = threading.Lock()
+        self._assinatura = None
+        self._snapshot = None
+        self._ids = None
+
+        self._recarregar_se_mudou()
+        if self._snapshot is None or self._desatualizado():
+            self.publicar()
+            self._recarregar_se_mudou()
+
+    # ---------- leitura ----------
+
+    def snapshot(self):
+        """Retorna a visão atual, remapeando se outro processo publicou uma versão nova"""
+        self._recarregar_se_mudou()
+        return self._snapshot
+
+    def _recarregar_se_mudou(self, tentativas=5):
+        for _ in range(tentativas):
+            try:
+                st = os.stat(self._ponteiro)
+            except FileNotFoundError:
+                return
+            assinatura = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if assinatura == self._assinatura:
+                return
+            with self._lock:
+                if assinatura == self._assinatura:
+                    return
+                try:
+                    with open(self._ponteiro, 'r', encoding='utf-8') as f:
+                        nome = f.read().strip()
+                    self._snapshot, self._ids = abrir_snapshot(os.path.join(self.diretorio, nome))
+                except FileNotFoundError:
+                    # Outro processo publicou de novo e apagou este snapshot (_limpar_antigos)
+                    # entre a leitura do ponteiro e a abertura: relê o ponteiro
+                    continue
+                self._assinatura = assinatura
+                return
+        if self._snapshot is None:
+            raise FileNotFoundError(f"Nenhum snapshot da galeria disponível em {self.diretorio}")
+        print("⚠️  Snapshot da galeria trocado durante a leitura; mantendo a versão anterior")
+
+    def _desatualizado(self):
+        """Confere se o banco mudou com o servidor parado (quantidade e maior id)"""
+        maior_id = int(self._ids[-1]) if len(self._ids) else 0
+        return self.banco.resumo() != (len(self._snapshot), maior_id)
+
+    def _versao_publicada(self):
+        try:
+            with open(self._ponteiro, 'r', encoding='utf-8') as f:
+                nome = f.read().strip()
+        except FileNotFoundError:
+            return 0
+        return int(nome[len("galeria-"):-len(".snap")])
+
+    # ---------- escrita ----------
+
+    def publicar(self):
+        """Gera um snapshot novo a partir do banco e troca o ponteiro atomicamente"""
+        with self.banco.lock_escrita():
+            versao = self._versao_publicada() + 1
+            matriz, metadados, ids = self.banco.carregar_galeria(com_ids=True)
+
+            nome = f"galeria-{versao:012d}.snap"
+            escrever_snapshot(os.path.join(self.diretorio, nome), versao, matriz, ids, metadados)
+
+            temporario = self._ponteiro + ".tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                f.write(nome)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, self._ponteiro)
+
+        self._limpar_antigos(versao)
+        print(f"✓ Snapshot da galeria publicado: {nome} ({len(metadados)} usuários)")
+        return versao
+
+    def _limpar_antigos(self, versao_atual):
+        """Apaga snapshots antigos (mantém o anterior para quem ainda está trocando)"""
+        for nome in os.listdir(self.diretorio):
+            if nome.startswith("galeria-") and nome.endswith(".snap"):
+                if int(nome[len("galeria-"):-len(".snap")]) < versao_atual - 1:
+                    try:
+                        os.remove(os.path.join(self.diretorio, nome))
+                    except OSError:
+                        pass  # no Windows, um arquivo mapeado não pode ser apagado; fica para a próxima
+
+    def adicionar(self, usuario):
+        """O usuário já está no banco; só republica o snapshot"""
+        self.publicar()
+
+    def remover(self, arquivo):
+        """O usuário já saiu do banco; só republica o snapshot"""
+        self.publicar()
+        return True